@@ -5,12 +5,103 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+部署 (Render Start Command)，讓 /api/quotes、/api/simulate/<代碼> 等 async view
+在等待報價時不佔用 worker：
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker --workers 2
+
+原本的 `gunicorn config.wsgi` 仍可使用 (async view 會在每個請求內各自跑事件迴圈，
+報價改以同步 Session 在執行緒中抓取，不建立 httpx.AsyncClient)。
 """
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# settings 依此把同步的 WhiteNoise middleware 移出 Django 的 middleware 鏈，改由下方 StaticFiles 在外層提供靜態檔
+os.environ.setdefault("DJANGO_ASGI", "1")
+
+django_application = get_asgi_application()
+
+from whitenoise.middleware import WhiteNoiseMiddleware  # noqa: E402  (需在 Django setup 之後)
+
+from stock_app.pricing import aclose_price_clients  # noqa: E402
+
+BLOCK_SIZE = 64 * 1024
+
+
+class StaticFiles:
+    """
+    包在 Django ASGI app 外層的 WhiteNoise：沿用 WhiteNoiseMiddleware 的設定與檔案表
+    (STATIC_ROOT、壓縮檔 .gz/.br、Cache-Control、ETag / Range)，直接以 ASGI 回應，
+    不進 Django middleware 鏈；檔案以 thread 分段讀取，不會整份載入記憶體。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def find(self, path):
+        if self.whitenoise.autorefresh:
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            static_file = self.find(scope['path'])
+            if static_file is not None:
+                return await self.serve(static_file, scope, send)
+        return await self.app(scope, receive, send)
+
+    @staticmethod
+    def _meta(scope):
+        """WhiteNoise 依 WSGI environ 判斷 If-None-Match / Accept-Encoding / Range。"""
+        meta = {'REQUEST_METHOD': scope['method']}
+        for name, value in scope['headers']:
+            meta['HTTP_' + name.decode('latin1').upper().replace('-', '_')] = value.decode('latin1')
+        return meta
+
+    async def serve(self, static_file, scope, send):
+        response = await sync_to_async(static_file.get_response, thread_sensitive=False)(
+            scope['method'], self._meta(scope))
+        await send({
+            'type': 'http.response.start',
+            'status': int(response.status),
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in response.headers],
+        })
+        if response.file is None:
+            return await send({'type': 'http.response.body', 'body': b''})
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(BLOCK_SIZE)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
+        finally:
+            response.file.close()
+
+
+class Lifespan:
+    """處理 ASGI lifespan (Django 4.2 本身不支援)：關閉時釋放報價來源的 httpx 連線池。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await aclose_price_clients()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
 
-application = get_asgi_application()
+application = Lifespan(StaticFiles(django_application))
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'stock_app.metrics.MetricsMiddleware',  # 請求耗時 / SQL 查詢數 (/metrics)
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Render 部署需要這行
     'django.contrib.sessions.middleware.SessionMiddleware',  # [必要] 修正 admin.E408 的依賴
@@ -53,6 +54,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# ASGI (config/asgi.py 會設定 DJANGO_ASGI=1)：WhiteNoise 6.x 為同步 middleware，
+# 留在鏈中會讓 async view 退回執行緒排隊；改由 asgi.py 在 Django 外層以同一份 WhiteNoise 設定提供靜態檔
+if os.environ.get('DJANGO_ASGI') == '1':
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 
 ROOT_URLCONF = "config.urls"
 
@@ -92,6 +98,62 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# 上傳檔案 (匯入工作的暫存檔)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# 匯入工作設定
+# thread: 由 web 行程內的 thread pool 處理；worker: 交給 `manage.py run_import_worker`
+IMPORT_JOB_BACKEND = os.environ.get('IMPORT_JOB_BACKEND', 'thread')
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1))
+# 排隊或執行中超過此秒數沒有進度，視為執行的行程已重啟 (見 stock_app.jobs.reap_stale_job)
+IMPORT_JOB_STALE_AFTER = int(os.environ.get('IMPORT_JOB_STALE_AFTER', 300))
+
+# 快取：dashboard 為儀表板資料快取 (LocMem 依最近使用順序淘汰)
+# 多個 gunicorn worker 時可設定 DASHBOARD_CACHE_DIR 改用檔案快取，讓各行程共用並一起失效
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
+    },
+}
+if os.environ.get('DASHBOARD_CACHE_DIR'):
+    CACHES['dashboard'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['DASHBOARD_CACHE_DIR'],
+    })
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+DASHBOARD_CACHE_WARM = os.environ.get('DASHBOARD_CACHE_WARM', '') == '1'  # 匯入後預先計算儀表板
+
+# 即時股價 (stock_app.pricing)
+PRICE_URL_TEMPLATE = os.environ.get('PRICE_URL_TEMPLATE', 'https://stock.wearn.com/a{stock_id}.html')
+PRICE_CACHE_TTL = int(os.environ.get('PRICE_CACHE_TTL', 60))    # 秒
+PRICE_CACHE_SIZE = int(os.environ.get('PRICE_CACHE_SIZE', 512))  # 最多快取幾檔 (LRU)
+PRICE_TIMEOUT = float(os.environ.get('PRICE_TIMEOUT', 5))
+PRICE_HOST_CONCURRENCY = int(os.environ.get('PRICE_HOST_CONCURRENCY', 8))  # 對同一主機的同時連線數
+PRICE_BATCH_WORKERS = int(os.environ.get('PRICE_BATCH_WORKERS', 16))
+PRICE_BATCH_MAX_IDS = 200
+PRICE_PROVIDER = os.environ.get('PRICE_PROVIDER', 'wearn')  # wearn / snapshot / fixture
+PRICE_SNAPSHOT_PATH = os.environ.get('PRICE_SNAPSHOT_PATH', '')  # 每日收盤價檔 (CSV / JSON)
+# 以 httpx.AsyncClient 抓取 (ASGI 下共用長駐事件迴圈的連線池)；WSGI 下改用同步 Session
+PRICE_ASYNC_CLIENT = os.environ.get('PRICE_ASYNC_CLIENT', os.environ.get('DJANGO_ASGI', '0')) == '1'
+PRICE_PERSIST = os.environ.get('PRICE_PERSIST', '1') == '1'  # 抓到的價格寫入 PriceQuote
+PRICE_BREAKER_THRESHOLD = int(os.environ.get('PRICE_BREAKER_THRESHOLD', 3))  # 連續失敗幾次後暫停抓取
+PRICE_BREAKER_COOLDOWN = float(os.environ.get('PRICE_BREAKER_COOLDOWN', 30))  # 暫停秒數 (期間直接用最後收盤價)
+
+# 自選清單 (stock_app.watchlists)
+WATCHLIST_REFRESH_ON_IMPORT = os.environ.get('WATCHLIST_REFRESH_ON_IMPORT', '1') == '1'  # 匯入後重算相關清單的估值
+
+# 效能指標 (stock_app.metrics)
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '') == '1'  # 回應加上 Server-Timing 標頭
+METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', 1024))  # 滾動百分位數的樣本數
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # 設定後 /metrics 需帶 token
+
 # 安全性設定 (部署時自動讀取環境變數)
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-local-key')
 DEBUG = 'RENDER' not in os.environ # 如果在 Render 上，Debug 會自動變 False
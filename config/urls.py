@@ -21,4 +21,20 @@ from stock_app import views
 urlpatterns = [
     path('admin/', admin.site.urls), # 如果你需要後台，這行要留著
     path('', views.home, name='home'),
+    path('imports/<int:job_id>/', views.import_progress, name='import_progress'),
+    path('stock/<str:stock_id>/trend/', views.stock_trend, name='stock_trend'),
+    path('screener/', views.screener, name='screener'),
+    path('revisions/', views.revisions_ranking, name='revisions_ranking'),
+    path('watchlists/', views.watchlists, name='watchlists'),
+    path('watchlists/<int:watchlist_id>/', views.watchlist_detail, name='watchlist_detail'),
+    path('stock/<str:stock_id>/<int:year>/<int:month>/<str:section>/', views.section_fragment, name='section_fragment'),
+    path('api/quotes', views.quotes_api, name='quotes_api'),
+    path('api/stocks', views.stocks_api, name='stocks_api'),
+    path('api/simulate', views.simulate_api, name='simulate_api'),
+    path('api/simulate/<str:stock_id>', views.stock_simulate_api, name='stock_simulate_api'),
+    path('api/sensitivity', views.sensitivity_api, name='sensitivity_api'),
+    path('api/screener', views.screener_api, name='screener_api'),
+    path('api/export.<str:fmt>', views.export_view, name='export'),
+    path('api/series', views.series_api, name='series_api'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
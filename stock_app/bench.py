@@ -0,0 +1,213 @@
+import io
+import json
+import math
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import pricing
+from .catalog import invalidate_catalogue
+from .engine import load_universe, simulate
+from .fixture_server import QuoteFixtureServer
+from .importer import import_stock_json
+from .models import StockData
+from .sections import find_row, get_summary
+from .views import get_dashboard_data
+
+# =========================================================
+# 效能基準測試：產生模擬上傳檔，量測匯入、查詢數與各路徑延遲
+# =========================================================
+SIX_FACTORS = ['獲利能力', '成長能力', '經營能力', '償債能力', '現金流量', '股利政策']
+RATINGS = ['AA', 'A', 'B', 'C', 'D']
+
+
+def make_stock_payload(sid, year, month, rng):
+    """產生一檔與實際上傳檔同結構的 Meta / PER_Analysis / Six_Indicators。"""
+    rev = round(rng.uniform(5, 2000), 2)
+    yoy = rng.uniform(-30, 60)
+    net = rng.uniform(-5, 40)
+    capital = round(rng.uniform(3, 2600), 2)
+    pe_h = round(rng.uniform(10, 35), 2)
+    pe_l = round(pe_h * rng.uniform(0.4, 0.8), 2)
+    eps = round(rev * net / 100 / capital * 10, 2)
+    price = round(max(eps, 0.5) * rng.uniform(6, 30), 2)
+    eps_hist = [round(eps * rng.uniform(0.5, 1.2), 2) for _ in range(5)]
+    highs = [round(price * rng.uniform(0.8, 1.6), 2) for _ in range(5)]
+    lows = [round(h * rng.uniform(0.5, 0.8), 2) for h in highs]
+    return {
+        'Meta': {
+            'StockID': sid, 'StockName': f'測試{sid}',
+            'QueryDate': f'{year}-{month:02d}-15', 'TargetMonth': month,
+        },
+        'PER_Analysis': {
+            'Name': f'測試{sid}', 'Now_Price': price,
+            'Predict_Rev': rev, 'Predict_EPS': eps,
+            'YoY_Use': f'{yoy:.2f}%', 'Net_Avg': f'{net:.2f}%', 'Capital': capital,
+            'PE_Use_H': pe_h, 'PE_Use_L': pe_l,
+            'Target_H': round(eps * pe_h, 2), 'Target_L': round(eps * pe_l, 2),
+            'Profit': f'{(eps * pe_h - price) / price * 100:.2f}%',
+            'Total_EPS_Est': eps, 'Q4_EPS_Est': round(eps / 4, 2),
+            'Current_Year': year, 'Current_Year_ROC': year - 1911, 'EPS1_Is_Est': False,
+            'H': highs, 'L': lows, 'EPS': eps_hist,
+            'PE_H': [round(h / max(e, 0.01), 2) for h, e in zip(highs, eps_hist)],
+            'PE_L': [round(l / max(e, 0.01), 2) for l, e in zip(lows, eps_hist)],
+            'Rev_Names': [f'{year}/{m:02d}' for m in range(1, 13)],
+            'Rev_Vals': [f'{rev / 12 * rng.uniform(0.8, 1.2):,.2f}' for _ in range(12)],
+            'YoY_Names': [f'{year}/{m:02d}' for m in range(1, 13)],
+            'YoY_Vals': [f'{rng.uniform(-30, 60):.2f}%' for _ in range(12)],
+            'Net_Names': [f'{year - 1}Q{q}' for q in range(1, 5)] * 2,
+            'Net_Vals': [f'{rng.uniform(-5, 40):.2f}%' for _ in range(8)],
+            'EPS_Q1': round(eps / 4, 2), 'EPS_Q2': round(eps / 4, 2), 'EPS_Q3': round(eps / 4, 2),
+            'Q4_Rev_Actual': round(rev / 4, 2),
+            'Detect_Reason': '模擬資料', 'Latest_Quarter_Str': f'{year - 1}Q3',
+        },
+        'Six_Indicators': dict(
+            {'Name': f'測試{sid}', 'Average': round(rng.uniform(30, 95), 1)},
+            **{
+                f: {'Rating': rng.choice(RATINGS), 'Data': [
+                    {'Name': f'{f}{k}', 'Val': f'{rng.uniform(0, 100):.2f}'} for k in range(5)
+                ]}
+                for f in SIX_FACTORS
+            }
+        ),
+    }
+
+
+def make_upload(n_tickers, year, month, seed=0):
+    rng = random.Random(seed * 1000 + month)
+    data = {}
+    for i in range(n_tickers):
+        sid = str(1101 + i)
+        data[sid] = make_stock_payload(sid, year, month, rng)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    p95 = samples[max(math.ceil(len(samples) * 0.95) - 1, 0)]
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+    }
+
+
+def _measure(fn, repeat):
+    """回傳 (最後一次結果, 延遲統計)；統計內含最後一次的 SQL 查詢數。"""
+    samples = []
+    result = None
+    n_queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - started)
+        n_queries = len(ctx.captured_queries)
+    stats = _summary(samples)
+    stats['queries'] = n_queries
+    return result, stats
+
+
+def _clear_caches():
+    for alias in ('default', 'dashboard'):
+        try:
+            caches[alias].clear()
+        except Exception:
+            pass
+    invalidate_catalogue()
+
+
+def run_size(n_tickers, n_months, year=2026, repeat=20, log=print):
+    StockData.objects.all().delete()
+    _clear_caches()
+    result = {'tickers': n_tickers, 'months': n_months}
+
+    # 1. 匯入 (每月一個檔案)
+    imports = []
+    for k in range(n_months):
+        month = 12 - n_months + 1 + k
+        payload = make_upload(n_tickers, year, month, seed=n_tickers)
+        with CaptureQueriesContext(connection) as ctx:
+            stats = import_stock_json(io.BytesIO(payload))
+        imports.append({
+            'month': month, 'bytes': len(payload), 'rows': stats['rows'],
+            'seconds': round(stats['elapsed'], 4), 'rows_per_sec': round(stats['rows_per_sec'], 1),
+            'queries': len(ctx.captured_queries),
+        })
+        log(f"  匯入 {year}/{month}: {stats['rows']} 筆 {stats['elapsed']:.2f}s")
+    result['import'] = imports
+
+    last_month = 12
+    rng = random.Random(n_tickers)
+    sample_ids = [str(1101 + rng.randrange(n_tickers)) for _ in range(repeat)]
+    ids = iter(sample_ids * 3)
+
+    # 2. get_dashboard_data (完整 raw_data) 與投影/快取版本
+    objs = list(StockData.objects.filter(stock_id__in=sample_ids, data_year=year, data_month=last_month))
+    _, result['get_dashboard_data'] = _measure(lambda: get_dashboard_data(objs[rng.randrange(len(objs))]), repeat)
+
+    def summary_cold():
+        _clear_caches()
+        row = find_row(StockData.objects.filter(stock_id=next(ids), data_year=year, data_month=last_month))
+        return get_summary(row)
+    _, result['summary_cold'] = _measure(summary_cold, repeat)
+
+    row = find_row(StockData.objects.filter(stock_id=sample_ids[0], data_year=year, data_month=last_month))
+    get_summary(row)
+    _, result['summary_warm'] = _measure(lambda: get_summary(row), repeat)
+
+    # 3. 整頁請求 (查詢數 + 延遲)
+    client = Client()
+    sid = sample_ids[0]
+    form = {'stock_id': sid, 'year': year, 'month': last_month}
+    _clear_caches()
+    _, result['home_search_cold'] = _measure(lambda: client.post('/', form), 1)
+    _, result['home_search_warm'] = _measure(lambda: client.post('/', form), repeat)
+    _, result['section_fragment'] = _measure(lambda: client.get(f'/stock/{sid}/{year}/{last_month}/six/'), repeat)
+    _, result['stocks_api'] = _measure(lambda: client.get('/api/stocks', {'q': sid[:2]}), repeat)
+
+    # 4. 模擬試算：即時價改由本機測試伺服器提供
+    prices = {s: 100.0 for s in set(sample_ids)}
+    original_service = pricing._service
+    with QuoteFixtureServer(prices, delay=0.0) as srv:
+        try:
+            pricing._service = pricing.PriceService(url_template=srv.url_template, ttl=0)
+            sim_form = dict(form, calc_simulation='1', sim_yoy='-5')
+            _, result['simulation_uncached_price'] = _measure(lambda: client.post('/', sim_form), repeat)
+            pricing._service = pricing.PriceService(url_template=srv.url_template, ttl=60)
+            _, result['simulation_cached_price'] = _measure(lambda: client.post('/', sim_form), repeat)
+            sens_form = dict(form, calc_sensitivity='1', sens_yoy='-10:10:1', sens_net='5:25:1', sens_pe='8:16:2')
+            _, result['sensitivity_21x21x5'] = _measure(lambda: client.post('/', sens_form), max(1, repeat // 4))
+        finally:
+            pricing._service = original_service
+
+    # 5. 全市場向量化模擬
+    _, result['load_universe'] = _measure(lambda: load_universe(year, last_month), max(1, repeat // 4))
+    universe = load_universe(year, last_month)
+    _, result['simulate_vectorized'] = _measure(lambda: simulate(universe, yoy=-0.05), repeat)
+    _, result['simulate_api'] = _measure(
+        lambda: client.get('/api/simulate', {'year': year, 'month': last_month, 'yoy': '-5', 'limit': 50}),
+        max(1, repeat // 4))
+
+    return result
+
+
+def environment_info():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+    }
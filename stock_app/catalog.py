@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.db.models import Q
+
+from .models import Stock
+
+# =========================================================
+# 股票目錄：行程內快取，匯入後失效
+# =========================================================
+CACHE_TTL = 300  # 秒；其他行程匯入時最多延遲這麼久才看到新股票
+
+_lock = threading.Lock()
+_cache = {'expires': 0.0, 'stocks': None}
+
+
+def get_catalogue():
+    """回傳 [{'id': 代碼, 'name': 名稱}, ...]，依代碼排序。"""
+    with _lock:
+        if _cache['stocks'] is not None and _cache['expires'] > time.monotonic():
+            return _cache['stocks']
+    stocks = [{'id': sid, 'name': name} for sid, name in Stock.objects.values_list('stock_id', 'stock_name')]
+    with _lock:
+        _cache['stocks'] = stocks
+        _cache['expires'] = time.monotonic() + CACHE_TTL
+    return stocks
+
+
+def invalidate_catalogue():
+    with _lock:
+        _cache['stocks'] = None
+
+
+def search_stocks(query, limit=20):
+    """代碼或名稱前綴搜尋 (走 stock_id / stock_name 索引)。"""
+    qs = Stock.objects.all()
+    query = (query or '').strip()
+    if query:
+        qs = qs.filter(Q(stock_id__startswith=query) | Q(stock_name__startswith=query))
+    return [{'id': sid, 'name': name} for sid, name in qs.values_list('stock_id', 'stock_name')[:limit]]
+
+
+def update_catalogue(rows):
+    """
+    rows: {stock_id: (stock_name, year, month)}。
+    名稱以最新月份為準；匯入較舊月份時不會蓋掉較新的資料。
+    """
+    if not rows:
+        return
+    existing = {
+        s.stock_id: s for s in Stock.objects.filter(stock_id__in=list(rows))
+    }
+    objs = []
+    for sid, (name, year, month) in rows.items():
+        cur = existing.get(sid)
+        if cur is not None and (cur.latest_year, cur.latest_month) > (year, month):
+            continue
+        objs.append(Stock(stock_id=sid, stock_name=name, latest_year=year, latest_month=month))
+    Stock.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=['stock_id'],
+        update_fields=['stock_name', 'latest_year', 'latest_month'],
+    )
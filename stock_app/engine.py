@@ -0,0 +1,260 @@
+import numpy as np
+
+from .models import StockData
+
+# =========================================================
+# 模擬試算引擎
+#   simulate_stock : 單檔純量計算，保留逐步算式 (calc_details)
+#   load_universe  : 一次載入某年月全部股票的參數為 NumPy 陣列
+#   simulate       : 對整個陣列向量化計算
+#   sensitivity_grid : 單檔 YoY × 淨利率 × 本益比 格點
+# =========================================================
+
+# 引擎參數名稱 -> StockData 反正規化欄位
+COLUMN_FIELDS = {
+    'predict_rev': 'predict_rev',
+    'yoy': 'yoy_use',
+    'net': 'net_avg',
+    'capital': 'capital',
+    'pe_h': 'pe_use_h',
+    'pe_l': 'pe_use_l',
+}
+
+
+# ---------------------------------------------------------
+# 單檔計算 (含算式紀錄)
+# ---------------------------------------------------------
+def _base_params(num):
+    """num: StockData.normalized (已是浮點數)；缺值時股本為 1，其餘為 0。"""
+    capital = num.get('Capital', 1.0)
+    if not capital:
+        raise ValueError("股本為 0，無法試算")
+    return num.get('YoY_Use', 0.0), num.get('Net_Avg', 0.0), capital, num.get('Predict_Rev', 0.0)
+
+
+def simulate_stock(num, yoy=None, net=None, pe_h=None, pe_l=None, live_price=None, with_details=True):
+    """
+    num 為正規化後的數值 (StockData.normalized)，不再解析字串。
+    yoy / net 為小數 (0.05 = 5%)，None 表示沿用原始值；pe_h / pe_l 為 None 時沿用 PE_Use_H/L。
+    使用者輸入的 pe_h / pe_l 無法轉為數字或股本為 0 時拋出 ValueError。
+    """
+    # 1. 取得原始參數
+    orig_yoy, orig_net, capital, orig_rev_predict = _base_params(num)
+
+    calc_details = []  # 算式紀錄清單
+
+    # 2. 反推基期營收
+    if (1 + orig_yoy) != 0:
+        base_rev = orig_rev_predict / (1 + orig_yoy)
+    else:
+        base_rev = orig_rev_predict
+
+    if with_details:
+        calc_details.append({
+            "step": "1. 反推基期營收",
+            "formula": f"原始預估營收 {orig_rev_predict} ÷ (1 + 原始YoY {orig_yoy:.2%})",
+            "result": f"{base_rev:.2f} 億"
+        })
+
+    # 3. 使用者輸入 (未輸入則沿用原始值)
+    sim_yoy = orig_yoy if yoy is None else yoy
+    sim_net = orig_net if net is None else net
+    sim_pe_h = float(num.get('PE_Use_H', 0.0) if pe_h is None else pe_h)
+    sim_pe_l = float(num.get('PE_Use_L', 0.0) if pe_l is None else pe_l)
+
+    # 4. 連動計算
+    # A. 新營收
+    sim_rev = base_rev * (1 + sim_yoy)
+    # B. 新淨利
+    sim_net_income = sim_rev * sim_net
+    # C. 新EPS
+    sim_eps = round(sim_net_income / capital * 10, 2)
+    # D. 目標價
+    target_h = round(sim_eps * sim_pe_h, 2)
+    target_l = round(sim_eps * sim_pe_l, 2)
+
+    if with_details:
+        calc_details.append({
+            "step": "2. 計算模擬營收",
+            "formula": f"基期營收 {base_rev:.2f} × (1 + 設定YoY {sim_yoy:.2%})",
+            "result": f"{sim_rev:.2f} 億"
+        })
+        calc_details.append({
+            "step": "3. 計算模擬淨利",
+            "formula": f"模擬營收 {sim_rev:.2f} × 設定淨利率 {sim_net:.2%}",
+            "result": f"{sim_net_income:.2f} 億"
+        })
+        calc_details.append({
+            "step": "4. 計算模擬 EPS",
+            "formula": f"(模擬淨利 {sim_net_income:.2f} ÷ 股本 {capital}) × 10",
+            "result": f"{sim_eps} 元"
+        })
+        calc_details.append({
+            "step": "5. 計算目標價",
+            "formula": f"高: EPS {sim_eps} × PE {sim_pe_h} | 低: EPS {sim_eps} × PE {sim_pe_l}",
+            "result": f"高 {target_h} / 低 {target_l}"
+        })
+
+    # E. 報酬率
+    upside = 0; downside = 0; rr = 0
+    if live_price:
+        upside = (target_h - live_price) / live_price
+        downside = (target_l - live_price) / live_price
+        rr = abs(upside / downside) if downside != 0 else 0
+
+        if with_details:
+            calc_details.append({
+                "step": "6. 報酬與風險",
+                "formula": f"即時價 {live_price} vs 目標價 {target_h} / {target_l}",
+                "result": f"上 {upside*100:.2f}% / 下 {downside*100:.2f}%"
+            })
+
+    return {
+        'base_rev': base_rev,
+        'sim_yoy': sim_yoy, 'sim_net': sim_net,
+        'pe_h': sim_pe_h, 'pe_l': sim_pe_l,
+        'sim_rev': sim_rev, 'net_income': sim_net_income,
+        'eps': sim_eps, 'target_h': target_h, 'target_l': target_l,
+        'upside': upside, 'downside': downside, 'rr': rr,
+        'details': calc_details,
+    }
+
+
+# ---------------------------------------------------------
+# 全市場向量化計算
+# ---------------------------------------------------------
+def load_universe(year, month, stock_ids=None):
+    """從反正規化欄位一次讀出某年月全部股票的參數，轉為 NumPy 陣列 (不解析 raw_data)。"""
+    qs = StockData.objects.filter(data_year=year, data_month=month)
+    if stock_ids:
+        qs = qs.filter(stock_id__in=stock_ids)
+    rows = list(qs.order_by('stock_id').values_list('stock_id', 'stock_name', *COLUMN_FIELDS.values()))
+    return build_universe(rows)
+
+
+def build_universe(rows):
+    """rows: [(stock_id, stock_name, *COLUMN_FIELDS 欄位), ...]；匯出時逐批呼叫。"""
+    universe = {
+        'stock_id': np.array([r[0] for r in rows], dtype=object),
+        'stock_name': np.array([r[1] for r in rows], dtype=object),
+    }
+    # 缺值保留為 NaN，不代入預設值：該檔的試算結果跟著成為 NaN (輸出為 null)，與單檔試算拒絕計算一致
+    for i, name in enumerate(COLUMN_FIELDS, start=2):
+        universe[name] = np.array([np.nan if r[i] is None else r[i] for r in rows], dtype=float)
+    return universe
+
+
+def simulate(universe, yoy=None, net=None, pe_h=None, pe_l=None, prices=None):
+    """
+    與 simulate_stock 相同的公式，一次算完所有股票。
+    yoy / net / pe_h / pe_l 可為純量或與 universe 等長的陣列，None 表示沿用原始值；
+    prices 為即時價陣列 (缺值以 NaN 表示)，提供時一併計算上下檔空間與風險報酬比。
+    """
+    orig_yoy = universe['yoy']
+    orig_rev = universe['predict_rev']
+    capital = universe['capital']
+
+    growth = 1 + orig_yoy
+    safe_growth = np.where(growth != 0, growth, 1.0)
+    base_rev = np.where(growth != 0, orig_rev / safe_growth, orig_rev)
+
+    sim_yoy = orig_yoy if yoy is None else np.broadcast_to(np.asarray(yoy, dtype=float), orig_yoy.shape)
+    sim_net = universe['net'] if net is None else np.broadcast_to(np.asarray(net, dtype=float), orig_yoy.shape)
+    sim_pe_h = universe['pe_h'] if pe_h is None else np.broadcast_to(np.asarray(pe_h, dtype=float), orig_yoy.shape)
+    sim_pe_l = universe['pe_l'] if pe_l is None else np.broadcast_to(np.asarray(pe_l, dtype=float), orig_yoy.shape)
+
+    # 股本缺值或 <= 0 的股票無法試算，整列輸出 NaN
+    usable = capital > 0
+    sim_rev = np.where(usable, base_rev * (1 + sim_yoy), np.nan)
+    net_income = sim_rev * sim_net
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eps = np.round(net_income / np.where(usable, capital, 1.0) * 10, 2)
+    eps[~np.isfinite(eps)] = np.nan
+    target_h = np.round(eps * sim_pe_h, 2)
+    target_l = np.round(eps * sim_pe_l, 2)
+
+    result = {
+        'sim_yoy': sim_yoy, 'sim_net': sim_net,
+        'pe_h': sim_pe_h, 'pe_l': sim_pe_l,
+        'base_rev': base_rev, 'sim_rev': sim_rev, 'net_income': net_income,
+        'eps': eps, 'target_h': target_h, 'target_l': target_l,
+    }
+
+    if prices is not None:
+        prices = np.asarray(prices, dtype=float)
+        valid = np.isfinite(prices) & (prices > 0)
+        safe_prices = np.where(valid, prices, 1.0)
+        upside = np.where(valid, (target_h - prices) / safe_prices, np.nan)
+        downside = np.where(valid, (target_l - prices) / safe_prices, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rr = np.where(downside != 0, np.abs(upside / downside), 0.0)
+        rr[~valid] = np.nan
+        result.update({'price': prices, 'upside': upside, 'downside': downside, 'rr': rr})
+
+    return result
+
+
+# ---------------------------------------------------------
+# 敏感度矩陣：YoY × 淨利率 × 本益比
+# ---------------------------------------------------------
+MAX_GRID_CELLS = 200_000
+
+
+def parse_range(text, scale=1.0):
+    """
+    "start:stop:step" (含終點) 或 "a,b,c"，回傳 ndarray；scale 用於把百分比轉為小數。
+    單一軸的點數超過 MAX_GRID_CELLS、或含 inf / nan 時拋出 ValueError (在配置陣列之前檢查)。
+    """
+    text = (text or '').replace(' ', '')
+    if not text:
+        raise ValueError("範圍不可為空")
+    if ':' in text:
+        parts = [float(p) for p in text.split(':')]
+        if len(parts) != 3 or not all(np.isfinite(parts)) or parts[2] <= 0 or parts[1] < parts[0]:
+            raise ValueError(f"範圍格式錯誤：{text} (應為 起:迄:間距)")
+        start, stop, step = parts
+        n = (stop - start) / step + 1e-9
+        if not np.isfinite(n) or n >= MAX_GRID_CELLS:
+            raise ValueError(f"範圍點數超過上限 {MAX_GRID_CELLS}：{text}")
+        values = start + step * np.arange(int(n) + 1)
+    else:
+        parts = [float(p) for p in text.split(',') if p]
+        if not all(np.isfinite(parts)):
+            raise ValueError(f"範圍格式錯誤：{text} (不接受 inf / nan)")
+        if len(parts) > MAX_GRID_CELLS:
+            raise ValueError(f"範圍點數超過上限 {MAX_GRID_CELLS}：{text}")
+        values = np.array(parts, dtype=float)
+    return np.round(values, 6) / scale
+
+
+def sensitivity_grid(num, yoy_values, net_values, pe_values, live_price=None):
+    """
+    以 broadcast 一次算出整個格點：
+      eps      形狀 (len(yoy), len(net))
+      target   形狀 (len(yoy), len(net), len(pe))
+      upside   同 target (有即時價時)
+    num 為 StockData.normalized；yoy_values / net_values 為小數。
+    """
+    yoy_values = np.asarray(yoy_values, dtype=float)
+    net_values = np.asarray(net_values, dtype=float)
+    pe_values = np.asarray(pe_values, dtype=float)
+    if yoy_values.size * net_values.size * pe_values.size > MAX_GRID_CELLS:
+        raise ValueError(f"格點數超過上限 {MAX_GRID_CELLS}")
+
+    orig_yoy, _, capital, orig_rev_predict = _base_params(num)
+    base_rev = orig_rev_predict / (1 + orig_yoy) if (1 + orig_yoy) != 0 else orig_rev_predict
+
+    sim_rev = base_rev * (1 + yoy_values[:, None])           # (Y, 1)
+    net_income = sim_rev * net_values[None, :]              # (Y, N)
+    eps = np.round(net_income / capital * 10, 2)            # (Y, N)
+    target = np.round(eps[:, :, None] * pe_values, 2)       # (Y, N, P)
+
+    grid = {
+        'base_rev': base_rev,
+        'yoy': yoy_values, 'net': net_values, 'pe': pe_values,
+        'eps': eps, 'target': target,
+    }
+    if live_price:
+        grid['live_price'] = live_price
+        grid['upside'] = (target - live_price) / live_price
+    return grid
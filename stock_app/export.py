@@ -0,0 +1,207 @@
+import csv
+import json
+import math
+from itertools import islice
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.db.models.fields.json import KeyTransform
+
+from .engine import COLUMN_FIELDS, build_universe, simulate
+from .models import StockData
+
+# =========================================================
+# 串流匯出：CSV / NDJSON / Parquet (需安裝 pyarrow)
+# 以 .iterator(chunk_size) 逐批讀取 (Postgres 為 server-side cursor)，
+# 每批算完模擬結果就寫出，記憶體用量與匯出筆數無關
+# =========================================================
+CHUNK_SIZE = 2000
+
+BASE_COLUMNS = ['stock_id', 'stock_name', 'data_year', 'data_month']
+
+# 匯出的 PER_Analysis 欄位 (原始值，不轉換)
+PER_COLUMNS = [
+    'Now_Price', 'Predict_Rev', 'Predict_EPS', 'Total_EPS_Est', 'Q4_EPS_Est',
+    'YoY_Use', 'Net_Avg', 'Capital', 'PE_Use_H', 'PE_Use_L',
+    'Target_H', 'Target_L', 'Profit',
+]
+
+# 模擬試算輸出 (yoy / net 以百分比表示；上下檔空間以 Now_Price 為基準)
+SIM_COLUMNS = {
+    'sim_yoy': ('sim_yoy', 100), 'sim_net': ('sim_net', 100),
+    'sim_rev': ('sim_rev', 1), 'sim_eps': ('eps', 1),
+    'sim_target_h': ('target_h', 1), 'sim_target_l': ('target_l', 1),
+    'sim_upside': ('upside', 100), 'sim_downside': ('downside', 100), 'sim_rr': ('rr', 1),
+}
+
+COLUMNS = BASE_COLUMNS + PER_COLUMNS + list(SIM_COLUMNS)
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_row_chunks(queryset, sim_params=None, chunk_size=CHUNK_SIZE):
+    """
+    依 (年, 月, 代碼) 排序逐批產生 [dict, ...]；PER_Analysis 欄位以 JSON path 投影讀取，不載入整個 raw_data。
+    sim_params: simulate() 的 yoy / net / pe_h / pe_l (None 表示沿用原始值)。
+    """
+    sim_params = sim_params or {}
+    annotations = {f'per__{k}': KeyTransform(k, KeyTransform('PER_Analysis', 'raw_data')) for k in PER_COLUMNS}
+    # 試算用的股價取正規化後的數值 (已是浮點數)
+    annotations['num__Now_Price'] = KeyTransform('Now_Price', 'normalized')
+    qs = (
+        queryset.order_by('data_year', 'data_month', 'stock_id')
+        .annotate(**annotations)
+        .values_list(*BASE_COLUMNS, *COLUMN_FIELDS.values(), *annotations)
+    )
+    n_base, n_cols, n_per = len(BASE_COLUMNS), len(COLUMN_FIELDS), len(PER_COLUMNS)
+
+    for chunk in _chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+        universe = build_universe([(r[0], r[1], *r[n_base:n_base + n_cols]) for r in chunk])
+        prices = np.array([np.nan if r[-1] is None else r[-1] for r in chunk], dtype=float)
+        res = simulate(universe, prices=prices, **sim_params)
+        sims = {
+            col: [round(v, 4) if math.isfinite(v) else None for v in (np.asarray(res[key], dtype=float) * scale).tolist()]
+            for col, (key, scale) in SIM_COLUMNS.items()
+        }
+
+        rows = []
+        for i, r in enumerate(chunk):
+            row = dict(zip(BASE_COLUMNS, r[:n_base]))
+            row.update(zip(PER_COLUMNS, r[n_base + n_cols:n_base + n_cols + n_per]))
+            row.update({col: v[i] for col, v in sims.items()})
+            rows.append(row)
+        yield rows
+
+
+# ---------------------------------------------------------
+# 各格式的串流產生器 (每次 yield 一段 bytes / str)
+# ---------------------------------------------------------
+class _Echo:
+    """csv.writer 需要 write()；直接回傳字串讓產生器 yield。"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(chunks):
+    writer = csv.writer(_Echo())
+    # 加上 BOM，Excel 開啟中文名稱才不會亂碼
+    yield '\ufeff' + writer.writerow(COLUMNS)
+    for rows in chunks:
+        yield ''.join(writer.writerow(['' if row[c] is None else row[c] for c in COLUMNS]) for row in rows)
+
+
+def stream_ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+class _ParquetSink:
+    """ParquetWriter 的輸出目標：寫入的 bytes 暫存，由產生器取走後清空。"""
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.buffer.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_parquet(chunks):
+    """每批寫成一個 row group。"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # PER_Analysis 原始值型別不一 ('12.5%' 與 12.5 並存)，一律以字串儲存
+    schema = pa.schema(
+        [('stock_id', pa.string()), ('stock_name', pa.string()),
+         ('data_year', pa.int32()), ('data_month', pa.int32())]
+        + [(c, pa.string()) for c in PER_COLUMNS]
+        + [(c, pa.float64()) for c in SIM_COLUMNS]
+    )
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            columns = {c: [row[c] for row in rows] for c in COLUMNS}
+            for c in PER_COLUMNS:
+                columns[c] = [None if v is None else str(v) for v in columns[c]]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+STREAMERS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson; charset=utf-8'),
+    'parquet': (stream_parquet, 'application/vnd.apache.parquet'),
+}
+
+
+_DONE = object()
+
+
+async def aiter_stream(stream):
+    """
+    ASGI 用：把同步產生器轉成 async iterator，逐段在同一個 thread 取出
+    (資料庫連線與 server-side cursor 都留在該 thread)。
+    Django 4.2 在 ASGI 下遇到同步 iterator 會整份讀進記憶體，串流就失效了。
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await step(stream, _DONE)
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(stream.close, thread_sensitive=True)()
+
+
+def export_queryset(year=None, month=None, stock_ids=None):
+    qs = StockData.objects.all()
+    if year is not None:
+        qs = qs.filter(data_year=year)
+    if month is not None:
+        qs = qs.filter(data_month=month)
+    if stock_ids:
+        qs = qs.filter(stock_id__in=stock_ids)
+    return qs
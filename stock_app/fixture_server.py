@@ -0,0 +1,91 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================================================
+# 本機報價測試伺服器：模擬 stock.wearn.com 的個股頁面
+# 用法：
+#   with QuoteFixtureServer({'2330': 1050.0}) as srv:
+#       PriceService(url_template=srv.url_template).get_price('2330')
+# =========================================================
+PAGE_TEMPLATE = """<html><head><meta charset="{charset}"><title>{stock_id}</title></head><body>
+<ul class="nav"><li>首頁</li><li>個股</li></ul>
+<ul class="info"><li>{stock_id}</li><li>名稱</li></ul>
+<ul class="quote"><li>{price}</li><li>成交價</li></ul>
+<ul><li>漲跌</li></ul>
+{padding}
+</body></html>"""
+
+_PATH_RE = re.compile(r'^/a(?P<stock_id>[\w-]+)\.html$')
+
+
+class QuoteFixtureServer:
+    def __init__(self, prices=None, delay=0.0, charset='utf-8', padding_kb=0):
+        self.prices = dict(prices or {})
+        self.delay = delay
+        self.charset = charset
+        self.padding = '<p>' + ('x' * 1024) + '</p>\n'
+        self.padding_kb = padding_kb
+        self.hits = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def render(self, stock_id):
+        price = self.prices[stock_id]
+        html = PAGE_TEMPLATE.format(
+            charset=self.charset, stock_id=stock_id,
+            price=f"{price:,.2f}", padding=self.padding * self.padding_kb,
+        )
+        return html.encode(self.charset)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                m = _PATH_RE.match(self.path)
+                stock_id = m.group('stock_id') if m else None
+                with server._lock:
+                    server.hits[stock_id] = server.hits.get(stock_id, 0) + 1
+                if server.delay:
+                    time.sleep(server.delay)
+                if stock_id not in server.prices:
+                    self.send_error(404)
+                    return
+                body = server.render(stock_id)
+                self.send_response(200)
+                self.send_header('Content-Type', f'text/html; charset={server.charset}')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url_template(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/a{{stock_id}}.html'
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,365 @@
+import codecs
+import datetime
+import json
+import re
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics
+from .models import StockData, StockRating, ImportJob, HOT_FIELD_NAMES
+from .parsing import extract_ratings, merge_patch
+from .catalog import update_catalogue, invalidate_catalogue
+from .sections import invalidate_dashboard, warm_dashboard
+from .series import build_series
+from .revisions import update_revisions
+from .validation import RecordInvalid, ValidationReport, validate_record
+from .watchlists import refresh_for_codes
+
+# =========================================================
+# 匯入引擎：串流解析 + 批次 upsert
+# =========================================================
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+
+UNIQUE_FIELDS = ['stock_id', 'data_year', 'data_month']
+UPDATE_FIELDS = ['stock_name', 'raw_data', 'normalized', 'content_hash', 'update_date'] + HOT_FIELD_NAMES
+
+_WS = ' \t\r\n'
+# 數值後面若只剩這些字元就到緩衝區尾端，數值可能還沒讀完 (例如 '1050.'、'1e')
+_NUM_TAIL = re.compile(r'[0-9.eE+\-]*\Z')
+
+
+class _JSONStream:
+    """逐塊讀取上傳檔，只保留尚未解析完的部分在記憶體中。"""
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            self.eof = True
+        self.bytes_read += len(chunk)
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # 跳過空白並回傳下一個字元 (檔尾回傳空字串)
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"JSON 格式錯誤：位置 {self.bytes_read} 附近預期 {chars!r}，實際為 {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self, decoder=json.JSONDecoder()):
+        self.peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # 數值可能剛好被切在緩衝區尾端，需再讀一塊確認
+            if isinstance(obj, (int, float)) and not isinstance(obj, bool) \
+                    and _NUM_TAIL.match(self.buf, end) and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_items(fileobj, chunk_size=CHUNK_SIZE):
+    """逐筆產生最外層物件的 (key, value)，不需一次載入整個檔案。"""
+    return _iter_items(_JSONStream(fileobj, chunk_size))
+
+
+def _iter_items(stream):
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        if not isinstance(key, str):
+            raise ValueError("JSON 格式錯誤：最外層的 key 必須是字串")
+        stream.expect(':')
+        yield key, stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+
+def resolve_period(content, now=None):
+    """依 Meta 的 QueryDate / TargetMonth 決定資料所屬年月。"""
+    now = now or datetime.datetime.now()
+    meta = content.get('Meta') or {}
+    try: t_month = int(meta.get('TargetMonth', now.month))
+    except: t_month = now.month
+    q_date_str = meta.get('QueryDate', now.strftime('%Y-%m-%d'))
+    try: t_year = int(q_date_str.split('-')[0])
+    except: t_year = now.year
+    return t_year, t_month
+
+
+def _row_ids(by_period):
+    # upsert 不一定回傳主鍵，另外查一次 (stock_id, 年, 月) -> pk
+    ids = {}
+    for (y, m), sids in by_period.items():
+        for sid, pk in StockData.objects.filter(
+            data_year=y, data_month=m, stock_id__in=sids
+        ).values_list('stock_id', 'pk'):
+            ids[(sid, y, m)] = pk
+    return ids
+
+
+def _sync_ratings(pending, ids):
+    StockRating.objects.filter(stock_id__in=ids.values()).delete()
+    StockRating.objects.bulk_create([
+        StockRating(stock_id=ids[key], factor=factor, rating=rating)
+        for key, obj in pending.items() if key in ids
+        for factor, rating in extract_ratings(obj.raw_data).items()
+    ])
+
+
+def _flush(pending, stats, written, force=False):
+    """
+    寫入一批資料列。資料庫中內容雜湊相同的列直接跳過 (不寫入、不更新 update_date、不重建衍生資料)，
+    只有新增與內容有變的列會 upsert；寫入的股票代碼加入 written。
+    """
+    if not pending:
+        return
+    existing = {}   # (stock_id, 年, 月) -> 已儲存的 content_hash
+    for (y, m), sids in _group_by_period(pending).items():
+        for sid, digest in StockData.objects.filter(
+            data_year=y, data_month=m, stock_id__in=sids
+        ).values_list('stock_id', 'content_hash'):
+            existing[(sid, y, m)] = digest
+    if not force:
+        pending = {key: obj for key, obj in pending.items() if existing.get(key) != obj.content_hash}
+    stats['skipped'] += len(existing) - sum(1 for key in pending if key in existing)
+    stats['batches'] += 1
+    if not pending:
+        return
+
+    by_period = _group_by_period(pending)
+    with transaction.atomic():
+        StockData.objects.bulk_create(
+            list(pending.values()),
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=UPDATE_FIELDS,
+        )
+        ids = _row_ids(by_period)
+        _sync_ratings(pending, ids)
+        build_series(ids, pending)
+        update_revisions(ids, pending)
+        # 依年月排序，同一檔出現多個月份時保留最新的一筆
+        update_catalogue({
+            sid: (obj.stock_name, y, m) for (sid, y, m), obj in sorted(pending.items(), key=lambda kv: kv[0][1:])
+        })
+    invalidate_catalogue()
+    invalidate_dashboard(pending.keys())
+    if getattr(settings, 'DASHBOARD_CACHE_WARM', False):
+        warm_dashboard(list(ids.values()))
+
+    updated = sum(1 for key in pending if key in existing)
+    stats['updated'] += updated
+    stats['inserted'] += len(pending) - updated
+    written.update(sid for sid, _, _ in pending)
+
+
+def _group_by_period(keys):
+    by_period = {}
+    for sid, y, m in keys:
+        by_period.setdefault((y, m), []).append(sid)
+    return by_period
+
+
+def _timed_flush(pending, stats, written, force=False):
+    started = time.perf_counter()
+    with metrics.stage('import_flush'):
+        _flush(pending, stats, written, force)
+    stats['flush_seconds'] += time.perf_counter() - started
+
+
+def _update_rate(stats, stream, started):
+    stats['bytes_read'] = stream.bytes_read
+    stats['elapsed'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+
+
+# ---------------------------------------------------------
+# 差異更新 (patch)：每檔只帶有變動的欄位，以 JSON Merge Patch 合併到既有資料後再驗證
+#   Meta 內有 TargetMonth / QueryDate 時套用到該年月 (不存在則視為新資料)，
+#   沒有時套用到該檔最新一份快照
+# ---------------------------------------------------------
+def _patch_key(sid, content, now):
+    meta = content.get('Meta')
+    if isinstance(meta, dict) and ('TargetMonth' in meta or 'QueryDate' in meta):
+        return (sid, *resolve_period(content, now))
+    return (sid, None, None)
+
+
+def _patch_bases(keys):
+    """回傳 {patch key: (年, 月, 既有 raw_data)}；找不到既有資料的 key 不會出現。"""
+    targets = {}   # patch key -> (sid, 年, 月)
+    for sid, y, m in keys:
+        if y is not None:
+            targets[(sid, y, m)] = (sid, y, m)
+    latest = [sid for sid, y, _ in keys if y is None]
+    if latest:
+        qs = StockData.objects.filter(stock_id__in=latest).order_by('stock_id', '-data_year', '-data_month')
+        for sid, y, m in qs.values_list('stock_id', 'data_year', 'data_month'):
+            targets.setdefault((sid, None, None), (sid, y, m))
+
+    raws = {}
+    for (y, m), sids in _group_by_period(set(targets.values())).items():
+        for sid, raw in StockData.objects.filter(
+            data_year=y, data_month=m, stock_id__in=sids
+        ).values_list('stock_id', 'raw_data'):
+            raws[(sid, y, m)] = raw
+    return {key: (t[1], t[2], raws[t]) for key, t in targets.items() if t in raws}
+
+
+def _apply_patches(patches, stats, now):
+    """patches: {patch key: 差異內容}；回傳合併並驗證後的 {(stock_id, 年, 月): StockData}。"""
+    bases = _patch_bases(patches)
+    objs = {}
+    for key, patch in patches.items():
+        sid = key[0]
+        if key in bases:
+            y, m, base = bases[key]
+            period = (y, m)
+        elif key[1] is not None:
+            base, period = {}, key[1:]
+        else:
+            _reject(stats, RecordInvalid(sid, ["找不到可套用差異的既有資料 (請在 Meta 指定 TargetMonth / QueryDate)"]))
+            continue
+        content = merge_patch(base, patch)
+        try:
+            normalized, warnings = validate_record(sid, content)
+        except RecordInvalid as e:
+            _reject(stats, e)
+            continue
+        stats['validation'].warn(sid, warnings)
+        obj = _make_record(sid, content, normalized, period)
+        objs[(sid, obj.data_year, obj.data_month)] = obj
+    return objs
+
+
+def _reject(stats, exc):
+    stats['validation'].reject(exc)
+    stats['rejected'] += 1
+
+
+def _make_record(sid, content, normalized, period):
+    meta = content.get('Meta') or {}
+    obj = StockData(
+        stock_id=sid, data_year=period[0], data_month=period[1],
+        stock_name=meta.get('StockName', sid), raw_data=content,
+    )
+    obj.fill_hot_fields(normalized)
+    return obj
+
+
+def import_stock_json(fileobj, batch_size=BATCH_SIZE, on_progress=None, mode=ImportJob.MODE_FULL, force=False):
+    """
+    串流匯入上傳的 JSON，依 (stock_id, data_year, data_month) 分組後批次 upsert。
+    每批在同一個 transaction 內完成；on_progress(stats) 會在每批寫入後呼叫。
+    每檔先經 validate_record 驗證：驗證失敗的不匯入，與警告一起彙整在 stats['validation']。
+    mode='patch' 時每檔只需帶有變動的欄位 (見 _apply_patches)。
+    內容與資料庫相同的列會跳過 (stats['skipped'])；force=True 時一律重寫。
+    """
+    if mode not in (ImportJob.MODE_FULL, ImportJob.MODE_PATCH):
+        raise ValueError(f"未知的匯入模式：{mode}")
+    started = time.perf_counter()
+    now = datetime.datetime.now()
+    stats = {
+        'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'batches': 0,
+        'elapsed': 0.0, 'rows_per_sec': 0.0, 'bytes_read': 0,
+        'first_ids': [], 'period': None, 'flush_seconds': 0.0,
+        'rejected': 0, 'validation': ValidationReport(), 'watchlists': 0,
+    }
+    written = set()
+
+    def accept(objs):
+        for key, obj in objs.items():
+            pending[key] = obj
+            stats['period'] = key[1:]
+            if len(stats['first_ids']) < 2:
+                stats['first_ids'].append(key[0])
+
+    def flush():
+        if patches:
+            accept(_apply_patches(patches, stats, now))
+            patches.clear()
+        _timed_flush(pending, stats, written, force)
+        pending.clear()
+
+    stream = _JSONStream(fileobj)
+    pending = {}
+    patches = {}
+    for sid, content in _iter_items(stream):
+        sid = str(sid)
+        stats['rows'] += 1
+        if mode == ImportJob.MODE_PATCH:
+            if not isinstance(content, dict):
+                _reject(stats, RecordInvalid(sid, ["資料格式錯誤 (應為物件)"]))
+                continue
+            # 同一檔案內重複的 key 以最後一筆為準
+            patches[_patch_key(sid, content, now)] = content
+        else:
+            try:
+                normalized, warnings = validate_record(sid, content)
+            except RecordInvalid as e:
+                _reject(stats, e)
+                continue
+            stats['validation'].warn(sid, warnings)
+            period = resolve_period(content, now)
+            # 同一檔案內重複的 key 以最後一筆為準
+            accept({(sid, *period): _make_record(sid, content, normalized, period)})
+
+        if len(pending) + len(patches) >= batch_size:
+            flush()
+            _update_rate(stats, stream, started)
+            if on_progress:
+                on_progress(stats)
+
+    flush()
+
+    # 含有本次寫入股票的自選清單重新估值；清單多時耗時較久，前後與每個清單之間都回報進度 (匯入工作的 heartbeat)
+    if written and getattr(settings, 'WATCHLIST_REFRESH_ON_IMPORT', True):
+        heartbeat = (lambda: on_progress(stats)) if on_progress else None
+        if heartbeat:
+            heartbeat()
+        with metrics.stage('watchlist_refresh'):
+            stats['watchlists'] = refresh_for_codes(written, on_each=heartbeat)
+
+    _update_rate(stats, stream, started)
+    # 解析時間 = 總耗時 - 寫入時間
+    metrics.observe('stage_seconds', max(stats['elapsed'] - stats['flush_seconds'], 0.0), stage='import_parse')
+    metrics.observe('import_seconds', stats['elapsed'], help='整份檔案匯入耗時 (秒)')
+    metrics.registry.inc('import_rows', stats['inserted'], help='匯入結果筆數', result='inserted')
+    metrics.registry.inc('import_rows', stats['updated'], help='匯入結果筆數', result='updated')
+    metrics.registry.inc('import_rows', stats['skipped'], help='匯入結果筆數', result='skipped')
+    if on_progress:
+        on_progress(stats)
+    return stats
@@ -0,0 +1,202 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .importer import import_stock_json
+from .models import ImportJob
+
+# =========================================================
+# 匯入工作佇列
+# =========================================================
+_executor = None
+_executor_lock = threading.Lock()
+_resubmitted = set()      # 本行程已重新送出的排隊工作 (避免每次輪詢都再送一次)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_WORKERS', 1),
+                thread_name_prefix='stock-import',
+            )
+        return _executor
+
+
+def submit_import(upload, mode=ImportJob.MODE_FULL):
+    """保存上傳檔並建立匯入工作，立即回傳 (不等待匯入完成)。mode 為 full 或 patch (差異更新)。"""
+    if _thread_backend():
+        # thread 模式沒有常駐的 worker，由新的上傳順便處理行程重啟後停住的工作
+        reap_stale_jobs()
+    job = ImportJob.objects.create(
+        upload=upload,
+        mode=mode,
+        original_name=getattr(upload, 'name', '')[:255],
+        bytes_total=getattr(upload, 'size', 0) or 0,
+    )
+    if _thread_backend():
+        # 等資料列 commit 之後才交給背景 thread，避免讀不到工作
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def _thread_backend():
+    return getattr(settings, 'IMPORT_JOB_BACKEND', 'thread') == 'thread'
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """以條件式 UPDATE 搶下工作，多個 worker 同時執行也只會有一個成功。"""
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_QUEUED).update(
+        status=ImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now,
+    )
+    return claimed == 1
+
+
+def _delete_upload(job):
+    """工作結束 (完成或失敗) 後刪除落地的上傳檔。"""
+    if job.upload:
+        job.upload.storage.delete(job.upload.name)
+        ImportJob.objects.filter(pk=job.pk).update(upload='')
+        job.upload.name = ''
+
+
+def run_job(job_id):
+    if not claim_job(job_id):
+        return None
+    job = ImportJob.objects.get(pk=job_id)
+
+    def on_progress(stats):
+        ImportJob.objects.filter(pk=job_id).update(
+            bytes_done=stats['bytes_read'],
+            rows_done=stats['rows'],
+            rows_inserted=stats['inserted'],
+            rows_updated=stats['updated'],
+            rows_rejected=stats['rejected'],
+            rows_skipped=stats['skipped'],
+            rows_per_sec=stats['rows_per_sec'],
+            heartbeat_at=timezone.now(),
+        )
+
+    try:
+        with job.upload.open('rb') as f:
+            stats = import_stock_json(f, on_progress=on_progress, mode=job.mode)
+    except Exception as e:
+        ImportJob.objects.filter(pk=job_id).update(
+            status=ImportJob.STATUS_FAILED, errors=[str(e)], finished_at=timezone.now(),
+        )
+    else:
+        year, month = stats['period'] or (None, None)
+        ImportJob.objects.filter(pk=job_id).update(
+            status=ImportJob.STATUS_DONE,
+            bytes_done=stats['bytes_read'],
+            rows_rejected=stats['rejected'],
+            rows_skipped=stats['skipped'],
+            errors=stats['validation'].lines(),
+            result_year=year, result_month=month,
+            first_stock_id=stats['first_ids'][0] if stats['first_ids'] else '',
+            finished_at=timezone.now(),
+        )
+    finally:
+        _delete_upload(job)
+    return ImportJob.objects.get(pk=job_id)
+
+
+def reap_stale_job(job):
+    """
+    thread 模式的工作只存在於 web 行程的記憶體中，行程重啟後資料列會停在 queued / running。
+    由 run_import_worker 每次輪詢、或 thread 模式下新的上傳呼叫 (查詢進度不會改動工作)。
+    超過 IMPORT_JOB_STALE_AFTER 秒沒有進度時：
+      running -> 標為失敗 (已寫入的批次保留，重新上傳即可；未變更的資料列會自動略過)
+      queued  -> thread 模式重新送進本行程的 thread pool；worker 模式留給 run_import_worker
+    回傳 (可能已更新的) job。
+    """
+    if job.status not in (ImportJob.STATUS_QUEUED, ImportJob.STATUS_RUNNING):
+        return job
+    cutoff = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_AFTER', 300))
+    if job.status == ImportJob.STATUS_RUNNING:
+        if (job.heartbeat_at or job.started_at or job.created_at) >= cutoff:
+            return job
+        # 條件式 UPDATE：工作若剛好又有進度就不動它
+        reaped = ImportJob.objects.filter(
+            pk=job.pk, status=ImportJob.STATUS_RUNNING, heartbeat_at=job.heartbeat_at,
+        ).update(
+            status=ImportJob.STATUS_FAILED, finished_at=timezone.now(),
+            errors=list(job.errors or []) + ["匯入中斷：執行的行程已停止 (可能是服務重新啟動)，請重新上傳"],
+        )
+        if reaped:
+            _delete_upload(job)
+        return ImportJob.objects.get(pk=job.pk)
+    if job.created_at < cutoff and _thread_backend() and job.pk not in _resubmitted:
+        _resubmitted.add(job.pk)
+        _get_executor().submit(_run_in_thread, job.pk)
+    return job
+
+
+def reap_stale_jobs():
+    """檢查所有排隊 / 執行中的工作，回傳標為失敗的筆數。"""
+    jobs = ImportJob.objects.filter(status__in=[ImportJob.STATUS_QUEUED, ImportJob.STATUS_RUNNING])
+    return sum(reap_stale_job(job).status == ImportJob.STATUS_FAILED for job in jobs)
+
+
+def run_next_job():
+    """處理最早排隊的一筆工作；沒有工作時回傳 None。"""
+    for job_id in ImportJob.objects.filter(status=ImportJob.STATUS_QUEUED).values_list('pk', flat=True)[:5]:
+        job = run_job(job_id)
+        if job is not None:
+            return job
+    return None
+
+
+def job_progress(job):
+    """整理成前端輪詢用的進度資料 (含 ETA)；只讀取，不改動工作狀態。"""
+    now = timezone.now()
+    elapsed = 0.0
+    if job.started_at:
+        elapsed = ((job.finished_at or now) - job.started_at).total_seconds()
+
+    eta = None
+    if job.status == ImportJob.STATUS_RUNNING and job.bytes_done and job.bytes_total:
+        remaining = max(job.bytes_total - job.bytes_done, 0)
+        eta = round(elapsed * remaining / job.bytes_done, 1)
+    elif job.status == ImportJob.STATUS_DONE:
+        eta = 0
+
+    percent = 0.0
+    if job.status == ImportJob.STATUS_DONE:
+        percent = 100.0
+    elif job.bytes_total:
+        percent = round(min(job.bytes_done / job.bytes_total, 1) * 100, 1)
+
+    return {
+        'id': job.pk,
+        'name': job.original_name,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'percent': percent,
+        'rows_done': job.rows_done,
+        'rows_inserted': job.rows_inserted,
+        'rows_updated': job.rows_updated,
+        'rows_rejected': job.rows_rejected,
+        'rows_skipped': job.rows_skipped,
+        'mode': job.mode,
+        'rows_per_sec': round(job.rows_per_sec, 1),
+        'elapsed': round(elapsed, 1),
+        'eta': eta,
+        'errors': job.errors,
+        'result_year': job.result_year,
+        'result_month': job.result_month,
+        'first_stock_id': job.first_stock_id,
+    }
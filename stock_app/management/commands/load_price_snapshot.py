@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.pricing import load_snapshot
+
+
+class Command(BaseCommand):
+    help = "匯入每日收盤價檔 (CSV / JSON) 到 PriceQuote，作為即時股價抓取失敗時的備援"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="收盤價檔路徑 (.csv 或 .json)")
+        parser.add_argument('--date', help="報價日期 YYYY-MM-DD；未指定則使用檔案內的 date 欄，沒有則為今天")
+
+    def handle(self, *args, **options):
+        try:
+            quote_date = datetime.date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError("--date 格式須為 YYYY-MM-DD")
+        try:
+            n = load_snapshot(options['path'], quote_date)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"無法讀取 {options['path']}：{e}")
+        self.stdout.write(f"已寫入 {n} 筆收盤價")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from stock_app.models import Watchlist
+from stock_app.watchlists import precompute_watchlists
+
+
+class Command(BaseCommand):
+    help = "預先計算自選清單的估值 (模擬 EPS、目標價、上下檔空間、風險報酬比)，可搭配排程或 --every 常駐執行"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watchlist', action='append', default=[], help="只重算指定名稱的清單 (可重複)")
+        parser.add_argument('--live', action='store_true', help="即時抓價 (預設只用已儲存的收盤價)")
+        parser.add_argument('--every', type=float, help="每隔幾秒重算一次 (未指定則執行一次即結束)")
+
+    def handle(self, *args, **options):
+        names = options['watchlist']
+        if names:
+            missing = set(names) - set(Watchlist.objects.filter(name__in=names).values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"找不到清單：{', '.join(sorted(missing))}")
+
+        while True:
+            close_old_connections()
+            qs = Watchlist.objects.filter(name__in=names) if names else Watchlist.objects.all()
+            started = time.perf_counter()
+            results = precompute_watchlists(qs, live=options['live'])
+            for name, n in results.items():
+                self.stdout.write(f"{name}: {n} 檔")
+            self.stdout.write(f"共 {len(results)} 個清單，{time.perf_counter() - started:.2f}s")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
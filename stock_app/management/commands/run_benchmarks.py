@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from stock_app.bench import environment_info, run_size
+
+
+class Command(BaseCommand):
+    help = "在獨立的測試資料庫中產生模擬資料，量測匯入、查詢數與各頁面延遲，結果輸出為 JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickers', default='100,1000,10000', help="股票檔數，逗號分隔 (預設 100,1000,10000)")
+        parser.add_argument('--months', type=int, default=3, help="每種規模匯入幾個月份 (預設 3)")
+        parser.add_argument('--repeat', type=int, default=20, help="每項量測重複次數 (預設 20)")
+        parser.add_argument('--output', help="結果寫入的 JSON 檔；未指定則輸出到 stdout")
+        parser.add_argument('--keepdb', action='store_true', help="保留測試資料庫")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(x) for x in options['tickers'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError("--tickers 必須是以逗號分隔的整數")
+        if not 1 <= options['months'] <= 12:
+            raise CommandError("--months 必須介於 1 到 12")
+
+        # 使用測試資料庫，避免動到正式資料
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = {'environment': environment_info(), 'results': []}
+            for n in sizes:
+                self.stderr.write(f"[{n} 檔 × {options['months']} 個月]")
+                report['results'].append(run_size(
+                    n, options['months'], repeat=max(options['repeat'], 1),
+                    log=lambda msg: self.stderr.write(msg),
+                ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.stderr.write(f"結果已寫入 {options['output']}")
+        else:
+            self.stdout.write(text)
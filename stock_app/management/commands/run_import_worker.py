@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from stock_app.jobs import job_progress, reap_stale_jobs, run_next_job
+
+
+class Command(BaseCommand):
+    help = "處理排隊中的 JSON 匯入工作 (搭配 IMPORT_JOB_BACKEND=worker 使用)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="處理完目前佇列後即結束")
+        parser.add_argument('--poll', type=float, default=2.0, help="佇列為空時的輪詢間隔 (秒)")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            # 其他 worker (或上一個 worker) 中斷時留下的執行中工作
+            reaped = reap_stale_jobs()
+            if reaped:
+                self.stdout.write(f"{reaped} 筆中斷的工作已標為失敗")
+            job = run_next_job()
+            if job is not None:
+                p = job_progress(job)
+                self.stdout.write(
+                    f"#{p['id']} {p['name']}: {p['status_display']} "
+                    f"{p['rows_done']} 筆 ({p['rows_per_sec']} 筆/秒) {'; '.join(p['errors'])}"
+                )
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll'])
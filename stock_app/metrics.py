@@ -0,0 +1,297 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# =========================================================
+# 效能量測：每個請求的階段耗時 / SQL 查詢數 + 行程內滾動直方圖
+#   with stage('scrape'):
+#       ...
+# 請求內的階段會彙總成 Server-Timing；所有階段 (含背景匯入、抓價執行緒)
+# 都會寫入全域直方圖，由 /metrics 以 Prometheus 文字格式輸出。
+# 注意：數據存在各行程記憶體中，多個 gunicorn worker 各自計數。
+# =========================================================
+PREFIX = 'stockapp'
+
+# 秒；涵蓋 1ms 快取命中到 10s 抓價逾時
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """
+    累計分桶 (Prometheus histogram，只增不減) + 最近 window 筆樣本 (用來算滾動百分位數)。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=None):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # 最後一格為 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window or getattr(settings, 'METRICS_WINDOW', 1024))
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count, sorted(self.recent)
+
+    def quantiles(self, qs=QUANTILES):
+        samples = self.snapshot()[3]
+        return {q: _quantile(samples, q) for q in qs}
+
+
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return None
+    idx = min(len(sorted_samples) - 1, max(int(q * len(sorted_samples) + 0.5) - 1, 0))
+    return sorted_samples[idx]
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}   # (name, labels) -> Histogram
+        self._counters = {}     # (name, labels) -> int
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = Histogram(buckets)
+                    self._help.setdefault(name, help)
+        return hist
+
+    def inc(self, name, amount=1, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(name, help)
+
+    def counter_value(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # ---------- Prometheus 文字格式 ----------
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for name, group in _group(counters):
+            full = f'{PREFIX}_{name}_total'
+            lines += [f'# HELP {full} {self._help.get(name, "")}', f'# TYPE {full} counter']
+            lines += [f'{full}{_labels(labels)} {value}' for labels, value in group]
+        for name, group in _group(histograms):
+            full = f'{PREFIX}_{name}'
+            lines += [f'# HELP {full} {self._help.get(name, "")}', f'# TYPE {full} histogram']
+            recent = []
+            for labels, hist in group:
+                counts, total, n, samples = hist.snapshot()
+                cumulative = 0
+                for bound, c in zip(hist.buckets + ('+Inf',), counts):
+                    cumulative += c
+                    lines.append(f'{full}_bucket{_labels(labels + (("le", _fmt(bound)),))} {cumulative}')
+                lines.append(f'{full}_sum{_labels(labels)} {_fmt(total)}')
+                lines.append(f'{full}_count{_labels(labels)} {n}')
+                for q in QUANTILES:
+                    v = _quantile(samples, q)
+                    if v is not None:
+                        recent.append(f'{full}_recent{_labels(labels + (("quantile", _fmt(q)),))} {_fmt(v)}')
+            if recent:
+                lines += [f'# HELP {full}_recent 最近 {hist.recent.maxlen} 筆樣本的百分位數',
+                          f'# TYPE {full}_recent gauge'] + recent
+        return '\n'.join(lines) + '\n'
+
+
+def _group(items):
+    groups = {}
+    for (name, labels), value in items:
+        groups.setdefault(name, []).append((labels, value))
+    return groups.items()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + body + '}'
+
+
+def _fmt(value):
+    return value if isinstance(value, str) else repr(float(value))
+
+
+registry = Registry()
+
+
+# =========================================================
+# 請求內的階段計時
+# =========================================================
+class RequestMetrics:
+    def __init__(self, count_queries=True):
+        self.started = time.perf_counter()
+        self.count_queries = count_queries
+        self.stages = {}        # name -> [秒, 查詢數]
+        self.queries = 0
+        self.query_time = 0.0
+
+    def add_query(self, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+        name = _stage.get()
+        if name in self.stages:
+            self.stages[name][1] += 1
+
+
+_current = contextvars.ContextVar('stockapp_request_metrics', default=None)
+# 目前所在的階段；以 ContextVar 保存，asyncio.gather 的各個 Task 各有一份，巢狀階段結束時還原外層
+_stage = contextvars.ContextVar('stockapp_stage', default=None)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """量測一段程式；在請求內時同時計入該請求的 Server-Timing。"""
+    req = _current.get()
+    token = None
+    if req is not None:
+        req.stages.setdefault(name, [0.0, 0])
+        token = _stage.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if req is not None:
+            _stage.reset(token)
+            req.stages[name][0] += elapsed
+        registry.histogram('stage_seconds', help='各階段耗時 (秒)', stage=name).observe(elapsed)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, help='', **labels):
+    registry.histogram(name, buckets, help, **labels).observe(value)
+
+
+def record_scrape(host, elapsed, ok):
+    """即時股價抓取結果 (pricing 呼叫)。"""
+    registry.inc('scrape_requests', help='即時股價抓取次數', host=host, result='ok' if ok else 'fail')
+    observe('scrape_seconds', elapsed, help='即時股價抓取耗時 (秒)', host=host)
+
+
+def scrape_summary():
+    """各主機的成功率與延遲百分位數 (秒)。"""
+    out = {}
+    for (name, labels), hist in list(registry._histograms.items()):
+        if name != 'scrape_seconds':
+            continue
+        host = dict(labels)['host']
+        ok = registry.counter_value('scrape_requests', host=host, result='ok')
+        fail = registry.counter_value('scrape_requests', host=host, result='fail')
+        out[host] = {
+            'requests': ok + fail,
+            'success_rate': ok / (ok + fail) if ok + fail else None,
+            'latency': {f'p{int(q * 100)}': v for q, v in hist.quantiles().items()},
+        }
+    return out
+
+
+# =========================================================
+# Middleware：整個請求的耗時、SQL 查詢數與 (可選) Server-Timing 標頭
+# =========================================================
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        req = RequestMetrics()
+        token = _current.set(req)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_QueryCounter(req)))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, req, response)
+
+    async def __acall__(self, request):
+        # ASGI：ORM 在 sync_to_async 的執行緒中使用自己的連線，這裡不計查詢數，只記耗時與階段
+        req = RequestMetrics(count_queries=False)
+        token = _current.set(req)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, req, response)
+
+    def _finish(self, request, req, response):
+        elapsed = time.perf_counter() - req.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        observe('request_seconds', elapsed, help='請求總耗時 (秒)', view=view, method=request.method)
+        if req.count_queries:
+            observe('request_queries', req.queries, QUERY_BUCKETS, help='每個請求的 SQL 查詢數', view=view)
+        registry.inc('responses', help='回應數', view=view, status=str(response.status_code))
+
+        if self.server_timing:
+            response['Server-Timing'] = server_timing_header(req, elapsed)
+        return response
+
+
+class _QueryCounter:
+    def __init__(self, req):
+        self.req = req
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.req.add_query(time.perf_counter() - started)
+
+
+def server_timing_header(req, total):
+    parts = [
+        f'{name};dur={secs * 1000:.1f};desc="{n} queries"' if n else f'{name};dur={secs * 1000:.1f}'
+        for name, (secs, n) in req.stages.items()
+    ]
+    if req.count_queries:
+        parts.append(f'db;dur={req.query_time * 1000:.1f};desc="{req.queries} queries"')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_id', models.CharField(max_length=10, verbose_name='股票代碼')),
+                ('stock_name', models.CharField(max_length=50, verbose_name='股票名稱')),
+                ('data_year', models.IntegerField(verbose_name='資料年份')),
+                ('data_month', models.IntegerField(verbose_name='資料月份')),
+                ('update_date', models.DateField(auto_now=True, verbose_name='上傳日期')),
+                ('raw_data', models.JSONField(verbose_name='完整分析數據')),
+            ],
+            options={
+                'verbose_name': '股票歷史數據',
+                'unique_together': {('stock_id', 'data_year', 'data_month')},
+            },
+        ),
+    ]
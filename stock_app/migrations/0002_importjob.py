@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload', models.FileField(upload_to='imports/%Y%m/', verbose_name='上傳檔案')),
+                ('original_name', models.CharField(blank=True, max_length=255, verbose_name='原始檔名')),
+                ('status', models.CharField(choices=[('queued', '排隊中'), ('running', '匯入中'), ('done', '完成'), ('failed', '失敗')], db_index=True, default='queued', max_length=10, verbose_name='狀態')),
+                ('bytes_total', models.BigIntegerField(default=0, verbose_name='檔案大小')),
+                ('bytes_done', models.BigIntegerField(default=0, verbose_name='已讀取大小')),
+                ('rows_done', models.IntegerField(default=0, verbose_name='已處理筆數')),
+                ('rows_inserted', models.IntegerField(default=0, verbose_name='新增筆數')),
+                ('rows_updated', models.IntegerField(default=0, verbose_name='更新筆數')),
+                ('rows_per_sec', models.FloatField(default=0, verbose_name='每秒筆數')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='錯誤訊息')),
+                ('result_year', models.IntegerField(blank=True, null=True, verbose_name='資料年份')),
+                ('result_month', models.IntegerField(blank=True, null=True, verbose_name='資料月份')),
+                ('first_stock_id', models.CharField(blank=True, max_length=10, verbose_name='第一檔股票')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成時間')),
+            ],
+            options={
+                'verbose_name': '匯入工作',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
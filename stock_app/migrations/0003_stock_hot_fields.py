@@ -0,0 +1,98 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factor', models.CharField(max_length=50, verbose_name='指標')),
+                ('rating', models.CharField(max_length=5, verbose_name='評等')),
+            ],
+            options={
+                'verbose_name': '六大指標評等',
+            },
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='capital',
+            field=models.FloatField(blank=True, null=True, verbose_name='股本 (億)'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='net_avg',
+            field=models.FloatField(blank=True, null=True, verbose_name='平均淨利率'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='pe_use_h',
+            field=models.FloatField(blank=True, null=True, verbose_name='本益比 (高)'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='pe_use_l',
+            field=models.FloatField(blank=True, null=True, verbose_name='本益比 (低)'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='predict_rev',
+            field=models.FloatField(blank=True, null=True, verbose_name='預估營收 (億)'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='six_average',
+            field=models.FloatField(blank=True, null=True, verbose_name='六大指標總評分'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='total_eps_est',
+            field=models.FloatField(blank=True, null=True, verbose_name='全年 EPS (估)'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='yoy_use',
+            field=models.FloatField(blank=True, null=True, verbose_name='營收年增率'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'total_eps_est'], name='stock_period_eps_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'pe_use_h'], name='stock_period_pe_h_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'pe_use_l'], name='stock_period_pe_l_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'yoy_use'], name='stock_period_yoy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'six_average'], name='stock_period_six_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockrating',
+            name='stock',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='stock_app.stockdata', verbose_name='股票資料'),
+        ),
+        migrations.AddIndex(
+            model_name='stockrating',
+            index=models.Index(fields=['factor', 'rating'], name='rating_factor_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockrating',
+            unique_together={('stock', 'factor')},
+        ),
+    ]
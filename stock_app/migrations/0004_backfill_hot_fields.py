@@ -0,0 +1,91 @@
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# 以下為撰寫此遷移時 stock_app.parsing 的解析邏輯 (複製一份固定下來，
+# 之後修改 parsing 不會改變這個遷移在新資料庫上的結果)
+HOT_FIELDS = {
+    'total_eps_est': ('Total_EPS_Est', False),
+    'pe_use_h': ('PE_Use_H', False),
+    'pe_use_l': ('PE_Use_L', False),
+    'capital': ('Capital', False),
+    'predict_rev': ('Predict_Rev', False),
+    'yoy_use': ('YoY_Use', True),
+    'net_avg': ('Net_Avg', True),
+}
+SIX_META_KEYS = ('Name', 'Average')
+
+
+def to_float(val, default=None):
+    if val is None or isinstance(val, bool):
+        return default
+    try:
+        return float(str(val).replace('%', '').replace(',', '').strip())
+    except ValueError:
+        return default
+
+
+def to_pct(val):
+    num = to_float(val)
+    return None if num is None else num / 100
+
+
+def extract_hot_fields(raw):
+    per = (raw or {}).get('PER_Analysis') or {}
+    fields = {}
+    for name, (key, is_pct) in HOT_FIELDS.items():
+        fields[name] = to_pct(per.get(key)) if is_pct else to_float(per.get(key))
+    six = (raw or {}).get('Six_Indicators') or {}
+    fields['six_average'] = to_float(six.get('Average')) if isinstance(six, dict) else None
+    return fields
+
+
+def extract_ratings(raw):
+    six = (raw or {}).get('Six_Indicators') or {}
+    if not isinstance(six, dict):
+        return {}
+    ratings = {}
+    for factor, item in six.items():
+        if factor in SIX_META_KEYS or not isinstance(item, dict):
+            continue
+        rating = str(item.get('Rating') or '').strip()
+        if rating:
+            ratings[str(factor)[:50]] = rating[:5]
+    return ratings
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+    StockRating = apps.get_model('stock_app', 'StockRating')
+
+    batch = []
+    ratings = []
+    fields = None
+    for obj in StockData.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        hot = extract_hot_fields(obj.raw_data)
+        fields = list(hot)
+        for name, value in hot.items():
+            setattr(obj, name, value)
+        batch.append(obj)
+        ratings.extend(
+            StockRating(stock_id=obj.pk, factor=factor, rating=rating)
+            for factor, rating in extract_ratings(obj.raw_data).items()
+        )
+        if len(batch) >= BATCH_SIZE:
+            StockData.objects.bulk_update(batch, fields)
+            StockRating.objects.bulk_create(ratings, ignore_conflicts=True)
+            batch, ratings = [], []
+    if batch:
+        StockData.objects.bulk_update(batch, fields)
+        StockRating.objects.bulk_create(ratings, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0003_stock_hot_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0004_backfill_hot_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_id', models.CharField(max_length=10, unique=True, verbose_name='股票代碼')),
+                ('stock_name', models.CharField(db_index=True, max_length=50, verbose_name='股票名稱')),
+                ('latest_year', models.IntegerField(verbose_name='最新資料年份')),
+                ('latest_month', models.IntegerField(verbose_name='最新資料月份')),
+            ],
+            options={
+                'verbose_name': '股票目錄',
+                'ordering': ['stock_id'],
+            },
+        ),
+    ]
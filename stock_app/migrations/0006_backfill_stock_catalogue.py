@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+    Stock = apps.get_model('stock_app', 'Stock')
+
+    # 依年月由新到舊掃過，每檔保留第一次出現 (最新) 的名稱與年月
+    latest = {}
+    rows = StockData.objects.order_by('-data_year', '-data_month').values_list(
+        'stock_id', 'stock_name', 'data_year', 'data_month')
+    for sid, name, year, month in rows.iterator(chunk_size=2000):
+        if sid not in latest:
+            latest[sid] = Stock(stock_id=sid, stock_name=name, latest_year=year, latest_month=month)
+    Stock.objects.bulk_create(latest.values(), batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0005_stock_catalogue'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
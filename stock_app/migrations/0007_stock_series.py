@@ -0,0 +1,30 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0006_backfill_stock_catalogue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSeries',
+            fields=[
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='series', serialize=False, to='stock_app.stockdata', verbose_name='股票資料')),
+                ('h', models.BinaryField(default=b'', verbose_name='歷年最高價')),
+                ('l', models.BinaryField(default=b'', verbose_name='歷年最低價')),
+                ('eps', models.BinaryField(default=b'', verbose_name='歷年 EPS')),
+                ('pe_h', models.BinaryField(default=b'', verbose_name='歷年最高本益比')),
+                ('pe_l', models.BinaryField(default=b'', verbose_name='歷年最低本益比')),
+                ('rev_vals', models.BinaryField(default=b'', verbose_name='月營收')),
+                ('net_vals', models.BinaryField(default=b'', verbose_name='季淨利率 (小數)')),
+            ],
+            options={
+                'verbose_name': '歷史序列',
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+import numpy as np
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# 以下為撰寫此遷移時 stock_app.series 的打包邏輯 (固定下來，不隨之後的修改變動)
+SERIES_FIELDS = {
+    'h': ('H', False),
+    'l': ('L', False),
+    'eps': ('EPS', False),
+    'pe_h': ('PE_H', False),
+    'pe_l': ('PE_L', False),
+    'rev_vals': ('Rev_Vals', False),
+    'net_vals': ('Net_Vals', True),
+}
+DTYPE = np.dtype('<f8')
+
+
+def to_float(val, default=None):
+    if val is None or isinstance(val, bool):
+        return default
+    try:
+        return float(str(val).replace('%', '').replace(',', '').strip())
+    except ValueError:
+        return default
+
+
+def pack(values, is_pct=False):
+    if not isinstance(values, (list, tuple)):
+        return b''
+    arr = np.array([to_float(v, np.nan) for v in values], dtype=DTYPE)
+    if is_pct:
+        arr /= 100
+    return arr.tobytes()
+
+
+def extract_series(raw):
+    per = (raw or {}).get('PER_Analysis') or {}
+    return {name: pack(per.get(key), is_pct) for name, (key, is_pct) in SERIES_FIELDS.items()}
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+    StockSeries = apps.get_model('stock_app', 'StockSeries')
+
+    batch = []
+    qs = StockData.objects.order_by('pk').values_list('pk', 'raw_data')
+    for pk, raw in qs.iterator(chunk_size=BATCH_SIZE):
+        batch.append(StockSeries(stock_id=pk, **extract_series(raw)))
+        if len(batch) >= BATCH_SIZE:
+            StockSeries.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        StockSeries.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0007_stock_series'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
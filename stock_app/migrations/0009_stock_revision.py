@@ -0,0 +1,42 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0008_backfill_stock_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockRevision',
+            fields=[
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='revision', serialize=False, to='stock_app.stockdata', verbose_name='股票資料')),
+                ('code', models.CharField(max_length=10, verbose_name='股票代碼')),
+                ('data_year', models.IntegerField(verbose_name='資料年份')),
+                ('data_month', models.IntegerField(verbose_name='資料月份')),
+                ('prev_year', models.IntegerField(blank=True, null=True, verbose_name='比較年份')),
+                ('prev_month', models.IntegerField(blank=True, null=True, verbose_name='比較月份')),
+                ('total_eps_est', models.FloatField(blank=True, null=True, verbose_name='全年 EPS (估)')),
+                ('q4_eps_est', models.FloatField(blank=True, null=True, verbose_name='Q4 EPS (估)')),
+                ('pe_use_h', models.FloatField(blank=True, null=True, verbose_name='使用本益比 (高)')),
+                ('pe_use_l', models.FloatField(blank=True, null=True, verbose_name='使用本益比 (低)')),
+                ('target_h', models.FloatField(blank=True, null=True, verbose_name='目標價 (高)')),
+                ('target_l', models.FloatField(blank=True, null=True, verbose_name='目標價 (低)')),
+                ('total_eps_est_delta', models.FloatField(blank=True, null=True, verbose_name='全年 EPS 變動')),
+                ('eps_delta_pct', models.FloatField(blank=True, null=True, verbose_name='全年 EPS 變動 (小數)')),
+                ('q4_eps_est_delta', models.FloatField(blank=True, null=True, verbose_name='Q4 EPS 變動')),
+                ('pe_use_h_delta', models.FloatField(blank=True, null=True, verbose_name='本益比 (高) 變動')),
+                ('pe_use_l_delta', models.FloatField(blank=True, null=True, verbose_name='本益比 (低) 變動')),
+                ('target_h_delta', models.FloatField(blank=True, null=True, verbose_name='目標價 (高) 變動')),
+                ('target_l_delta', models.FloatField(blank=True, null=True, verbose_name='目標價 (低) 變動')),
+            ],
+            options={
+                'verbose_name': '預估修正',
+                'indexes': [models.Index(fields=['code', 'data_year', 'data_month'], name='revision_code_idx'), models.Index(fields=['data_year', 'data_month', 'total_eps_est_delta'], name='revision_eps_delta_idx'), models.Index(fields=['data_year', 'data_month', 'eps_delta_pct'], name='revision_eps_pct_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# 以下為撰寫此遷移時 stock_app.revisions 的計算邏輯 (固定下來，不隨之後的修改變動)
+REVISION_FIELDS = {
+    'total_eps_est': 'Total_EPS_Est',
+    'q4_eps_est': 'Q4_EPS_Est',
+    'pe_use_h': 'PE_Use_H',
+    'pe_use_l': 'PE_Use_L',
+    'target_h': 'Target_H',
+    'target_l': 'Target_L',
+}
+DELTA_FIELDS = [f'{name}_delta' for name in REVISION_FIELDS] + ['eps_delta_pct']
+UPDATE_FIELDS = ['code', 'data_year', 'data_month', 'prev_year', 'prev_month'] + list(REVISION_FIELDS) + DELTA_FIELDS
+
+
+def to_float(val, default=None):
+    if val is None or isinstance(val, bool):
+        return default
+    try:
+        return float(str(val).replace('%', '').replace(',', '').strip())
+    except ValueError:
+        return default
+
+
+def extract_values(raw):
+    per = (raw or {}).get('PER_Analysis') or {}
+    return {name: to_float(per.get(key)) for name, key in REVISION_FIELDS.items()}
+
+
+def compute_deltas(cur, prev):
+    out = dict.fromkeys(DELTA_FIELDS)
+    if prev is None:
+        return out
+    for name in REVISION_FIELDS:
+        if cur.get(name) is not None and prev.get(name) is not None:
+            out[f'{name}_delta'] = round(cur[name] - prev[name], 4)
+    base = prev.get('total_eps_est')
+    if out['total_eps_est_delta'] is not None and base:
+        out['eps_delta_pct'] = round(out['total_eps_est_delta'] / abs(base), 6)
+    return out
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+    StockRevision = apps.get_model('stock_app', 'StockRevision')
+
+    def flush(batch):
+        StockRevision.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['stock'], update_fields=UPDATE_FIELDS)
+
+    # 依 (代碼, 年, 月) 順序掃過，每份快照與同一檔的上一份比較
+    batch = []
+    last_code = prev_period = prev_values = None
+    qs = StockData.objects.order_by('stock_id', 'data_year', 'data_month').values_list(
+        'pk', 'stock_id', 'data_year', 'data_month', 'raw_data')
+    for pk, code, y, m, raw in qs.iterator(chunk_size=BATCH_SIZE):
+        if code != last_code:
+            last_code, prev_period, prev_values = code, None, None
+        values = extract_values(raw)
+        batch.append(StockRevision(
+            stock_id=pk, code=code, data_year=y, data_month=m,
+            prev_year=prev_period[0] if prev_period else None,
+            prev_month=prev_period[1] if prev_period else None,
+            **values, **compute_deltas(values, prev_values),
+        ))
+        prev_period, prev_values = (y, m), values
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0009_stock_revision'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
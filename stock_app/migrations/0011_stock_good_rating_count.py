@@ -0,0 +1,22 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0010_backfill_stock_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockdata',
+            name='good_rating_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='A 級以上指標數'),
+        ),
+        migrations.AddIndex(
+            model_name='stockdata',
+            index=models.Index(fields=['data_year', 'data_month', 'good_rating_count'], name='stock_period_good_idx'),
+        ),
+    ]
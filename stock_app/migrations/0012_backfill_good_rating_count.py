@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# 撰寫此遷移時 stock_app.parsing.GOOD_RATINGS 的值
+GOOD_RATINGS = ('AAA', 'AA', 'A')
+
+
+def backfill(apps, schema_editor):
+    # 直接由已建好的 StockRating 計算，不必重新解析 raw_data
+    StockData = apps.get_model('stock_app', 'StockData')
+    StockRating = apps.get_model('stock_app', 'StockRating')
+    good = (
+        StockRating.objects.filter(stock=OuterRef('pk'), rating__in=GOOD_RATINGS)
+        .order_by().values('stock').annotate(n=Count('pk')).values('n')
+    )
+    StockData.objects.update(good_rating_count=Coalesce(Subquery(good), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0011_stock_good_rating_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
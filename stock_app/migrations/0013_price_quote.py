@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0012_backfill_good_rating_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_id', models.CharField(max_length=10, verbose_name='股票代碼')),
+                ('quote_date', models.DateField(verbose_name='報價日期')),
+                ('price', models.FloatField(verbose_name='價格')),
+                ('source', models.CharField(max_length=20, verbose_name='來源')),
+                ('fetched_at', models.DateTimeField(auto_now=True, verbose_name='抓取時間')),
+            ],
+            options={
+                'verbose_name': '股價紀錄',
+                'unique_together': {('stock_id', 'quote_date')},
+            },
+        ),
+    ]
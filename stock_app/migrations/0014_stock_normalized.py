@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0013_price_quote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_rejected',
+            field=models.IntegerField(default=0, verbose_name='驗證失敗筆數'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='normalized',
+            field=models.JSONField(blank=True, default=dict, verbose_name='正規化數值'),
+        ),
+    ]
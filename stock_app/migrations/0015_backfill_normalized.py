@@ -0,0 +1,64 @@
+import math
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# 以下為撰寫此遷移時 stock_app.parsing 的正規化邏輯 (固定下來，不隨之後的修改變動)
+PER_NUMERIC_KEYS = {
+    'Now_Price': False, 'Predict_Rev': False, 'Predict_EPS': False,
+    'YoY_Use': True, 'Net_Avg': True, 'Capital': False,
+    'PE_Use_H': False, 'PE_Use_L': False, 'Target_H': False, 'Target_L': False, 'Profit': True,
+    'Total_EPS_Est': False, 'Q4_EPS_Est': False,
+    'EPS_Q1': False, 'EPS_Q2': False, 'EPS_Q3': False, 'Q4_Rev_Actual': False,
+}
+
+
+def to_float(val, default=None):
+    if val is None or isinstance(val, bool):
+        return default
+    try:
+        return float(str(val).replace('%', '').replace(',', '').strip())
+    except ValueError:
+        return default
+
+
+def normalize_raw(raw):
+    per = (raw or {}).get('PER_Analysis')
+    if not isinstance(per, dict):
+        return {}
+    normalized = {}
+    for key, is_pct in PER_NUMERIC_KEYS.items():
+        val = per.get(key)
+        if val is None or val == '':
+            continue
+        num = to_float(val)
+        if num is not None and math.isfinite(num):
+            normalized[key] = num / 100 if is_pct else num
+    return normalized
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+
+    batch = []
+    qs = StockData.objects.order_by('pk').only('pk', 'raw_data')
+    for obj in qs.iterator(chunk_size=BATCH_SIZE):
+        obj.normalized = normalize_raw(obj.raw_data)
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            StockData.objects.bulk_update(batch, ['normalized'])
+            batch = []
+    if batch:
+        StockData.objects.bulk_update(batch, ['normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0014_stock_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
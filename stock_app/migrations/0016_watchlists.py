@@ -0,0 +1,71 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0015_backfill_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watchlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='名稱')),
+                ('sim_yoy', models.FloatField(blank=True, null=True, verbose_name='試算 YoY')),
+                ('sim_net', models.FloatField(blank=True, null=True, verbose_name='試算淨利率')),
+                ('sim_pe_h', models.FloatField(blank=True, null=True, verbose_name='試算本益比 (高)')),
+                ('sim_pe_l', models.FloatField(blank=True, null=True, verbose_name='試算本益比 (低)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('valued_at', models.DateTimeField(blank=True, null=True, verbose_name='估值計算時間')),
+            ],
+            options={
+                'verbose_name': '自選清單',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WatchlistValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10, verbose_name='股票代碼')),
+                ('stock_name', models.CharField(blank=True, max_length=50, verbose_name='股票名稱')),
+                ('data_year', models.IntegerField(blank=True, null=True, verbose_name='資料年份')),
+                ('data_month', models.IntegerField(blank=True, null=True, verbose_name='資料月份')),
+                ('price', models.FloatField(blank=True, null=True, verbose_name='股價')),
+                ('price_source', models.CharField(blank=True, max_length=20, verbose_name='股價來源')),
+                ('price_as_of', models.DateField(blank=True, null=True, verbose_name='股價日期')),
+                ('eps', models.FloatField(blank=True, null=True, verbose_name='模擬 EPS')),
+                ('target_h', models.FloatField(blank=True, null=True, verbose_name='目標價 (高)')),
+                ('target_l', models.FloatField(blank=True, null=True, verbose_name='目標價 (低)')),
+                ('upside', models.FloatField(blank=True, null=True, verbose_name='上檔空間')),
+                ('downside', models.FloatField(blank=True, null=True, verbose_name='下檔空間')),
+                ('rr', models.FloatField(blank=True, null=True, verbose_name='風險報酬比')),
+                ('computed_at', models.DateTimeField(verbose_name='計算時間')),
+                ('watchlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='stock_app.watchlist', verbose_name='自選清單')),
+            ],
+            options={
+                'verbose_name': '自選股估值',
+                'ordering': ['code'],
+                'unique_together': {('watchlist', 'code')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WatchlistItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(db_index=True, max_length=10, verbose_name='股票代碼')),
+                ('added_at', models.DateTimeField(auto_now_add=True, verbose_name='加入時間')),
+                ('watchlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='stock_app.watchlist', verbose_name='自選清單')),
+            ],
+            options={
+                'verbose_name': '自選股',
+                'ordering': ['code'],
+                'unique_together': {('watchlist', 'code')},
+            },
+        ),
+    ]
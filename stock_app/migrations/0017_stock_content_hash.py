@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0016_watchlists'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('full', '完整資料'), ('patch', '差異更新')], default='full', max_length=10, verbose_name='匯入模式'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_skipped',
+            field=models.IntegerField(default=0, verbose_name='未變更筆數'),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='內容雜湊'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def content_hash(raw):
+    # 撰寫此遷移時的 stock_app.parsing.content_hash (兩者須一致，匯入才能比對出未變更的資料列)
+    text = json.dumps(raw, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def backfill(apps, schema_editor):
+    StockData = apps.get_model('stock_app', 'StockData')
+
+    batch = []
+    qs = StockData.objects.order_by('pk').only('pk', 'raw_data')
+    for obj in qs.iterator(chunk_size=BATCH_SIZE):
+        obj.content_hash = content_hash(obj.raw_data)
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            StockData.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        StockData.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0017_stock_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_app', '0018_backfill_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最後進度時間'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+from .parsing import HOT_FIELDS, content_hash, extract_hot_fields, normalize_raw
+
 class StockData(models.Model):
     # 移除 primary_key=True，改用預設 ID
     stock_id = models.CharField(max_length=10, verbose_name="股票代碼")
@@ -11,12 +13,259 @@ class StockData(models.Model):
     
     update_date = models.DateField(auto_now=True, verbose_name="上傳日期")
     raw_data = models.JSONField(verbose_name="完整分析數據")
+    # PER_Analysis 數值欄位的正規化結果 (浮點數，百分比為小數)；匯入時驗證後寫入，讀取時不再解析字串
+    normalized = models.JSONField(default=dict, blank=True, verbose_name="正規化數值")
+    # raw_data 的雜湊：重新上傳時內容相同就跳過，也作為儀表板快取的版本
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name="內容雜湊")
+
+    # 從 raw_data 抽出的常用欄位 (匯入時寫入)，篩選/排序可直接走索引，不必解析 JSON
+    total_eps_est = models.FloatField(null=True, blank=True, verbose_name="全年 EPS (估)")
+    pe_use_h = models.FloatField(null=True, blank=True, verbose_name="本益比 (高)")
+    pe_use_l = models.FloatField(null=True, blank=True, verbose_name="本益比 (低)")
+    capital = models.FloatField(null=True, blank=True, verbose_name="股本 (億)")
+    predict_rev = models.FloatField(null=True, blank=True, verbose_name="預估營收 (億)")
+    yoy_use = models.FloatField(null=True, blank=True, verbose_name="營收年增率")  # 小數，0.05 = 5%
+    net_avg = models.FloatField(null=True, blank=True, verbose_name="平均淨利率")  # 小數
+    six_average = models.FloatField(null=True, blank=True, verbose_name="六大指標總評分")
+    good_rating_count = models.PositiveSmallIntegerField(default=0, verbose_name="A 級以上指標數")
 
     class Meta:
         # 設定聯合約束：同一股票、同一年、同一月，只能有一筆資料
         # 如果重複上傳同一個月的資料，會執行更新
         unique_together = ('stock_id', 'data_year', 'data_month')
+        indexes = [
+            models.Index(fields=['data_year', 'data_month', 'total_eps_est'], name='stock_period_eps_idx'),
+            models.Index(fields=['data_year', 'data_month', 'pe_use_h'], name='stock_period_pe_h_idx'),
+            models.Index(fields=['data_year', 'data_month', 'pe_use_l'], name='stock_period_pe_l_idx'),
+            models.Index(fields=['data_year', 'data_month', 'yoy_use'], name='stock_period_yoy_idx'),
+            models.Index(fields=['data_year', 'data_month', 'six_average'], name='stock_period_six_idx'),
+            models.Index(fields=['data_year', 'data_month', 'good_rating_count'], name='stock_period_good_idx'),
+        ]
         verbose_name = "股票歷史數據"
 
     def __str__(self):
-        return f"{self.stock_id} {self.stock_name} ({self.data_year}/{self.data_month})"
\ No newline at end of file
+        return f"{self.stock_id} {self.stock_name} ({self.data_year}/{self.data_month})"
+
+    def fill_hot_fields(self, normalized=None):
+        """normalized 為匯入時驗證得到的結果；未提供時由 raw_data 重新計算。"""
+        self.normalized = normalized if normalized is not None else normalize_raw(self.raw_data)
+        self.content_hash = content_hash(self.raw_data)
+        for name, value in extract_hot_fields(self.raw_data, self.normalized).items():
+            setattr(self, name, value)
+
+    def save(self, *args, **kwargs):
+        self.fill_hot_fields()
+        super().save(*args, **kwargs)
+
+
+HOT_FIELD_NAMES = list(HOT_FIELDS) + ['six_average', 'good_rating_count']
+
+
+class Stock(models.Model):
+    # 股票目錄：每檔一筆，不隨歷史月份增加 (匯入時更新)
+    stock_id = models.CharField(max_length=10, unique=True, verbose_name="股票代碼")
+    stock_name = models.CharField(max_length=50, db_index=True, verbose_name="股票名稱")
+    latest_year = models.IntegerField(verbose_name="最新資料年份")
+    latest_month = models.IntegerField(verbose_name="最新資料月份")
+
+    class Meta:
+        ordering = ['stock_id']
+        verbose_name = "股票目錄"
+
+    def __str__(self):
+        return f"{self.stock_id} {self.stock_name}"
+
+
+class StockRating(models.Model):
+    # 六大指標評等 (每檔每月每個指標一筆)，供跨股票篩選使用
+    stock = models.ForeignKey(StockData, on_delete=models.CASCADE, related_name='ratings', verbose_name="股票資料")
+    factor = models.CharField(max_length=50, verbose_name="指標")
+    rating = models.CharField(max_length=5, verbose_name="評等")
+
+    class Meta:
+        unique_together = ('stock', 'factor')
+        indexes = [models.Index(fields=['factor', 'rating'], name='rating_factor_idx')]
+        verbose_name = "六大指標評等"
+
+    def __str__(self):
+        return f"#{self.stock_id} {self.factor}: {self.rating}"
+
+class StockSeries(models.Model):
+    # raw_data 內各陣列的二進位欄位 (float64 little-endian)，由 stock_app.series 讀寫
+    # 讀取時直接 np.frombuffer，不需解析 JSON 或逐筆轉換字串
+    stock = models.OneToOneField(StockData, on_delete=models.CASCADE, primary_key=True, related_name='series', verbose_name="股票資料")
+    h = models.BinaryField(default=b'', verbose_name="歷年最高價")
+    l = models.BinaryField(default=b'', verbose_name="歷年最低價")
+    eps = models.BinaryField(default=b'', verbose_name="歷年 EPS")
+    pe_h = models.BinaryField(default=b'', verbose_name="歷年最高本益比")
+    pe_l = models.BinaryField(default=b'', verbose_name="歷年最低本益比")
+    rev_vals = models.BinaryField(default=b'', verbose_name="月營收")
+    net_vals = models.BinaryField(default=b'', verbose_name="季淨利率 (小數)")
+
+    class Meta:
+        verbose_name = "歷史序列"
+
+    def __str__(self):
+        return f"#{self.stock_id} series"
+
+class StockRevision(models.Model):
+    # 與同一檔上一份快照相比的修正幅度；匯入時計算 (stock_app.revisions)
+    stock = models.OneToOneField(StockData, on_delete=models.CASCADE, primary_key=True, related_name='revision', verbose_name="股票資料")
+    code = models.CharField(max_length=10, verbose_name="股票代碼")
+    data_year = models.IntegerField(verbose_name="資料年份")
+    data_month = models.IntegerField(verbose_name="資料月份")
+    prev_year = models.IntegerField(null=True, blank=True, verbose_name="比較年份")
+    prev_month = models.IntegerField(null=True, blank=True, verbose_name="比較月份")
+
+    # 本期數值
+    total_eps_est = models.FloatField(null=True, blank=True, verbose_name="全年 EPS (估)")
+    q4_eps_est = models.FloatField(null=True, blank=True, verbose_name="Q4 EPS (估)")
+    pe_use_h = models.FloatField(null=True, blank=True, verbose_name="使用本益比 (高)")
+    pe_use_l = models.FloatField(null=True, blank=True, verbose_name="使用本益比 (低)")
+    target_h = models.FloatField(null=True, blank=True, verbose_name="目標價 (高)")
+    target_l = models.FloatField(null=True, blank=True, verbose_name="目標價 (低)")
+
+    # 與上一份快照的差額
+    total_eps_est_delta = models.FloatField(null=True, blank=True, verbose_name="全年 EPS 變動")
+    eps_delta_pct = models.FloatField(null=True, blank=True, verbose_name="全年 EPS 變動 (小數)")
+    q4_eps_est_delta = models.FloatField(null=True, blank=True, verbose_name="Q4 EPS 變動")
+    pe_use_h_delta = models.FloatField(null=True, blank=True, verbose_name="本益比 (高) 變動")
+    pe_use_l_delta = models.FloatField(null=True, blank=True, verbose_name="本益比 (低) 變動")
+    target_h_delta = models.FloatField(null=True, blank=True, verbose_name="目標價 (高) 變動")
+    target_l_delta = models.FloatField(null=True, blank=True, verbose_name="目標價 (低) 變動")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['code', 'data_year', 'data_month'], name='revision_code_idx'),
+            models.Index(fields=['data_year', 'data_month', 'total_eps_est_delta'], name='revision_eps_delta_idx'),
+            models.Index(fields=['data_year', 'data_month', 'eps_delta_pct'], name='revision_eps_pct_idx'),
+        ]
+        verbose_name = "預估修正"
+
+    def __str__(self):
+        return f"{self.code} ({self.data_year}/{self.data_month}) EPS {self.total_eps_est_delta}"
+
+class PriceQuote(models.Model):
+    # 每日最後抓到的股價 (stock_app.pricing)；即時來源失敗時以最新一筆作為備援
+    stock_id = models.CharField(max_length=10, verbose_name="股票代碼")
+    quote_date = models.DateField(verbose_name="報價日期")
+    price = models.FloatField(verbose_name="價格")
+    source = models.CharField(max_length=20, verbose_name="來源")
+    fetched_at = models.DateTimeField(auto_now=True, verbose_name="抓取時間")
+
+    class Meta:
+        unique_together = ('stock_id', 'quote_date')
+        verbose_name = "股價紀錄"
+
+    def __str__(self):
+        return f"{self.stock_id} {self.quote_date}: {self.price} ({self.source})"
+
+class Watchlist(models.Model):
+    # 自選清單；成員的估值由 stock_app.watchlists 預先計算到 WatchlistValuation
+    name = models.CharField(max_length=50, unique=True, verbose_name="名稱")
+    # 試算參數 (空白表示沿用各檔原始值)；yoy / net 為小數
+    sim_yoy = models.FloatField(null=True, blank=True, verbose_name="試算 YoY")
+    sim_net = models.FloatField(null=True, blank=True, verbose_name="試算淨利率")
+    sim_pe_h = models.FloatField(null=True, blank=True, verbose_name="試算本益比 (高)")
+    sim_pe_l = models.FloatField(null=True, blank=True, verbose_name="試算本益比 (低)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    valued_at = models.DateTimeField(null=True, blank=True, verbose_name="估值計算時間")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "自選清單"
+
+    def __str__(self):
+        return self.name
+
+class WatchlistItem(models.Model):
+    watchlist = models.ForeignKey(Watchlist, on_delete=models.CASCADE, related_name='items', verbose_name="自選清單")
+    code = models.CharField(max_length=10, db_index=True, verbose_name="股票代碼")
+    added_at = models.DateTimeField(auto_now_add=True, verbose_name="加入時間")
+
+    class Meta:
+        unique_together = ('watchlist', 'code')
+        ordering = ['code']
+        verbose_name = "自選股"
+
+    def __str__(self):
+        return f"{self.watchlist_id}:{self.code}"
+
+class WatchlistValuation(models.Model):
+    # 預先算好的估值；開啟清單時只讀這張表 (watchlist 外鍵索引)
+    watchlist = models.ForeignKey(Watchlist, on_delete=models.CASCADE, related_name='valuations', verbose_name="自選清單")
+    code = models.CharField(max_length=10, verbose_name="股票代碼")
+    stock_name = models.CharField(max_length=50, blank=True, verbose_name="股票名稱")
+    data_year = models.IntegerField(null=True, blank=True, verbose_name="資料年份")
+    data_month = models.IntegerField(null=True, blank=True, verbose_name="資料月份")
+    price = models.FloatField(null=True, blank=True, verbose_name="股價")
+    price_source = models.CharField(max_length=20, blank=True, verbose_name="股價來源")
+    price_as_of = models.DateField(null=True, blank=True, verbose_name="股價日期")
+    eps = models.FloatField(null=True, blank=True, verbose_name="模擬 EPS")
+    target_h = models.FloatField(null=True, blank=True, verbose_name="目標價 (高)")
+    target_l = models.FloatField(null=True, blank=True, verbose_name="目標價 (低)")
+    upside = models.FloatField(null=True, blank=True, verbose_name="上檔空間")   # 小數
+    downside = models.FloatField(null=True, blank=True, verbose_name="下檔空間")  # 小數
+    rr = models.FloatField(null=True, blank=True, verbose_name="風險報酬比")
+    computed_at = models.DateTimeField(verbose_name="計算時間")
+
+    class Meta:
+        unique_together = ('watchlist', 'code')
+        ordering = ['code']
+        verbose_name = "自選股估值"
+
+    def __str__(self):
+        return f"{self.watchlist_id}:{self.code} EPS {self.eps}"
+
+class ImportJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    MODE_FULL = 'full'
+    MODE_PATCH = 'patch'
+    MODE_CHOICES = [
+        (MODE_FULL, '完整資料'),
+        (MODE_PATCH, '差異更新'),
+    ]
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, '排隊中'),
+        (STATUS_RUNNING, '匯入中'),
+        (STATUS_DONE, '完成'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    # 上傳檔先落地，再交給背景 worker 處理
+    upload = models.FileField(upload_to='imports/%Y%m/', verbose_name="上傳檔案")
+    original_name = models.CharField(max_length=255, blank=True, verbose_name="原始檔名")
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default=MODE_FULL, verbose_name="匯入模式")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True, verbose_name="狀態")
+
+    # 進度 (每批寫入後更新)
+    bytes_total = models.BigIntegerField(default=0, verbose_name="檔案大小")
+    bytes_done = models.BigIntegerField(default=0, verbose_name="已讀取大小")
+    rows_done = models.IntegerField(default=0, verbose_name="已處理筆數")
+    rows_inserted = models.IntegerField(default=0, verbose_name="新增筆數")
+    rows_updated = models.IntegerField(default=0, verbose_name="更新筆數")
+    rows_rejected = models.IntegerField(default=0, verbose_name="驗證失敗筆數")
+    rows_skipped = models.IntegerField(default=0, verbose_name="未變更筆數")
+    rows_per_sec = models.FloatField(default=0, verbose_name="每秒筆數")
+    errors = models.JSONField(default=list, blank=True, verbose_name="錯誤訊息")
+
+    # 匯入結果：供前端帶入查詢表單
+    result_year = models.IntegerField(null=True, blank=True, verbose_name="資料年份")
+    result_month = models.IntegerField(null=True, blank=True, verbose_name="資料月份")
+    first_stock_id = models.CharField(max_length=10, blank=True, verbose_name="第一檔股票")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始時間")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成時間")
+    # 執行中每批寫入後更新；太久沒更新表示執行的行程已經不在 (見 jobs.reap_stale_job)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="最後進度時間")
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = "匯入工作"
+
+    def __str__(self):
+        return f"#{self.pk} {self.original_name} ({self.status})"
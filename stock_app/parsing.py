@@ -0,0 +1,122 @@
+import hashlib
+import json
+
+# =========================================================
+# 數值解析：上傳 JSON 內的字串 ('12.5%'、'1,234') 轉為浮點數
+# =========================================================
+
+# 反正規化欄位：StockData 欄位名稱 -> (PER_Analysis key, 是否為百分比)
+HOT_FIELDS = {
+    'total_eps_est': ('Total_EPS_Est', False),
+    'pe_use_h': ('PE_Use_H', False),
+    'pe_use_l': ('PE_Use_L', False),
+    'capital': ('Capital', False),
+    'predict_rev': ('Predict_Rev', False),
+    'yoy_use': ('YoY_Use', True),
+    'net_avg': ('Net_Avg', True),
+}
+
+# PER_Analysis 的純量數值欄位 -> 是否為百分比；匯入時一次轉為浮點數存入 StockData.normalized
+# (百分比存小數，0.05 = 5%)，之後的讀取路徑不再解析字串
+PER_NUMERIC_KEYS = {
+    'Now_Price': False, 'Predict_Rev': False, 'Predict_EPS': False,
+    'YoY_Use': True, 'Net_Avg': True, 'Capital': False,
+    'PE_Use_H': False, 'PE_Use_L': False, 'Target_H': False, 'Target_L': False, 'Profit': True,
+    'Total_EPS_Est': False, 'Q4_EPS_Est': False,
+    'EPS_Q1': False, 'EPS_Q2': False, 'EPS_Q3': False, 'Q4_Rev_Actual': False,
+}
+
+# 六大指標中不是評等項目的 key
+SIX_META_KEYS = ('Name', 'Average')
+
+# 視為「好」的評等 (選股器的 good_rating_count)
+GOOD_RATINGS = ('AAA', 'AA', 'A')
+
+
+def to_float(val, default=None):
+    """無法轉換時回傳 default (不拋錯)。"""
+    if val is None or isinstance(val, bool):
+        return default
+    try:
+        return float(str(val).replace('%', '').replace(',', '').strip())
+    except ValueError:
+        return default
+
+
+def to_pct(val, default=None):
+    num = to_float(val)
+    return default if num is None else num / 100
+
+
+def normalize_per(per):
+    """
+    回傳 (normalized, bad_keys)：normalized 只含能轉為數字的欄位，
+    bad_keys 為有值但無法轉換的欄位 (缺欄位不算)。
+    """
+    normalized, bad_keys = {}, []
+    for key, is_pct in PER_NUMERIC_KEYS.items():
+        val = per.get(key)
+        if val is None or val == '':
+            continue
+        num = to_pct(val) if is_pct else to_float(val)
+        if num is None or num != num or num in (float('inf'), float('-inf')):
+            bad_keys.append(key)
+        else:
+            normalized[key] = num
+    return normalized, bad_keys
+
+
+def normalize_raw(raw):
+    per = (raw or {}).get('PER_Analysis')
+    return normalize_per(per)[0] if isinstance(per, dict) else {}
+
+
+def extract_hot_fields(raw, normalized=None):
+    """normalized 為 normalize_raw(raw) 的結果；未提供時在此計算。"""
+    if normalized is None:
+        normalized = normalize_raw(raw)
+    fields = {name: normalized.get(key) for name, (key, _) in HOT_FIELDS.items()}
+    six = (raw or {}).get('Six_Indicators') or {}
+    fields['six_average'] = to_float(six.get('Average')) if isinstance(six, dict) else None
+    fields['good_rating_count'] = sum(1 for r in extract_ratings(raw).values() if r in GOOD_RATINGS)
+    return fields
+
+
+def extract_ratings(raw):
+    """回傳 {指標名稱: 評等}，例如 {'獲利能力': 'AA'}。"""
+    six = (raw or {}).get('Six_Indicators') or {}
+    if not isinstance(six, dict):
+        return {}
+    ratings = {}
+    for factor, item in six.items():
+        if factor in SIX_META_KEYS or not isinstance(item, dict):
+            continue
+        rating = str(item.get('Rating') or '').strip()
+        if rating:
+            ratings[str(factor)[:50]] = rating[:5]
+    return ratings
+
+
+# =========================================================
+# 內容雜湊與差異更新
+# =========================================================
+def content_hash(raw):
+    """raw_data 的 SHA-256 (key 排序後序列化，與資料庫的 key 順序無關)。"""
+    text = json.dumps(raw, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def merge_patch(base, patch):
+    """
+    JSON Merge Patch (RFC 7386)：物件逐層合併，其他型別 (含陣列) 直接取代，值為 null 表示刪除該 key。
+    不修改傳入的 base。
+    """
+    if not isinstance(patch, dict):
+        return patch
+    out = dict(base) if isinstance(base, dict) else {}
+    for key, val in patch.items():
+        if val is None:
+            out.pop(key, None)
+        else:
+            out[key] = merge_patch(out.get(key), val)
+    return out
@@ -0,0 +1,764 @@
+import asyncio
+import codecs
+import csv
+import datetime
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+
+# =========================================================
+# 即時股價服務：可替換的報價來源 (provider) + TTL/LRU 快取 + 同檔合併請求
+# 抓到的價格寫入 PriceQuote；來源失敗時改用最後一筆收盤價
+# =========================================================
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
+]
+
+PRICE_LABEL = '成交價'
+FALLBACK_UL_INDEX = 4
+FALLBACK_MIN_ULS = 7
+
+_CHARSET_RE = re.compile(rb'charset=["\']?([\w-]+)', re.I)
+
+
+def _parse_number(txt):
+    try:
+        return float(txt.replace(',', '').strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PriceParser(HTMLParser):
+    """
+    只追蹤 <ul> 與其中第一個 <li> 的文字，找到含「成交價」的 <ul> 後即停止，
+    不建立整棵 DOM 樹。找不到時沿用舊邏輯：取第 5 個 <ul> 的第一個 <li>。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.uls = []        # 依開啟順序紀錄每個 ul: {'li': 第一個 li 文字, 'match': 是否含成交價}
+        self._open = []      # 目前開啟中的 ul
+        self.match = None
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'ul':
+            rec = {'li': None, 'li_buf': None, 'text': [], 'match': False}
+            self.uls.append(rec)
+            self._open.append(rec)
+        elif tag == 'li':
+            for rec in self._open:
+                self._close_li(rec)
+                if rec['li'] is None and rec['li_buf'] is None:
+                    rec['li_buf'] = []
+        if self._open and any(PRICE_LABEL in (v or '') for _, v in attrs):
+            for rec in self._open:
+                rec['match'] = True
+
+    def handle_endtag(self, tag):
+        if tag == 'li':
+            for rec in self._open:
+                self._close_li(rec)
+        elif tag == 'ul' and self._open:
+            rec = self._open.pop()
+            self._close_li(rec)
+            if not rec['match']:
+                rec['match'] = PRICE_LABEL in ''.join(rec['text'])
+            rec['text'] = None
+            if rec['match'] and self._open:
+                self._open[-1]['match'] = True
+            if not self._open:
+                self._check_done()
+
+    def handle_data(self, data):
+        for rec in self._open:
+            rec['text'].append(data)
+            if rec['li_buf'] is not None:
+                rec['li_buf'].append(data)
+
+    @staticmethod
+    def _close_li(rec):
+        if rec['li_buf'] is not None:
+            rec['li'] = ''.join(rec['li_buf'])
+            rec['li_buf'] = None
+
+    def _check_done(self):
+        if self.match is None:
+            self.match = next((rec for rec in self.uls if rec['match']), None)
+        if self.match is not None:
+            # 找到成交價且數值有效即可停止；否則要等到足夠的 ul 才能走備援邏輯
+            if _parse_number(self.match['li'] or '') > 0 or len(self.uls) >= FALLBACK_MIN_ULS:
+                self.done = True
+
+    def price(self):
+        price = 0.0
+        if self.match is not None:
+            price = _parse_number(self.match['li'] or '')
+        if price == 0 and len(self.uls) >= FALLBACK_MIN_ULS:
+            price = _parse_number(self.uls[FALLBACK_UL_INDEX]['li'] or '')
+        return price if price > 0 else None
+
+
+def parse_price(html):
+    """解析整份 HTML 字串 (供測試與離線資料使用)。"""
+    parser = PriceParser()
+    parser.feed(html)
+    parser.close()
+    return parser.price()
+
+
+def _guess_encoding(response, first_chunk):
+    enc = None
+    if 'charset' in response.headers.get('Content-Type', '').lower():
+        enc = response.encoding
+    if not enc:
+        m = _CHARSET_RE.search(first_chunk[:4096])
+        enc = m.group(1).decode('ascii') if m else 'utf-8'
+    enc = enc.lower()
+    # big5 編碼頁面常含 cp950 擴充字
+    if enc in ('big5', 'big-5', 'x-big5'):
+        enc = 'cp950'
+    try:
+        codecs.lookup(enc)
+    except LookupError:
+        enc = 'utf-8'
+    return enc
+
+
+
+
+class QuoteError(Exception):
+    """報價來源連線失敗 (逾時、連不上、5xx)；查無此股票則回傳 None，不算失敗。"""
+
+
+# 視為來源失敗 (計入熔斷、改用最後收盤價) 的例外；其餘例外為程式錯誤，照常拋出
+FETCH_ERRORS = (QuoteError, httpx.HTTPError, requests.RequestException, ValueError)
+
+
+# =========================================================
+# 報價來源 (provider)
+#   fetch(stock_id)  -> 價格或 None；連線失敗時拋出 QuoteError
+#   afetch(stock_id) -> async 版 (預設丟到執行緒執行)
+# 由 settings.PRICE_PROVIDER 選擇：wearn / snapshot / fixture
+# =========================================================
+class QuoteProvider:
+    name = ''
+
+    def fetch(self, stock_id):
+        raise NotImplementedError
+
+    async def afetch(self, stock_id):
+        return await sync_to_async(self.fetch, thread_sensitive=False)(stock_id)
+
+    def as_of(self, stock_id):
+        """價格所屬的日期 (寫入 PriceQuote 用)。"""
+        return datetime.date.today()
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        """關閉目前事件迴圈上的非同步資源 (ASGI lifespan shutdown 時呼叫)。"""
+
+
+class WearnProvider(QuoteProvider):
+    """爬取 stock.wearn.com 個股頁 (串流解析，找到成交價即中斷)。"""
+    name = 'wearn'
+
+    def __init__(self, url_template=None, timeout=None, host_concurrency=None, async_client=None):
+        self.url_template = url_template or getattr(
+            settings, 'PRICE_URL_TEMPLATE', 'https://stock.wearn.com/a{stock_id}.html')
+        self.timeout = timeout or getattr(settings, 'PRICE_TIMEOUT', 5)
+        self.host_concurrency = host_concurrency or getattr(settings, 'PRICE_HOST_CONCURRENCY', 8)
+        self.async_client = getattr(settings, 'PRICE_ASYNC_CLIENT', False) if async_client is None else async_client
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.host_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._host_slots = {}         # host -> BoundedSemaphore (每個主機的同時連線上限)
+
+        # 事件迴圈 -> (AsyncClient, {host: asyncio.Semaphore})
+        self._loops = weakref.WeakKeyDictionary()
+
+    # ---------- 同步 ----------
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.host_concurrency)
+            return slot
+
+    def fetch(self, stock_id):
+        url = self.url_template.format(stock_id=stock_id)
+        with self._host_slot(url):
+            started = time.perf_counter()
+            price = None
+            try:
+                price = self._fetch_url(url)
+                return price
+            finally:
+                metrics.record_scrape(urlsplit(url).netloc, time.perf_counter() - started, price is not None)
+
+    def _fetch_url(self, url):
+        headers = {'User-Agent': random.choice(USER_AGENTS)}
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as r:
+                if r.status_code >= 500:
+                    raise QuoteError(f"HTTP {r.status_code}")
+                if r.status_code != 200:
+                    return None
+                parser = PriceParser()
+                decoder = None
+                for chunk in r.iter_content(chunk_size=16 * 1024):
+                    if decoder is None:
+                        decoder = codecs.getincrementaldecoder(_guess_encoding(r, chunk))(errors='replace')
+                    parser.feed(decoder.decode(chunk))
+                    if parser.done:
+                        break
+                else:
+                    if decoder is not None:
+                        parser.feed(decoder.decode(b'', final=True))
+                    parser.close()
+                return parser.price()
+        except requests.RequestException as e:
+            raise QuoteError(str(e)) from e
+
+    # ---------- async：httpx.AsyncClient 共用連線池 ----------
+    # AsyncClient 與 Semaphore 綁定事件迴圈，只在 ASGI (整個行程共用一個長駐迴圈) 下使用，
+    # 由 lifespan shutdown 呼叫 aclose 關閉。WSGI 下每個請求各自一個短命迴圈，
+    # 為此建立 client 只會在迴圈結束後留下未關閉的連線池，因此改走同步 Session (丟到執行緒執行)。
+    async def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout, follow_redirects=True,
+                limits=httpx.Limits(max_connections=max(self.host_concurrency * 2, 16),
+                                    max_keepalive_connections=self.host_concurrency),
+            )
+            state = self._loops[loop] = (client, {})
+        return state
+
+    async def aclose(self):
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+
+    async def afetch(self, stock_id):
+        if not self.async_client:
+            return await super().afetch(stock_id)
+        client, slots = await self._loop_state()
+        url = self.url_template.format(stock_id=stock_id)
+        host = urlsplit(url).netloc
+        slot = slots.get(host)
+        if slot is None:
+            slot = slots[host] = asyncio.Semaphore(self.host_concurrency)
+        async with slot:
+            started = time.perf_counter()
+            price = None
+            try:
+                price = await self._afetch_url(client, url)
+                return price
+            finally:
+                metrics.record_scrape(host, time.perf_counter() - started, price is not None)
+
+    async def _afetch_url(self, client, url):
+        headers = {'User-Agent': random.choice(USER_AGENTS)}
+        try:
+            async with client.stream('GET', url, headers=headers) as r:
+                if r.status_code >= 500:
+                    raise QuoteError(f"HTTP {r.status_code}")
+                if r.status_code != 200:
+                    return None
+                parser = PriceParser()
+                decoder = None
+                async for chunk in r.aiter_bytes(16 * 1024):
+                    if decoder is None:
+                        decoder = codecs.getincrementaldecoder(_guess_encoding(r, chunk))(errors='replace')
+                    parser.feed(decoder.decode(chunk))
+                    if parser.done:
+                        break
+                else:
+                    if decoder is not None:
+                        parser.feed(decoder.decode(b'', final=True))
+                    parser.close()
+                return parser.price()
+        except httpx.HTTPError as e:
+            raise QuoteError(str(e)) from e
+
+
+def read_snapshot(path):
+    """
+    讀取每日收盤價檔，回傳 {代碼: (價格, 日期或 None)}。
+      CSV : 需有 stock_id (或 代碼) 與 close (或 price / 收盤價) 欄，date 欄可省略
+      JSON: {"2330": 1050.0} 或 {"2330": {"close": 1050.0, "date": "2026-10-16"}} 或 [{"stock_id": ..., "close": ..., "date": ...}]
+    """
+    def parse_date(val):
+        try:
+            return datetime.date.fromisoformat(str(val)[:10]) if val else None
+        except ValueError:
+            return None
+
+    def row_item(row):
+        sid = str(row.get('stock_id') or row.get('代碼') or '').strip()
+        price = _parse_number(str(row.get('close') or row.get('price') or row.get('收盤價') or ''))
+        return sid, (price if price > 0 else None, parse_date(row.get('date') or row.get('日期')))
+
+    if str(path).lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            items = [
+                row_item(dict(v, stock_id=k)) if isinstance(v, dict) else row_item({'stock_id': k, 'close': v})
+                for k, v in data.items()
+            ]
+        else:
+            items = [row_item(row) for row in data if isinstance(row, dict)]
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            items = [row_item(row) for row in csv.DictReader(f)]
+    return {sid: item for sid, item in items if sid and item[0] is not None}
+
+
+def load_snapshot(path, quote_date=None, batch_size=1000):
+    """把收盤價檔整批寫入 PriceQuote (source='snapshot')，作為即時來源失敗時的備援；回傳筆數。"""
+    from .models import PriceQuote
+
+    default_date = quote_date or datetime.date.today()
+    rows = [
+        PriceQuote(stock_id=sid, quote_date=quote_date or as_of or default_date, price=price, source=SnapshotProvider.name)
+        for sid, (price, as_of) in read_snapshot(path).items()
+    ]
+    PriceQuote.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True,
+        unique_fields=['stock_id', 'quote_date'], update_fields=['price', 'source', 'fetched_at'],
+    )
+    return len(rows)
+
+
+class SnapshotProvider(QuoteProvider):
+    """本機的每日收盤價檔 (CSV / JSON)；檔案更新時自動重新載入。不需網路。"""
+    name = 'snapshot'
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'PRICE_SNAPSHOT_PATH', '')
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = {}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except (OSError, TypeError):
+            return {}
+        with self._lock:
+            if mtime != self._mtime:
+                self._data = read_snapshot(self.path)
+                self._mtime = mtime
+            return self._data
+
+    def fetch(self, stock_id):
+        return self._load().get(stock_id, (None, None))[0]
+
+    async def afetch(self, stock_id):
+        return self.fetch(stock_id)
+
+    def as_of(self, stock_id):
+        return self._load().get(stock_id, (None, None))[1] or datetime.date.today()
+
+
+class FixtureProvider(WearnProvider):
+    """
+    啟動本機 HTTP 測試伺服器 (QuoteFixtureServer) 並以爬蟲方式抓取，用於離線測試。
+    價格取自傳入的 dict，未指定時讀 PRICE_SNAPSHOT_PATH。
+    """
+    name = 'fixture'
+
+    def __init__(self, prices=None, delay=0.0, **kwargs):
+        from .fixture_server import QuoteFixtureServer
+
+        if prices is None:
+            path = getattr(settings, 'PRICE_SNAPSHOT_PATH', '')
+            prices = {sid: p for sid, (p, _) in read_snapshot(path).items()} if path else {}
+        self.server = QuoteFixtureServer(prices, delay=delay).start()
+        super().__init__(url_template=self.server.url_template, **kwargs)
+
+    def close(self):
+        self.server.stop()
+
+
+PROVIDERS = {
+    'wearn': WearnProvider,
+    'snapshot': SnapshotProvider,
+    'fixture': FixtureProvider,
+}
+
+
+def make_provider(name=None):
+    name = name or getattr(settings, 'PRICE_PROVIDER', 'wearn')
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"未知的報價來源：{name} (可用：{', '.join(PROVIDERS)})")
+
+
+# =========================================================
+# 報價服務：快取、同檔合併請求、熔斷與最後收盤價備援
+# =========================================================
+def _quote(price, source, as_of, stale=False):
+    return {'price': price, 'source': source, 'as_of': as_of, 'stale': stale}
+
+
+class PriceService:
+    def __init__(self, url_template=None, ttl=None, max_entries=None, timeout=None,
+                 host_concurrency=None, batch_workers=None, negative_ttl=10, provider=None, persist=None):
+        if provider is None:
+            if url_template or getattr(settings, 'PRICE_PROVIDER', 'wearn') == 'wearn':
+                provider = WearnProvider(url_template, timeout, host_concurrency)
+            else:
+                provider = make_provider()
+        self.provider = provider
+        self.ttl = ttl if ttl is not None else getattr(settings, 'PRICE_CACHE_TTL', 60)
+        self.max_entries = max_entries or getattr(settings, 'PRICE_CACHE_SIZE', 512)
+        self.timeout = timeout or getattr(settings, 'PRICE_TIMEOUT', 5)
+        self.negative_ttl = negative_ttl
+        self.batch_workers = batch_workers or getattr(settings, 'PRICE_BATCH_WORKERS', 16)
+        self.persist = persist if persist is not None else getattr(settings, 'PRICE_PERSIST', True)
+
+        # 熔斷：來源連續失敗 threshold 次後，cooldown 秒內直接用最後收盤價，不再等逾時
+        self.breaker_threshold = getattr(settings, 'PRICE_BREAKER_THRESHOLD', 3)
+        self.breaker_cooldown = getattr(settings, 'PRICE_BREAKER_COOLDOWN', 30)
+        self._failures = 0
+        self._open_until = 0.0
+
+        self._cache = OrderedDict()   # stock_id -> (expires_at, price)
+        self._inflight = {}           # stock_id -> Future
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # ---------- 快取 ----------
+    def _cache_get(self, stock_id):
+        hit = self._cache.get(stock_id)
+        if hit is None:
+            return False, None
+        expires_at, price = hit
+        if expires_at < time.monotonic():
+            del self._cache[stock_id]
+            return False, None
+        self._cache.move_to_end(stock_id)
+        return True, price
+
+    def _cache_set(self, stock_id, price):
+        ttl = self.ttl if price is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._cache[stock_id] = (time.monotonic() + ttl, price)
+        self._cache.move_to_end(stock_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._failures = 0
+            self._open_until = 0.0
+
+    # ---------- 熔斷 ----------
+    def breaker_open(self):
+        return self._open_until > time.monotonic()
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._open_until = 0.0
+            else:
+                self._failures += 1
+                if self._failures >= self.breaker_threshold:
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+
+    def _failed(self, exc):
+        """來源錯誤：計入熔斷並依錯誤類型計數 (其餘例外照常拋出，不在此吞掉)。"""
+        self._record(False)
+        metrics.registry.inc('quote_errors', help='報價來源錯誤次數', provider=self.provider.name, error=type(exc).__name__)
+
+    def _provider_fetch(self, stock_id):
+        if self.breaker_open():
+            return None
+        try:
+            price = self.provider.fetch(stock_id)
+        except FETCH_ERRORS as e:
+            self._failed(e)
+            return None
+        self._record(True)
+        return price
+
+    # ---------- 資料庫 ----------
+    def save_quotes(self, prices):
+        """prices: {代碼: 價格}；寫入 PriceQuote (同一天同一檔只保留最新一筆)。"""
+        from .models import PriceQuote
+
+        rows = [
+            PriceQuote(stock_id=sid, quote_date=self.provider.as_of(sid), price=p, source=self.provider.name)
+            for sid, p in prices.items() if p is not None
+        ]
+        if self.persist and rows:
+            PriceQuote.objects.bulk_create(
+                rows, update_conflicts=True,
+                unique_fields=['stock_id', 'quote_date'], update_fields=['price', 'source', 'fetched_at'],
+            )
+
+    def last_closes(self, stock_ids):
+        """各檔最後一筆已儲存的價格：{代碼: (價格, 日期, 來源)}。"""
+        from .models import PriceQuote
+
+        out = {}
+        qs = PriceQuote.objects.filter(stock_id__in=list(stock_ids)).order_by('stock_id', '-quote_date')
+        for sid, price, quote_date, source in qs.values_list('stock_id', 'price', 'quote_date', 'source'):
+            out.setdefault(sid, (price, quote_date, source))
+        return out
+
+    def _finish(self, live, fetched=()):
+        """live: {代碼: 即時價或 None}；fetched: 本次實際抓到 (非快取) 的代碼，需寫入資料庫。"""
+        self.save_quotes({sid: live[sid] for sid in fetched if live.get(sid) is not None})
+        missing = [sid for sid, p in live.items() if p is None]
+        fallback = self.last_closes(missing) if missing else {}
+        quotes = {}
+        for sid, p in live.items():
+            if p is not None:
+                quotes[sid] = _quote(p, self.provider.name, self.provider.as_of(sid))
+            elif sid in fallback:
+                price, as_of, source = fallback[sid]
+                quotes[sid] = _quote(price, source, as_of, stale=True)
+            else:
+                quotes[sid] = _quote(None, None, None)
+        return quotes
+
+    # ---------- 對外介面 ----------
+    def _get_live(self, stock_id):
+        """回傳 (價格或 None, 是否為本次實際抓取)；不碰資料庫，可在執行緒池中呼叫。"""
+        with self._lock:
+            found, price = self._cache_get(stock_id)
+            if found:
+                return price, False
+            call = self._inflight.get(stock_id)
+            leader = call is None
+            if leader:
+                call = self._inflight[stock_id] = Future()
+
+        # 同一檔股票同時只發一次請求，其餘呼叫者等待同一個結果
+        if not leader:
+            return call.result(), False
+
+        price = None
+        try:
+            price = self._provider_fetch(stock_id)
+        finally:
+            with self._lock:
+                self._cache_set(stock_id, price)
+                del self._inflight[stock_id]
+            call.set_result(price)
+        return price, True
+
+    def get_quote(self, stock_id):
+        """
+        回傳 {'price', 'source', 'as_of', 'stale'}；即時來源失敗時以最後一筆收盤價代替 (stale=True)，
+        皆無資料時 price 為 None。
+        """
+        stock_id = str(stock_id).strip()
+        price, fetched = self._get_live(stock_id)
+        return self._finish({stock_id: price}, [stock_id] if fetched else [])[stock_id]
+
+    def get_price(self, stock_id):
+        return self.get_quote(stock_id)['price']
+
+    def get_quotes(self, stock_ids, timeout=None):
+        """
+        並行查詢多檔股價，總等待時間約等於最慢的一檔 (上限 timeout 秒)。
+        回傳 {代碼: quote}；逾時未完成的代碼以最後收盤價代替，請求仍會在背景完成並寫入快取。
+        """
+        ids = list(dict.fromkeys(str(s).strip() for s in stock_ids if str(s).strip()))
+        executor = self._get_executor()
+        futures = {executor.submit(self._get_live, sid): sid for sid in ids}
+        done, pending = wait(futures, timeout=timeout if timeout is not None else self.timeout + 1)
+        # 逾時的請求完成後照常寫入 PriceQuote (快取已由 _get_live 寫入)
+        for f in pending:
+            f.add_done_callback(lambda f, sid=futures[f]: executor.submit(self._save_late, sid, f))
+        results = {futures[f]: f.result() for f in done}
+        live = {sid: results[sid][0] if sid in results else None for sid in ids}
+        quotes = self._finish(live, [sid for sid, (_, fetched) in results.items() if fetched])
+        for sid in ids:
+            quotes[sid]['timed_out'] = sid not in results
+        return quotes
+
+    def get_many(self, stock_ids, timeout=None):
+        """
+        回傳 (prices, timed_out)：prices 為已完成的 {代碼: 價格或 None} (含最後收盤價備援)，timed_out 為逾時未完成的代碼。
+        """
+        quotes = self.get_quotes(stock_ids, timeout)
+        prices = {sid: q['price'] for sid, q in quotes.items() if not q['timed_out']}
+        return prices, [sid for sid, q in quotes.items() if q['timed_out']]
+
+    def _save_late(self, stock_id, future):
+        try:
+            if future.exception() is None:
+                price, fetched = future.result()
+                if fetched:
+                    self.save_quotes({stock_id: price})
+        finally:
+            close_old_connections()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.batch_workers, thread_name_prefix='price-fetch')
+            return self._executor
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_price_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PriceService()
+        return _service
+
+
+def fetch_live_price(stock_id):
+    return get_price_service().get_price(stock_id)
+
+
+# =========================================================
+# async 版：快取、熔斷與資料庫皆與同步版 PriceService 共用，
+# 在 ASGI 下由單一事件迴圈並行處理多個慢速請求，不佔用 worker
+# =========================================================
+class AsyncPriceService:
+    def __init__(self, sync_service=None):
+        self.sync = sync_service or get_price_service()
+        # Task 綁定事件迴圈，進行中的請求依迴圈分開記錄：事件迴圈 -> {stock_id: Task}
+        self._inflight = weakref.WeakKeyDictionary()
+        self._background = set()      # 逾時後仍在寫回的 Task (保留參照以免被回收)
+
+    async def _get_live(self, stock_id):
+        with self.sync._lock:
+            found, price = self.sync._cache_get(stock_id)
+        if found:
+            return price, False
+        # 同一檔股票同時只發一次請求；shield 讓個別呼叫者逾時取消時不影響其他等待者
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(stock_id)
+        if task is None:
+            task = inflight[stock_id] = asyncio.ensure_future(self._load(inflight, stock_id))
+            return await asyncio.shield(task), True
+        return await asyncio.shield(task), False
+
+    async def _load(self, inflight, stock_id):
+        price = None
+        try:
+            price = await self._provider_fetch(stock_id)
+        finally:
+            with self.sync._lock:
+                self.sync._cache_set(stock_id, price)
+            inflight.pop(stock_id, None)
+        return price
+
+    async def _provider_fetch(self, stock_id):
+        if self.sync.breaker_open():
+            return None
+        try:
+            price = await self.sync.provider.afetch(stock_id)
+        except FETCH_ERRORS as e:
+            self.sync._failed(e)
+            return None
+        self.sync._record(True)
+        return price
+
+    async def get_quote(self, stock_id):
+        stock_id = str(stock_id).strip()
+        price, fetched = await self._get_live(stock_id)
+        quotes = await sync_to_async(self.sync._finish)({stock_id: price}, [stock_id] if fetched else [])
+        return quotes[stock_id]
+
+    async def get_price(self, stock_id):
+        return (await self.get_quote(stock_id))['price']
+
+    async def get_quotes(self, stock_ids, timeout=None):
+        """與 PriceService.get_quotes 相同。"""
+        ids = list(dict.fromkeys(str(s).strip() for s in stock_ids if str(s).strip()))
+        if not ids:
+            return {}
+        tasks = {asyncio.ensure_future(self._get_live(sid)): sid for sid in ids}
+        done, pending = await asyncio.wait(tasks, timeout=timeout if timeout is not None else self.sync.timeout + 1)
+        # 逾時的請求在迴圈上繼續執行，完成後照常寫入 PriceQuote (WSGI 下迴圈隨請求結束，來不及完成的會被取消)
+        for t in pending:
+            t.add_done_callback(lambda t, sid=tasks[t]: self._spawn(self._save_late(sid, t)))
+        results = {tasks[t]: t.result() for t in done}
+        live = {sid: results[sid][0] if sid in results else None for sid in ids}
+        quotes = await sync_to_async(self.sync._finish)(live, [sid for sid, (_, fetched) in results.items() if fetched])
+        for sid in ids:
+            quotes[sid]['timed_out'] = sid not in results
+        return quotes
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _save_late(self, stock_id, task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        price, fetched = task.result()
+        if fetched:
+            await sync_to_async(self.sync.save_quotes)({stock_id: price})
+
+    async def get_many(self, stock_ids, timeout=None):
+        quotes = await self.get_quotes(stock_ids, timeout)
+        prices = {sid: q['price'] for sid, q in quotes.items() if not q['timed_out']}
+        return prices, [sid for sid, q in quotes.items() if q['timed_out']]
+
+
+_async_service = None
+
+
+def get_async_price_service():
+    global _async_service
+    sync = get_price_service()
+    with _service_lock:
+        if _async_service is None or _async_service.sync is not sync:
+            _async_service = AsyncPriceService(sync)
+        return _async_service
+
+
+async def afetch_live_price(stock_id):
+    return await get_async_price_service().get_price(stock_id)
+
+
+async def aclose_price_clients():
+    """ASGI lifespan shutdown：關閉報價來源在目前事件迴圈上的連線池。"""
+    if _service is not None:
+        await _service.provider.aclose()
@@ -0,0 +1,142 @@
+from django.db.models import F
+
+from .models import StockRevision
+from .parsing import normalize_raw
+
+# =========================================================
+# 預估修正：每份快照與同一檔「上一份」快照 (較早且最近的年月) 的差額
+# 匯入時只重算本批資料列，以及因本批插入而換了比較對象的「下一份」快照
+# =========================================================
+
+# StockRevision 欄位 -> PER_Analysis key
+REVISION_FIELDS = {
+    'total_eps_est': 'Total_EPS_Est',
+    'q4_eps_est': 'Q4_EPS_Est',
+    'pe_use_h': 'PE_Use_H',
+    'pe_use_l': 'PE_Use_L',
+    'target_h': 'Target_H',
+    'target_l': 'Target_L',
+}
+DELTA_FIELDS = [f'{name}_delta' for name in REVISION_FIELDS] + ['eps_delta_pct']
+UPDATE_FIELDS = ['code', 'data_year', 'data_month', 'prev_year', 'prev_month'] + list(REVISION_FIELDS) + DELTA_FIELDS
+
+# 排行榜可用的排序 (皆有索引)
+RANKING_SORTS = {
+    'up': '-total_eps_est_delta',
+    'down': 'total_eps_est_delta',
+    'up_pct': '-eps_delta_pct',
+    'down_pct': 'eps_delta_pct',
+}
+
+
+def extract_values(raw, normalized=None):
+    """normalized 為 StockData.normalized；未提供時由 raw_data 計算。"""
+    if normalized is None:
+        normalized = normalize_raw(raw)
+    return {name: normalized.get(key) for name, key in REVISION_FIELDS.items()}
+
+
+def compute_deltas(cur, prev):
+    """cur / prev: {欄位: 數值或 None}；prev 為 None 表示沒有較早的快照。"""
+    out = dict.fromkeys(DELTA_FIELDS)
+    if prev is None:
+        return out
+    for name in REVISION_FIELDS:
+        if cur.get(name) is not None and prev.get(name) is not None:
+            out[f'{name}_delta'] = round(cur[name] - prev[name], 4)
+    base = prev.get('total_eps_est')
+    if out['total_eps_est_delta'] is not None and base:
+        out['eps_delta_pct'] = round(out['total_eps_est_delta'] / abs(base), 6)
+    return out
+
+
+def _make(pk, code, period, values, prev_period, prev_values, model=StockRevision):
+    return model(
+        stock_id=pk, code=code, data_year=period[0], data_month=period[1],
+        prev_year=prev_period[0] if prev_period else None,
+        prev_month=prev_period[1] if prev_period else None,
+        **values, **compute_deltas(values, prev_values),
+    )
+
+
+def update_revisions(ids, objs):
+    """
+    ids: {(stock_id, 年, 月): pk}；objs: {(stock_id, 年, 月): StockData}
+    匯入時呼叫 (與寫入同一個 transaction)。
+    """
+    codes = {sid for sid, _, _ in objs}
+    # 這批股票已存在的快照 (只讀 revision 表的小欄位，不碰 raw_data)
+    snapshots = {}   # code -> {(年, 月): (pk, values)}
+    for row in StockRevision.objects.filter(code__in=codes).values('stock_id', 'code', 'data_year', 'data_month', *REVISION_FIELDS):
+        snapshots.setdefault(row['code'], {})[(row['data_year'], row['data_month'])] = (
+            row['stock_id'], {name: row[name] for name in REVISION_FIELDS})
+    touched = {}
+    for (sid, y, m), obj in objs.items():
+        if (sid, y, m) not in ids:
+            continue
+        snapshots.setdefault(sid, {})[(y, m)] = (ids[(sid, y, m)], extract_values(obj.raw_data, obj.normalized))
+        touched.setdefault(sid, set()).add((y, m))
+
+    rows = []
+    for sid, periods in touched.items():
+        timeline = sorted(snapshots[sid])
+        redo = set()
+        for period in periods:
+            i = timeline.index(period)
+            redo.add(i)
+            if i + 1 < len(timeline):
+                redo.add(i + 1)
+        for i in sorted(redo):
+            period = timeline[i]
+            pk, values = snapshots[sid][period]
+            prev = timeline[i - 1] if i > 0 else None
+            rows.append(_make(pk, sid, period, values, prev, snapshots[sid][prev][1] if prev else None))
+
+    StockRevision.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['stock'], update_fields=UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def rebuild_revisions(queryset, model=StockRevision, batch_size=500):
+    """
+    依 (代碼, 年, 月) 順序重算全部修正紀錄 (資料遷移 / 手動修復用)。
+    queryset 需為 StockData 的 QuerySet；model 可傳入遷移中的歷史模型。
+    """
+    batch = []
+    last_code = prev_period = prev_values = None
+    qs = queryset.order_by('stock_id', 'data_year', 'data_month').values_list(
+        'pk', 'stock_id', 'data_year', 'data_month', 'raw_data')
+    for pk, code, y, m, raw in qs.iterator(chunk_size=batch_size):
+        if code != last_code:
+            last_code, prev_period, prev_values = code, None, None
+        values = extract_values(raw)
+        batch.append(_make(pk, code, (y, m), values, prev_period, prev_values, model))
+        prev_period, prev_values = (y, m), values
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch, update_conflicts=True, unique_fields=['stock'], update_fields=UPDATE_FIELDS)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch, update_conflicts=True, unique_fields=['stock'], update_fields=UPDATE_FIELDS)
+
+
+# ---------------------------------------------------------
+# 讀取
+# ---------------------------------------------------------
+def ticker_trend(code):
+    """單檔各月份的數值與修正幅度，依年月排序 (索引 revision_code_idx)。"""
+    return list(
+        StockRevision.objects.filter(code=code).order_by('data_year', 'data_month')
+        .values('data_year', 'data_month', 'prev_year', 'prev_month', *REVISION_FIELDS, *DELTA_FIELDS)
+    )
+
+
+def revision_ranking(year, month, sort='up', limit=50):
+    """某年月 EPS 修正幅度排行 (索引 revision_eps_delta_idx / revision_eps_pct_idx)。"""
+    order = RANKING_SORTS[sort]
+    field = order.lstrip('-')
+    return list(
+        StockRevision.objects.filter(data_year=year, data_month=month, **{f'{field}__isnull': False})
+        .order_by(order, 'code')
+        .values('code', 'prev_year', 'prev_month', *REVISION_FIELDS, *DELTA_FIELDS, stock_name=F('stock__stock_name'))[:limit]
+    )
@@ -0,0 +1,86 @@
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef
+
+from .models import StockData, StockRating
+from .parsing import GOOD_RATINGS
+
+# =========================================================
+# 選股器：只用反正規化欄位與 StockRating 索引篩選，不讀 raw_data
+#   例：A 級以上指標 >= 4、本益比(高) < 12、YoY > 0
+# =========================================================
+
+# 排序鍵 -> StockData 欄位 (皆有 (年, 月, 欄位) 索引，code 除外)
+SCREEN_SORTS = {
+    'good': 'good_rating_count',
+    'eps': 'total_eps_est',
+    'pe': 'pe_use_h',
+    'yoy': 'yoy_use',
+    'six': 'six_average',
+    'code': 'stock_id',
+}
+RESULT_FIELDS = [
+    'stock_id', 'stock_name', 'good_rating_count', 'total_eps_est',
+    'pe_use_h', 'pe_use_l', 'yoy_use', 'net_avg', 'six_average',
+]
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _num(params, key, scale=1.0):
+    val = (params.get(key) or '').strip()
+    return float(val) / scale if val else None
+
+
+def parse_criteria(params):
+    """
+    由 GET 參數取出篩選條件；格式錯誤時拋出 ValueError。
+    yoy_min 為百分比，其餘為原始單位；factors 為必須 A 級以上的指標 (逗號分隔或重複參數)。
+    """
+    try:
+        min_good = params.get('min_good', '').strip()
+        criteria = {
+            'min_good': int(min_good) if min_good else None,
+            'pe_max': _num(params, 'pe_max'),
+            'yoy_min': _num(params, 'yoy_min', 100),
+            'eps_min': _num(params, 'eps_min'),
+            'six_min': _num(params, 'six_min'),
+        }
+    except ValueError:
+        raise ValueError("篩選條件須為數字")
+    factors = params.getlist('factors') if hasattr(params, 'getlist') else [params.get('factors', '')]
+    criteria['factors'] = [f.strip() for v in factors for f in (v or '').split(',') if f.strip()]
+    return criteria
+
+
+def screen(year, month, min_good=None, pe_max=None, yoy_min=None, eps_min=None, six_min=None, factors=()):
+    """回傳符合條件的 QuerySet (尚未排序)。"""
+    qs = StockData.objects.filter(data_year=year, data_month=month)
+    if min_good is not None:
+        qs = qs.filter(good_rating_count__gte=min_good)
+    if pe_max is not None:
+        # 本益比為負或 0 (虧損) 不算「低本益比」
+        qs = qs.filter(pe_use_h__gt=0, pe_use_h__lt=pe_max)
+    if yoy_min is not None:
+        qs = qs.filter(yoy_use__gt=yoy_min)
+    if eps_min is not None:
+        qs = qs.filter(total_eps_est__gte=eps_min)
+    if six_min is not None:
+        qs = qs.filter(six_average__gte=six_min)
+    for factor in factors:
+        qs = qs.filter(Exists(StockRating.objects.filter(
+            stock=OuterRef('pk'), factor=factor, rating__in=GOOD_RATINGS)))
+    return qs
+
+
+def screen_page(year, month, criteria, sort='good', order='desc', page=1, page_size=PAGE_SIZE):
+    """排序 + 分頁；回傳 Django Page (object_list 為 dict)。"""
+    field = SCREEN_SORTS.get(sort, SCREEN_SORTS['good'])
+    ordering = [field if order == 'asc' else f'-{field}', 'stock_id']
+    qs = screen(year, month, **criteria).order_by(*ordering).values(*RESULT_FIELDS)
+    paginator = Paginator(qs, max(1, min(page_size, MAX_PAGE_SIZE)))
+    return paginator.get_page(page)
+
+
+def rating_factors():
+    """所有出現過的六大指標名稱 (走 rating_factor_idx)。"""
+    return list(StockRating.objects.order_by('factor').values_list('factor', flat=True).distinct())
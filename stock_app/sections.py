@@ -0,0 +1,247 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import JSONObject
+
+from .models import StockData
+from .parsing import normalize_raw
+
+# =========================================================
+# 投影讀取：只從 raw_data 取出各區塊需要的 JSON 子欄位
+# (Postgres / SQLite 皆由資料庫做 JSON path 取值，不載入整個 raw_data)
+# =========================================================
+
+# 首屏需要的 PER_Analysis 欄位 (摘要卡片、模擬試算表單、歷史股價表)
+SUMMARY_KEYS = [
+    'Name', 'Now_Price', 'Predict_Rev', 'Predict_EPS', 'Target_H', 'Target_L', 'Profit',
+    'YoY_Use', 'Net_Avg', 'Capital', 'PE_Use_H', 'PE_Use_L',
+    'Current_Year', 'Current_Year_ROC', 'EPS1_Is_Est',
+]
+
+# 各區塊需要的 PER_Analysis 欄位；six 直接取 Six_Indicators 整段
+SECTION_KEYS = {
+    'hist': ['H', 'L', 'EPS', 'PE_H', 'PE_L', 'Current_Year', 'Current_Year_ROC'],
+    'rev': ['Rev_Names', 'Rev_Vals', 'YoY_Names', 'YoY_Vals'],
+    'net': ['Net_Names', 'Net_Vals'],
+    'q4': [
+        'Detect_Reason', 'Latest_Quarter_Str', 'EPS_Q1', 'EPS_Q2', 'EPS_Q3',
+        'Q4_Rev_Actual', 'Net_Avg', 'Capital', 'Q4_EPS_Est', 'Total_EPS_Est',
+    ],
+    'six': [],
+}
+LAZY_SECTIONS = ('rev', 'net', 'six', 'q4')
+
+
+def _per_key(key):
+    return KeyTransform(key, KeyTransform('PER_Analysis', 'raw_data'))
+
+
+def load_projection(qs, per_keys=(), top_keys=(), fields=()):
+    """
+    回傳 {'row': {...基本欄位與 fields}, 'per': {PER_Analysis 子集合}, 其他 top_keys...}；查無資料回傳 None。
+    JSON 中不存在的 key 不會出現在 per 裡，讓 .get() 預設值照常運作。
+    各 key 由資料庫組成一個 JSON 物件再解析：SQLite 單獨取出的字串純量 ("123"、"true") 會被當成 JSON 重新解析成數字 / 布林，
+    包在 JSON_OBJECT 內則保留原本的型別，與讀整份 raw_data 相同。
+    """
+    annotations = {}
+    per_keys = list(dict.fromkeys(per_keys))
+    if per_keys:
+        annotations['proj_per'] = JSONObject(**{k: _per_key(k) for k in per_keys})
+    if top_keys:
+        annotations['proj_top'] = JSONObject(**{k: KeyTransform(k, 'raw_data') for k in top_keys})
+    row = qs.values('pk', 'stock_id', 'stock_name', 'data_year', 'data_month', *fields, **annotations).first()
+    if row is None:
+        return None
+
+    per = row.pop('proj_per', None) or {}
+    top = row.pop('proj_top', None) or {}
+    out = {'row': row, 'per': {k: v for k, v in per.items() if v is not None}}
+    for k in top_keys:
+        out[k] = top.get(k) if top.get(k) is not None else {}
+    return out
+
+
+def load_section(stock_id, year, month, section):
+    qs = StockData.objects.filter(stock_id=stock_id, data_year=year, data_month=month)
+    top_keys = ('Six_Indicators',) if section == 'six' else ()
+    data = load_projection(qs, SECTION_KEYS[section], top_keys)
+    if data is None:
+        return None
+    return build_section(section, data)
+
+
+def find_row(qs):
+    """只查索引欄位，用來決定要顯示哪一筆以及快取版本。"""
+    return qs.values('pk', 'stock_id', 'data_year', 'data_month', 'content_hash').first()
+
+
+# ---------------------------------------------------------
+# 各區塊的資料打包
+# ---------------------------------------------------------
+def build_hist_rows(per):
+    hist_rows = []
+    H = per.get('H', []); L = per.get('L', []); EPS = per.get('EPS', [])
+    PE_H = per.get('PE_H', []); PE_L = per.get('PE_L', [])
+    loop_len = min(len(H), len(L), len(EPS))
+
+    current_year = per.get('Current_Year', datetime.datetime.now().year)
+    current_year_roc = per.get('Current_Year_ROC', current_year - 1911)
+
+    for i in range(loop_len):
+        y_ad = current_year - 1 - i
+        y_roc = current_year_roc - 1 - i
+        hist_rows.append({
+            'year_str': f"{y_ad}/{y_roc}",
+            'h': H[i], 'l': L[i], 'eps': EPS[i],
+            'pe_h': PE_H[i] if i < len(PE_H) else '-',
+            'pe_l': PE_L[i] if i < len(PE_L) else '-'
+        })
+    return hist_rows
+
+
+def build_rev_rows(per):
+    rev_names = per.get('Rev_Names', []); rev_vals = per.get('Rev_Vals', [])
+    yoy_names = per.get('YoY_Names', []); yoy_vals = per.get('YoY_Vals', [])
+    rev_rows = [{'name': rev_names[i], 'val': rev_vals[i]} for i in range(len(rev_names))]
+    yoy_rows = [{'name': yoy_names[i], 'yoy': yoy_vals[i]} for i in range(len(yoy_names))]
+    return rev_rows, yoy_rows
+
+
+def build_net_rows(per):
+    net_names = per.get('Net_Names', []); net_vals = per.get('Net_Vals', [])
+    return [{'name': net_names[i], 'val': net_vals[i]} for i in range(len(net_names))]
+
+
+def build_q4_rows(per):
+    return [
+        ("狀態", per.get('Detect_Reason','-')),
+        ("網頁最新季別", per.get('Latest_Quarter_Str','-')),
+        ("Q1 EPS (實際)", per.get('EPS_Q1',0)),
+        ("Q2 EPS (實際)", per.get('EPS_Q2',0)),
+        ("Q3 EPS (實際)", per.get('EPS_Q3',0)),
+        ("Q1-Q3 總和", round(per.get('EPS_Q1',0)+per.get('EPS_Q2',0)+per.get('EPS_Q3',0), 2)),
+        ("---", "---"),
+        ("去年 Q4 營收", per.get('Q4_Rev_Actual',0)),
+        ("平均淨利率", per.get('Net_Avg','0%')),
+        ("股本(億)", per.get('Capital',0)),
+        ("Q4 EPS (估算)", per.get('Q4_EPS_Est',0)),
+        ("---", "---"),
+        ("全年 EPS (估/實)", per.get('Total_EPS_Est',0)),
+    ]
+
+
+def build_section(section, data):
+    per = data['per']
+    if section == 'hist':
+        return {'hist_rows': build_hist_rows(per)}
+    if section == 'rev':
+        rev_rows, yoy_rows = build_rev_rows(per)
+        return {'rev_rows': rev_rows, 'yoy_rows': yoy_rows}
+    if section == 'net':
+        return {'net_rows': build_net_rows(per)}
+    if section == 'q4':
+        return {'q4_rows': build_q4_rows(per)}
+    if section == 'six':
+        return {'six': data.get('Six_Indicators') or {}}
+    raise KeyError(section)
+
+
+def load_summary(qs):
+    """
+    首屏資料：Meta、摘要用的 PER_Analysis 欄位 (顯示用原始值)、正規化數值 num (試算用) 與歷史股價表。
+    回傳 (row, context)；查無資料時回傳 (None, None)。
+    """
+    data = load_projection(qs, SUMMARY_KEYS + SECTION_KEYS['hist'], ('Meta',), ('normalized',))
+    if data is None:
+        return None, None
+    context = {'result': {'Meta': data['Meta'], 'PER_Analysis': data['per']}, 'num': data['row'].pop('normalized') or {}}
+    context.update(build_section('hist', data))
+    return data['row'], context
+
+
+# =========================================================
+# 儀表板快取：key = (股票, 年, 月, 區塊)，值內含資料版本
+# 匯入時主動刪除；版本不符 (資料已被更新) 時視為未命中
+# =========================================================
+CACHE_SECTIONS = ('summary',) + LAZY_SECTIONS
+# 區塊內容格式變更時遞增，舊格式的快取自然失效
+CACHE_FORMAT = 2
+
+
+def _dashboard_cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def cache_key(stock_id, year, month, section):
+    return f"dash{CACHE_FORMAT}:{stock_id}:{year}:{month}:{section}"
+
+
+def row_version(row):
+    # 內容雜湊：資料內容改變才換版本 (同一天重複上傳也能分辨；內容未變的重新上傳不會讓快取失效)
+    return row['content_hash']
+
+
+def _cached(row, section, builder):
+    cache = _dashboard_cache()
+    key = cache_key(row['stock_id'], row['data_year'], row['data_month'], section)
+    version = row_version(row)
+    hit = cache.get(key)
+    if hit is not None and hit.get('v') == version:
+        return hit['data']
+    data = builder()
+    if data is not None:
+        cache.set(key, {'v': version, 'data': data})
+    return data
+
+
+def get_summary(row):
+    def build():
+        qs = StockData.objects.filter(pk=row['pk'])
+        return load_summary(qs)[1]
+    return _cached(row, 'summary', build)
+
+
+def get_section(row, section):
+    return _cached(row, section, lambda: load_section(
+        row['stock_id'], row['data_year'], row['data_month'], section))
+
+
+def invalidate_dashboard(keys):
+    """keys: [(stock_id, year, month), ...]"""
+    _dashboard_cache().delete_many([
+        cache_key(sid, y, m, section) for sid, y, m in keys for section in CACHE_SECTIONS
+    ])
+
+
+def payloads_from_raw(raw, normalized=None):
+    """由完整 raw_data 一次產生所有區塊 (匯入後預熱快取用)。"""
+    per = raw.get('PER_Analysis') or {}
+    data = {'per': per, 'Meta': raw.get('Meta') or {}, 'Six_Indicators': raw.get('Six_Indicators') or {}}
+    summary_keys = SUMMARY_KEYS + SECTION_KEYS['hist']
+    summary = {
+        'result': {'Meta': data['Meta'], 'PER_Analysis': {k: per[k] for k in summary_keys if per.get(k) is not None}},
+        'num': normalized if normalized is not None else normalize_raw(raw),
+    }
+    summary.update(build_section('hist', data))
+    payloads = {'summary': summary}
+    for section in LAZY_SECTIONS:
+        payloads[section] = build_section(section, data)
+    return payloads
+
+
+def warm_dashboard(pks):
+    """匯入後預先計算這些資料列的所有區塊並寫入快取。"""
+    cache = _dashboard_cache()
+    entries = {}
+    qs = StockData.objects.filter(pk__in=pks).values_list(
+        'stock_id', 'data_year', 'data_month', 'content_hash', 'raw_data', 'normalized')
+    for sid, y, m, version, raw, normalized in qs.iterator(chunk_size=200):
+        try:
+            payloads = payloads_from_raw(raw or {}, normalized)
+        except Exception:
+            continue
+        for section, data in payloads.items():
+            entries[cache_key(sid, y, m, section)] = {'v': version, 'data': data}
+    cache.set_many(entries)
@@ -0,0 +1,113 @@
+import numpy as np
+
+from .models import StockSeries
+from .parsing import to_float
+
+# =========================================================
+# 歷史序列：raw_data 內的陣列另存為 float64 二進位欄位 (StockSeries)
+#   ticker_history('2330', 'eps')        -> 單檔各月份快照
+#   field_matrix('rev_vals', 2026, 9)    -> 某年月全部股票
+# 回傳 NumPy 陣列；長度不一時以 NaN 補齊，無法解析的值亦為 NaN
+# =========================================================
+
+# StockSeries 欄位 -> (PER_Analysis key, 是否為百分比)
+SERIES_FIELDS = {
+    'h': ('H', False),
+    'l': ('L', False),
+    'eps': ('EPS', False),
+    'pe_h': ('PE_H', False),
+    'pe_l': ('PE_L', False),
+    'rev_vals': ('Rev_Vals', False),
+    'net_vals': ('Net_Vals', True),
+}
+DTYPE = np.dtype('<f8')
+
+
+def pack(values, is_pct=False):
+    if not isinstance(values, (list, tuple)):
+        return b''
+    nums = [to_float(v, np.nan) for v in values]
+    arr = np.array(nums, dtype=DTYPE)
+    if is_pct:
+        arr /= 100
+    return arr.tobytes()
+
+
+def unpack(blob):
+    """唯讀的 float64 陣列 (直接引用 blob 的記憶體，不拷貝)。"""
+    return np.frombuffer(blob or b'', dtype=DTYPE)
+
+
+def extract_series(raw):
+    per = (raw or {}).get('PER_Analysis') or {}
+    return {name: pack(per.get(key), is_pct) for name, (key, is_pct) in SERIES_FIELDS.items()}
+
+
+def build_series(ids, objs):
+    """
+    ids: {(stock_id, 年, 月): pk}；objs: {(stock_id, 年, 月): StockData}
+    匯入時呼叫，一次 upsert 整批。
+    """
+    rows = [
+        StockSeries(stock_id=ids[key], **extract_series(obj.raw_data))
+        for key, obj in objs.items() if key in ids
+    ]
+    StockSeries.objects.bulk_create(
+        rows, update_conflicts=True,
+        unique_fields=['stock'], update_fields=list(SERIES_FIELDS),
+    )
+
+
+def _check_fields(fields):
+    unknown = [f for f in fields if f not in SERIES_FIELDS]
+    if unknown:
+        raise ValueError(f"未知的序列欄位：{', '.join(unknown)} (可用：{', '.join(SERIES_FIELDS)})")
+
+
+def stack(blobs):
+    """多個 blob 疊成 (筆數, 最大長度) 的矩陣；長度相同時只做一次拷貝。"""
+    blobs = [b or b'' for b in blobs]
+    if not blobs:
+        return np.empty((0, 0), dtype=DTYPE)
+    sizes = {len(b) for b in blobs}
+    if len(sizes) == 1:
+        width = sizes.pop() // DTYPE.itemsize
+        return np.frombuffer(b''.join(blobs), dtype=DTYPE).reshape(len(blobs), width)
+    width = max(sizes) // DTYPE.itemsize
+    out = np.full((len(blobs), width), np.nan, dtype=DTYPE)
+    for i, b in enumerate(blobs):
+        row = np.frombuffer(b, dtype=DTYPE)
+        out[i, :len(row)] = row
+    return out
+
+
+def ticker_history(stock_id, fields=None):
+    """
+    單檔所有月份的快照，依年月排序。
+    回傳 {'year': (M,), 'month': (M,), <欄位>: (M, 長度)}。
+    """
+    fields = list(fields or SERIES_FIELDS)
+    _check_fields(fields)
+    rows = list(
+        StockSeries.objects.filter(stock__stock_id=stock_id)
+        .order_by('stock__data_year', 'stock__data_month')
+        .values_list('stock__data_year', 'stock__data_month', *fields)
+    )
+    out = {
+        'year': np.array([r[0] for r in rows], dtype=np.int32),
+        'month': np.array([r[1] for r in rows], dtype=np.int32),
+    }
+    for i, name in enumerate(fields, start=2):
+        out[name] = stack([r[i] for r in rows])
+    return out
+
+
+def field_matrix(field, year, month, stock_ids=None):
+    """某年月全部 (或指定) 股票的單一欄位：回傳 (stock_ids, (N, 長度) 矩陣)，依代碼排序。"""
+    _check_fields([field])
+    qs = StockSeries.objects.filter(stock__data_year=year, stock__data_month=month)
+    if stock_ids:
+        qs = qs.filter(stock__stock_id__in=stock_ids)
+    rows = list(qs.order_by('stock__stock_id').values_list('stock__stock_id', field))
+    ids = np.array([r[0] for r in rows], dtype=object)
+    return ids, stack([r[1] for r in rows])
@@ -1,3 +1,1313 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import csv
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, override_settings, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import jobs, metrics, pricing
+from .bench import make_upload, run_size
+from .catalog import get_catalogue, invalidate_catalogue, search_stocks
+from .engine import MAX_GRID_CELLS, load_universe, parse_range, sensitivity_grid, simulate, simulate_stock
+from .export import COLUMNS, export_queryset, iter_row_chunks
+from .fixture_server import QuoteFixtureServer
+from .importer import import_stock_json, iter_json_items
+from .models import ImportJob, PriceQuote, Stock, StockData, StockRating, StockRevision, Watchlist, WatchlistValuation
+from .parsing import content_hash, merge_patch, to_float, to_pct
+from .revisions import DELTA_FIELDS, REVISION_FIELDS, rebuild_revisions, revision_ranking, ticker_trend
+from .screener import parse_criteria, screen
+from .sections import LAZY_SECTIONS, find_row, get_section, get_summary, invalidate_dashboard, load_projection, load_section
+from .series import field_matrix, pack, stack, ticker_history, unpack
+from .validation import RecordInvalid, sim_problems, validate_record, ValidationReport
+from .views import get_dashboard_data
+from .watchlists import add_codes, parse_codes, precompute, refresh_for_codes
+
+
+def _record(sid, year=2026, month=9, **per):
+    """最小的上傳資料：Meta 與試算用的 PER_Analysis 欄位。"""
+    analysis = {
+        'Name': f'測試{sid}', 'Now_Price': 100.0, 'Predict_Rev': 120.0,
+        'YoY_Use': '20.00%', 'Net_Avg': '10.00%', 'Capital': '10', 'PE_Use_H': 15.0, 'PE_Use_L': 10.0,
+    }
+    analysis.update(per)
+    return {
+        'Meta': {'StockID': sid, 'StockName': f'測試{sid}', 'QueryDate': f'{year}-{month:02d}-15', 'TargetMonth': month},
+        'PER_Analysis': analysis,
+    }
+
+
+def _upload(data):
+    return io.BytesIO(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+# =========================================================
+# 串流解析：不論切塊大小，結果都要與 json.loads 相同
+# =========================================================
+class JSONStreamTests(SimpleTestCase):
+    DOC = (
+        '\ufeff {"2330" : {"Name": "台積電", "PER_Analysis": {"Now_Price": 1050.5, "EPS": [1, -2.5e3, null, "12.5%"]}},\n'
+        '  "2317": {"esc": "a\\"b\\\\c\\u00e9\\ud83d\\ude00", "empty": {}, "arr": [], "flags": [true, false]},\n'
+        '  "9999": 123456789012345678901234567890, "0050": -0.000001, "空白": "  "\t}\n'
+    )
+
+    def test_matches_json_loads_for_any_chunk_size(self):
+        data = self.DOC.encode('utf-8')
+        expected = list(json.loads(self.DOC.lstrip('\ufeff')).items())
+        for chunk_size in (1, 2, 3, 5, 7, 16, 64, 4096):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_items(io.BytesIO(data), chunk_size)), expected)
+
+    def test_generated_upload(self):
+        data = make_upload(50, 2026, 9)
+        expected = list(json.loads(data).items())
+        for chunk_size in (13, 1000, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_items(io.BytesIO(data), chunk_size)), expected)
+
+    def test_empty_object(self):
+        self.assertEqual(list(iter_json_items(io.BytesIO(b' { } '), 1)), [])
+
+    def test_malformed(self):
+        for doc in (b'[1, 2]', b'{"a": 1 "b": 2}', b'{1: 2}', b'{"a": 1', b'{"a": tru}'):
+            with self.subTest(doc=doc), self.assertRaises(ValueError):
+                list(iter_json_items(io.BytesIO(doc), 2))
+
+
+# =========================================================
+# 匯入：批次 upsert
+# =========================================================
+class ImportTests(TestCase):
+    def test_insert_then_update_in_batches(self):
+        data = {sid: _record(sid) for sid in ('1101', '1102', '1103', '1104', '1105')}
+        progress = []
+        stats = import_stock_json(_upload(data), batch_size=2, on_progress=lambda s: progress.append(s['rows']))
+        self.assertEqual((stats['rows'], stats['inserted'], stats['updated'], stats['batches']), (5, 5, 0, 3))
+        self.assertEqual((progress[0], progress[-1]), (2, 5))
+        self.assertEqual((stats['period'], stats['first_ids']), ((2026, 9), ['1101', '1102']))
+
+        data['1102']['PER_Analysis']['Now_Price'] = 321.0
+        stats = import_stock_json(_upload(data))
+        self.assertEqual((stats['inserted'], stats['updated'], stats['skipped']), (0, 1, 4))
+        self.assertEqual(StockData.objects.count(), 5)
+        self.assertEqual(StockData.objects.get(stock_id='1102').raw_data['PER_Analysis']['Now_Price'], 321.0)
+
+    def test_months_are_kept_apart(self):
+        import_stock_json(_upload({'2330': _record('2330', 2026, 8)}))
+        stats = import_stock_json(_upload({'2330': _record('2330', 2026, 9)}))
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(
+            list(StockData.objects.order_by('data_month').values_list('data_year', 'data_month')),
+            [(2026, 8), (2026, 9)])
+
+    def test_non_object_value_is_rejected(self):
+        stats = import_stock_json(_upload({'2330': [1, 2], '2317': _record('2317')}))
+        self.assertEqual((stats['inserted'], stats['rejected']), (1, 1))
+        self.assertEqual(stats['validation'].errors, {'2330': ['資料格式錯誤 (應為物件)']})
+
+
+# =========================================================
+# 匯入工作：worker 模式下由 run_job 執行
+# =========================================================
+@override_settings(IMPORT_JOB_BACKEND='worker', IMPORT_JOB_STALE_AFTER=60)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def _submit(self, content, name='upload.json'):
+        return jobs.submit_import(SimpleUploadedFile(name, content))
+
+    def test_job_runs_and_reports_progress(self):
+        job = self._submit(_upload({'2330': _record('2330'), '2317': _record('2317')}).getvalue())
+        self.assertEqual(jobs.job_progress(job)['status'], ImportJob.STATUS_QUEUED)
+
+        job = jobs.run_next_job()
+        progress = jobs.job_progress(job)
+        self.assertEqual((progress['status'], progress['percent'], progress['rows_inserted']), (ImportJob.STATUS_DONE, 100.0, 2))
+        self.assertEqual((progress['result_year'], progress['result_month'], progress['first_stock_id']), (2026, 9, '2330'))
+        self.assertEqual(StockData.objects.count(), 2)
+        # 已完成的工作不會再被搶下
+        self.assertIsNone(jobs.run_job(job.pk))
+        self.assertIsNone(jobs.run_next_job())
+
+    def test_malformed_upload_fails_the_job(self):
+        job = jobs.run_job(self._submit(b'{"2330": ').pk)
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertTrue(job.errors)
+
+    def test_stale_running_job_is_failed_and_upload_removed(self):
+        job = ImportJob.objects.create(upload=SimpleUploadedFile('a.json', b'{}'), status=ImportJob.STATUS_RUNNING)
+        storage, name = job.upload.storage, job.upload.name
+        old = timezone.now() - datetime.timedelta(minutes=5)
+        ImportJob.objects.filter(pk=job.pk).update(started_at=old, heartbeat_at=old)
+        job.refresh_from_db()
+
+        # 查詢進度只讀取，不改動工作
+        self.assertEqual(jobs.job_progress(job)['status'], ImportJob.STATUS_RUNNING)
+        self.assertEqual(ImportJob.objects.get(pk=job.pk).status, ImportJob.STATUS_RUNNING)
+
+        out = StringIO()
+        call_command('run_import_worker', '--once', stdout=out)
+        self.assertIn('1 筆中斷的工作已標為失敗', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertTrue(job.errors)
+        self.assertFalse(storage.exists(name))
+
+    def test_running_job_with_recent_progress_is_left_alone(self):
+        now = timezone.now()
+        job = ImportJob.objects.create(status=ImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now)
+        self.assertEqual(jobs.reap_stale_jobs(), 0)
+        self.assertEqual(ImportJob.objects.get(pk=job.pk).status, ImportJob.STATUS_RUNNING)
+
+    def test_watchlist_refresh_sends_heartbeats(self):
+        for name in ('A', 'B'):
+            add_codes(Watchlist.objects.create(name=name), ['2330'])
+        calls = []
+        import_stock_json(_upload({'2330': _record('2330')}), on_progress=lambda stats: calls.append(stats['watchlists']))
+        # 重算前、每個清單之後、結束時各一次
+        self.assertEqual(calls, [0, 0, 0, 2])
+
+    def test_finished_job_deletes_upload(self):
+        job = self._submit(_upload({'2330': _record('2330')}).getvalue())
+        storage, name = job.upload.storage, job.upload.name
+        job = jobs.run_job(job.pk)
+        self.assertEqual((job.status, job.rows_inserted), (ImportJob.STATUS_DONE, 1))
+        self.assertEqual(job.upload.name, '')
+        self.assertFalse(storage.exists(name))
+
+
+# =========================================================
+# 報價服務：以本機 fixture 伺服器測試解析、快取、最後收盤價備援與熔斷
+# =========================================================
+class PriceServiceTests(TestCase):
+    def setUp(self):
+        self.provider = pricing.FixtureProvider({'2330': 1050.0, '2317': 150.5})
+        self.addCleanup(self.provider.close)
+        self.service = pricing.PriceService(provider=self.provider, ttl=60, negative_ttl=0, persist=True)
+        self.service.breaker_threshold = 2
+        self.service.breaker_cooldown = 60
+
+    def test_parse_price(self):
+        self.assertEqual(pricing.parse_price('<ul><li>1,050.00</li><li>成交價</li></ul>'), 1050.0)
+        # 找不到「成交價」時取第 5 個 ul 的第一個 li
+        uls = ''.join(f'<ul><li>{i}</li></ul>' for i in range(1, 8))
+        self.assertEqual(pricing.parse_price(uls), 5.0)
+        self.assertIsNone(pricing.parse_price('<p>維護中</p>'))
+
+    def test_live_quote_is_cached_and_persisted(self):
+        quote = self.service.get_quote('2330')
+        self.assertEqual((quote['price'], quote['source'], quote['stale']), (1050.0, 'fixture', False))
+        self.assertEqual(self.service.get_price('2330'), 1050.0)
+        self.assertEqual(self.provider.server.hits['2330'], 1)
+        self.assertEqual(PriceQuote.objects.get(stock_id='2330').price, 1050.0)
+
+    def test_unknown_ticker_has_no_price(self):
+        quote = self.service.get_quote('0000')
+        self.assertEqual((quote['price'], quote['stale']), (None, False))
+        self.service.get_quote('0000')
+        self.assertEqual(self.provider.server.hits['0000'], 2)
+
+    def test_big5_page(self):
+        self.provider.server.charset = 'big5'
+        self.assertEqual(self.service.get_price('2317'), 150.5)
+
+    def test_concurrent_calls_share_one_request(self):
+        self.provider.server.delay = 0.2
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.service._get_live('2330')[0])) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [1050.0] * 5)
+        self.assertEqual(self.provider.server.hits['2330'], 1)
+
+    def test_batch_quotes(self):
+        quotes = self.service.get_quotes(['2330', '2317', '0000'])
+        self.assertEqual({sid: q['price'] for sid, q in quotes.items()}, {'2330': 1050.0, '2317': 150.5, '0000': None})
+        self.assertFalse(any(q['timed_out'] for q in quotes.values()))
+
+    def test_stale_fallback_and_breaker(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        PriceQuote.objects.create(stock_id='2317', quote_date=yesterday, price=148.0, source='fixture')
+        self.provider.server.stop()     # 來源連線失敗
+
+        calls = []
+        fetch = self.provider.fetch
+        self.provider.fetch = lambda sid: calls.append(sid) or fetch(sid)
+
+        quote = self.service.get_quote('2317')
+        self.assertEqual((quote['price'], quote['as_of'], quote['stale']), (148.0, yesterday, True))
+        self.assertFalse(self.service.breaker_open())
+        self.assertIsNone(self.service.get_quote('2330')['price'])
+        self.assertTrue(self.service.breaker_open())
+
+        # 熔斷期間不再呼叫來源，直接回傳最後收盤價
+        quote = self.service.get_quote('2317')
+        self.assertEqual((quote['price'], quote['stale']), (148.0, True))
+        self.assertEqual(len(calls), 2)
+
+    def test_only_source_errors_are_absorbed(self):
+        self.provider.fetch = mock.Mock(side_effect=ValueError('bad page'))
+        self.assertIsNone(self.service.get_quote('2330')['price'])
+        self.assertEqual(self.service._failures, 1)
+        self.assertIn('stockapp_quote_errors_total{error="ValueError",provider="fixture"}', metrics.registry.render())
+        # 程式錯誤照常拋出，不當成查無報價
+        self.provider.fetch = mock.Mock(side_effect=TypeError('bug'))
+        with self.assertRaises(TypeError):
+            self.service.get_quote('2317')
+
+    def test_load_price_snapshot(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write('代碼,收盤價,date\n2330,"1,045.00",2026-10-16\n2317,150.5,\n0050,-,\n')
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('load_price_snapshot', f.name, stdout=out)
+        self.assertIn('2 筆', out.getvalue())
+        self.assertEqual(
+            sorted(PriceQuote.objects.values_list('stock_id', 'quote_date', 'price', 'source')),
+            [('2317', datetime.date.today(), 150.5, 'snapshot'), ('2330', datetime.date(2026, 10, 16), 1045.0, 'snapshot')])
+
+
+# =========================================================
+# 批次報價：多檔並行抓取，逾時的代碼另外列出
+# =========================================================
+class BatchQuoteTests(TestCase):
+    IDS = ['2330', '2317', '2454', '2412', '1101']
+
+    def setUp(self):
+        self.server = QuoteFixtureServer({sid: 100.0 + i for i, sid in enumerate(self.IDS)}, delay=0.3).start()
+        self.addCleanup(self.server.stop)
+        self.service = pricing.PriceService(url_template=self.server.url_template, negative_ttl=0, persist=False)
+
+    def test_fetches_concurrently(self):
+        started = time.perf_counter()
+        prices, timed_out = self.service.get_many(self.IDS + ['0000', '2330'])
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(prices, dict({sid: 100.0 + i for i, sid in enumerate(self.IDS)}, **{'0000': None}))
+        self.assertEqual(timed_out, [])
+
+    def test_timed_out_ids_are_listed(self):
+        prices, timed_out = self.service.get_many(self.IDS[:2], timeout=0.05)
+        self.assertEqual((prices, timed_out), ({}, self.IDS[:2]))
+
+    def test_late_results_are_written_back(self):
+        saved = threading.Event()
+        with mock.patch.object(self.service, 'save_quotes', side_effect=lambda prices: prices and saved.set()) as save:
+            self.assertEqual(self.service.get_many(['2330'], timeout=0.05), ({}, ['2330']))
+            self.assertTrue(saved.wait(2))
+        save.assert_called_with({'2330': 100.0})
+        with self.service._lock:
+            self.assertEqual(self.service._cache_get('2330'), (True, 100.0))
+
+    def test_api_validates_ids(self):
+        self.assertEqual(self.client.get('/api/quotes').status_code, 400)
+        too_many = ','.join(str(1000 + i) for i in range(201))
+        self.assertEqual(self.client.get(f'/api/quotes?ids={too_many}').status_code, 400)
+        self.assertEqual(self.client.get('/api/quotes?ids=2330&timeout=x').status_code, 400)
+
+
+# =========================================================
+# 試算：向量化 simulate 與單檔 simulate_stock 結果一致
+# =========================================================
+# (代碼, Predict_Rev, YoY_Use, Net_Avg, Capital, PE_Use_H, PE_Use_L, 即時價)
+ENGINE_ROWS = [
+    ('1101', 120.0, '20.00%', '10.00%', '10', 15.0, 10.0, 110.0),
+    ('1102', 80.5, '-5.50%', '12.25%', '25.5', 22.0, 12.5, 95.0),
+    ('1103', 1500.0, '35%', '3.10%', '300', 30.0, 18.0, 15.0),
+    ('2317', 4000.0, '-100%', '5%', '1386.3', 12.0, 8.0, 150.0),
+    ('2330', 2300.0, '0%', '40%', '2593.3', 25.0, 16.0, 1050.0),
+]
+
+
+class EngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({
+            sid: _record(sid, Predict_Rev=rev, YoY_Use=yoy, Net_Avg=net, Capital=cap, PE_Use_H=pe_h, PE_Use_L=pe_l)
+            for sid, rev, yoy, net, cap, pe_h, pe_l, _ in ENGINE_ROWS
+        }))
+
+    def test_simulate_matches_simulate_stock(self):
+        universe = load_universe(2026, 9)
+        self.assertEqual(list(universe['stock_id']), [r[0] for r in ENGINE_ROWS])
+        pers = dict(StockData.objects.values_list('stock_id', 'normalized'))
+        prices = np.array([r[-1] for r in ENGINE_ROWS])
+        for params in ({}, {'yoy': 0.08, 'net': 0.12}, {'pe_h': 18.0, 'pe_l': 9.0}):
+            res = simulate(universe, prices=prices, **params)
+            for i, sid in enumerate(universe['stock_id']):
+                with self.subTest(stock_id=sid, **params):
+                    one = simulate_stock(pers[sid], live_price=prices[i], with_details=False, **params)
+                    for key in ('eps', 'target_h', 'target_l', 'sim_rev'):
+                        self.assertAlmostEqual(res[key][i], one[key], places=6)
+                    for key in ('upside', 'downside', 'rr'):
+                        self.assertAlmostEqual(res[key][i], one[key], places=9)
+
+    def test_simulate_api(self):
+        rows = self.client.get('/api/simulate?year=2026&month=9&net=10').json()['rows']
+        eps = [row['eps'] for row in rows]
+        self.assertEqual(len(rows), len(ENGINE_ROWS))
+        self.assertEqual(eps, sorted(eps, reverse=True))
+        rows = self.client.get('/api/simulate?year=2026&month=9&sort=target_l&order=asc&limit=2').json()['rows']
+        self.assertEqual(len(rows), 2)
+        self.assertLessEqual(rows[0]['target_l'], rows[1]['target_l'])
+
+        self.assertEqual(self.client.get('/api/simulate?year=2026').status_code, 400)
+        self.assertEqual(self.client.get('/api/simulate?year=2026&month=9&sort=name').status_code, 400)
+
+    def test_explain(self):
+        payload = self.client.get('/api/simulate?year=2026&month=9&explain=1101').json()
+        self.assertEqual(payload['details'][-1]['result'], '高 180.0 / 低 120.0')
+
+
+# =========================================================
+# 敏感度矩陣：格點與逐點 simulate_stock 一致
+# =========================================================
+class SensitivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({'1101': _record('1101', Predict_Rev=150.0, YoY_Use='25%', Net_Avg='8%', Capital='12.5')}))
+
+    def test_parse_range(self):
+        np.testing.assert_allclose(parse_range('-10:10:5', scale=100), [-0.1, -0.05, 0, 0.05, 0.1])
+        np.testing.assert_allclose(parse_range('0:1:0.3'), [0, 0.3, 0.6, 0.9])
+        np.testing.assert_allclose(parse_range('8, 12,16'), [8, 12, 16])
+        self.assertEqual(len(parse_range(f'0:{MAX_GRID_CELLS - 1}:1')), MAX_GRID_CELLS)
+        for text in ('', '1:2', '5:1:1', '0:1:0', 'a:b:c'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_range(text)
+
+    def test_parse_range_limits(self):
+        bad = [
+            '0:1:-1', '0:inf:1', '-inf:0:1', '0:1:nan', '1,inf,2',
+            f'0:{MAX_GRID_CELLS}:1', '0:1e9:1', '0:1:1e-300', '-1e308:1e308:1',
+        ]
+        for text in bad:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_range(text)
+
+    def test_grid_matches_simulate_stock(self):
+        per = StockData.objects.get(stock_id='1101').normalized
+        yoy, net, pe = [-0.1, 0.0, 0.3], [0.05, 0.12], [8.0, 15.0]
+        grid = sensitivity_grid(per, yoy, net, pe, live_price=40.0)
+        self.assertEqual(grid['target'].shape, (3, 2, 2))
+        for i, y in enumerate(yoy):
+            for j, n in enumerate(net):
+                for k, p in enumerate(pe):
+                    one = simulate_stock(per, yoy=y, net=n, pe_h=p, pe_l=p, live_price=40.0, with_details=False)
+                    self.assertEqual(grid['eps'][i, j], one['eps'])
+                    self.assertEqual(grid['target'][i, j, k], one['target_h'])
+                    self.assertAlmostEqual(grid['upside'][i, j, k], one['upside'], places=9)
+
+    def test_grid_size_is_capped(self):
+        with self.assertRaises(ValueError):
+            sensitivity_grid({}, np.zeros(1000), np.zeros(1000), np.zeros(1000))
+
+    def test_api(self):
+        url = '/api/sensitivity?stock_id=1101&year=2026&month=9'
+        payload = self.client.get(f'{url}&yoy=0:10:5&net=5,10&pe=10').json()
+        self.assertEqual((payload['yoy'], payload['net'], payload['pe']), ([0.0, 5.0, 10.0], [5.0, 10.0], [10.0]))
+        self.assertEqual(np.shape(payload['target']), (3, 2, 1))
+        for yoy in ('0:1:0', '0:inf:1', '0:1e9:1'):
+            with self.subTest(yoy=yoy):
+                self.assertEqual(self.client.get(f'{url}&yoy={yoy}').status_code, 400)
+        self.assertEqual(self.client.get('/api/sensitivity?stock_id=9999&year=2026&month=9').status_code, 404)
+        self.assertEqual(self.client.get('/api/sensitivity?stock_id=1101').status_code, 400)
+
+
+# =========================================================
+# 反正規化欄位：匯入時由 raw_data 抽出，評等另存 StockRating
+# =========================================================
+class ParsingTests(SimpleTestCase):
+    def test_to_float(self):
+        self.assertEqual(to_float('1,234.5'), 1234.5)
+        self.assertEqual(to_float(' 12.5% '), 12.5)
+        self.assertEqual(to_float(3), 3.0)
+        for val in (None, True, '-', '', 'N/A'):
+            with self.subTest(val=val):
+                self.assertIsNone(to_float(val))
+        self.assertEqual(to_float('-', 0.0), 0.0)
+
+    def test_to_pct(self):
+        self.assertAlmostEqual(to_pct('12.5%'), 0.125)
+        self.assertIsNone(to_pct('-'))
+
+
+class HotFieldTests(TestCase):
+    def _import(self, ratings, **per):
+        per = dict({'Total_EPS_Est': '1,024.5', 'Capital': '2,593.3', 'YoY_Use': '12.5%'}, **per)
+        record = _record('2330', **per)
+        record['Six_Indicators'] = dict(
+            {'Name': '測試', 'Average': '85.5'},
+            **{factor: {'Rating': rating, 'Data': []} for factor, rating in ratings.items()})
+        import_stock_json(_upload({'2330': record}))
+        return StockData.objects.get(stock_id='2330')
+
+    def test_hot_fields_are_extracted(self):
+        obj = self._import({'獲利能力': 'AA', '成長能力': 'B'}, Total_EPS_Est='-')
+        self.assertEqual((obj.capital, obj.pe_use_h, obj.six_average), (2593.3, 15.0, 85.5))
+        self.assertAlmostEqual(obj.yoy_use, 0.125)
+        self.assertIsNone(obj.total_eps_est)
+        self.assertEqual(dict(obj.ratings.values_list('factor', 'rating')), {'獲利能力': 'AA', '成長能力': 'B'})
+
+    def test_reimport_replaces_ratings(self):
+        self._import({'獲利能力': 'AA', '成長能力': 'B'})
+        obj = self._import({'獲利能力': 'C'}, Total_EPS_Est=7)
+        self.assertEqual(obj.total_eps_est, 7.0)
+        self.assertEqual(list(StockRating.objects.values_list('factor', 'rating')), [('獲利能力', 'C')])
+
+    def test_save_fills_hot_fields(self):
+        obj = StockData(stock_id='1101', stock_name='測試', data_year=2026, data_month=9, raw_data=_record('1101'))
+        obj.save()
+        obj.refresh_from_db()
+        self.assertEqual((obj.capital, obj.pe_use_l), (10.0, 10.0))
+
+
+# =========================================================
+# 股票目錄：匯入時更新，名稱以最新月份為準
+# =========================================================
+class CatalogueTests(TestCase):
+    def setUp(self):
+        invalidate_catalogue()
+        self.addCleanup(invalidate_catalogue)
+        records = {sid: _record(sid) for sid in ('2330', '2317', '2303', '1101')}
+        records['2330']['Meta']['StockName'] = '台積電'
+        records['2317']['Meta']['StockName'] = '鴻海'
+        import_stock_json(_upload(records))
+
+    def test_catalogue_is_sorted_and_refreshed_after_import(self):
+        self.assertEqual([s['id'] for s in get_catalogue()], ['1101', '2303', '2317', '2330'])
+        import_stock_json(_upload({'2454': _record('2454')}))
+        self.assertEqual([s['id'] for s in get_catalogue()], ['1101', '2303', '2317', '2330', '2454'])
+
+    def test_older_month_does_not_rename(self):
+        old = _record('2330', 2026, 8)
+        old['Meta']['StockName'] = '舊名稱'
+        import_stock_json(_upload({'2330': old}))
+        stock = Stock.objects.get(stock_id='2330')
+        self.assertEqual((stock.stock_name, stock.latest_year, stock.latest_month), ('台積電', 2026, 9))
+
+        new = _record('2330', 2026, 10)
+        new['Meta']['StockName'] = '台積電新'
+        import_stock_json(_upload({'2330': new}))
+        stock.refresh_from_db()
+        self.assertEqual((stock.stock_name, stock.latest_month), ('台積電新', 10))
+
+    def test_prefix_search(self):
+        self.assertEqual([s['id'] for s in search_stocks('23')], ['2303', '2317', '2330'])
+        self.assertEqual(search_stocks('鴻'), [{'id': '2317', 'name': '鴻海'}])
+        self.assertEqual(search_stocks('330'), [])
+        self.assertEqual(len(search_stocks('', limit=2)), 2)
+
+    def test_stocks_api(self):
+        payload = self.client.get('/api/stocks?q=台&limit=x').json()
+        self.assertEqual(payload, {'stocks': [{'id': '2330', 'name': '台積電'}]})
+
+
+def _full_record(sid, year=2026, month=9):
+    """含各分頁資料 (歷史股價、營收、淨利、Q4、六大指標) 的上傳資料。"""
+    record = _record(
+        sid, year, month, Capital=2593.3, Current_Year=year, Current_Year_ROC=year - 1911,
+        H=[1100.5, 980.0, 650.0], L=[780.0, 520.5, 430.0], EPS=[39.2, 32.34, 39.2], PE_H=[28.07, 30.3], PE_L=[19.9, 16.09],
+        Rev_Names=['2026/07', '2026/08'], Rev_Vals=['2,637.89', '3,358.10'],
+        YoY_Names=['2026/07', '2026/08'], YoY_Vals=['25.8%', '33.8%'],
+        Net_Names=['2025Q3', '2025Q4'], Net_Vals=['40.2%', '43.1%'],
+        Detect_Reason='Q4 尚未公布', Latest_Quarter_Str='2026Q2', EPS_Q1=13.94, EPS_Q2=15.36, EPS_Q3=12.5,
+        Q4_Rev_Actual=8684.7, Q4_EPS_Est=14.2, Total_EPS_Est=56.0,
+    )
+    record['Six_Indicators'] = {'Name': '測試', 'Average': 88.5, '獲利能力': {'Rating': 'AA', 'Data': [{'Name': 'ROE', 'Val': '30.2'}]}}
+    return record
+
+
+# =========================================================
+# 投影讀取：各分頁與完整 raw_data 打包的結果相同
+# =========================================================
+class SectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({'2330': _full_record('2330')}))
+
+    def test_lazy_sections_match_full_payload(self):
+        full = get_dashboard_data(StockData.objects.get(stock_id='2330'))
+        expected = {
+            'rev': {'rev_rows': full['rev_rows'], 'yoy_rows': full['yoy_rows']},
+            'net': {'net_rows': full['net_rows']},
+            'q4': {'q4_rows': full['q4_rows']},
+            'six': {'six': full['result']['Six_Indicators']},
+        }
+        for section in LAZY_SECTIONS:
+            with self.subTest(section=section):
+                self.assertEqual(load_section('2330', 2026, 9, section), expected[section])
+        self.assertIsNone(load_section('2330', 2026, 8, 'rev'))
+
+    def test_projection_keeps_json_types(self):
+        record = _record('2317', Name='123', Profit='true', Target_H='null', Detect_Reason='1e3', EPS=[1, '2'], Capital=10)
+        import_stock_json(_upload({'2317': record}))
+        obj = StockData.objects.get(stock_id='2317')
+        keys = list(obj.raw_data['PER_Analysis']) + ['Missing']
+        data = load_projection(StockData.objects.filter(pk=obj.pk), keys, ('Meta', 'Six_Indicators'))
+        self.assertEqual(data['per'], obj.raw_data['PER_Analysis'])
+        self.assertEqual((data['Meta'], data['Six_Indicators']), (obj.raw_data['Meta'], {}))
+
+    def test_home_renders_summary_without_lazy_sections(self):
+        full = get_dashboard_data(StockData.objects.get(stock_id='2330'))
+        response = self.client.post('/', {'stock_id': '2330', 'year': 2026, 'month': 9})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['hist_rows'], full['hist_rows'])
+        self.assertEqual(response.context['result']['PER_Analysis']['Capital'], 2593.3)
+        self.assertNotIn('rev_rows', response.context)
+
+    def test_fragment_view(self):
+        response = self.client.get('/stock/2330/2026/9/rev/')
+        self.assertContains(response, '3,358.10')
+        self.assertEqual(self.client.get('/stock/2330/2026/9/hist/').status_code, 404)
+        self.assertEqual(self.client.get('/stock/2330/2026/8/rev/').status_code, 404)
+
+
+# =========================================================
+# 儀表板快取：命中時不查資料庫，匯入後失效或預熱
+# =========================================================
+class DashboardCacheTests(TestCase):
+    KEYS = [('2330', 2026, 9)]
+
+    def setUp(self):
+        invalidate_dashboard(self.KEYS)
+        self.addCleanup(invalidate_dashboard, self.KEYS)
+        self.record = _full_record('2330')
+        import_stock_json(_upload({'2330': self.record}))
+
+    def _row(self):
+        return find_row(StockData.objects.filter(stock_id='2330', data_year=2026, data_month=9))
+
+    def test_section_is_cached_until_reimport(self):
+        row = self._row()
+        first = get_section(row, 'rev')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_section(row, 'rev'), first)
+            get_section(row, 'rev')
+
+        self.record['PER_Analysis']['Rev_Vals'] = ['1.00', '2.00']
+        import_stock_json(_upload({'2330': self.record}))
+        rows = get_section(self._row(), 'rev')['rev_rows']
+        self.assertEqual([r['val'] for r in rows], ['1.00', '2.00'])
+
+    def test_identical_reupload_keeps_cache(self):
+        first = get_section(self._row(), 'rev')
+        import_stock_json(_upload({'2330': self.record}))
+        row = self._row()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_section(row, 'rev'), first)
+
+    def test_warmed_payloads_match_projected_reads(self):
+        self.record['PER_Analysis']['Q4_EPS_Est'] = 15.1
+        with override_settings(DASHBOARD_CACHE_WARM=True):
+            import_stock_json(_upload({'2330': self.record}))
+        row = self._row()
+        with self.assertNumQueries(0):
+            warmed = {'summary': get_summary(row), 'six': get_section(row, 'six'), 'q4': get_section(row, 'q4')}
+        invalidate_dashboard(self.KEYS)
+        expected = {'summary': get_summary(row), 'six': get_section(row, 'six'), 'q4': get_section(row, 'q4')}
+        self.assertEqual(warmed, expected)
+
+
+# =========================================================
+# 基準測試：模擬上傳檔與小規模的完整量測流程
+# =========================================================
+class BenchTests(TestCase):
+    def test_make_upload_is_deterministic(self):
+        payload = make_upload(5, 2026, 9, seed=3)
+        self.assertEqual(payload, make_upload(5, 2026, 9, seed=3))
+        data = json.loads(payload)
+        self.assertEqual(list(data), ['1101', '1102', '1103', '1104', '1105'])
+        self.assertEqual(data['1103']['Meta']['QueryDate'], '2026-09-15')
+
+    def test_run_size(self):
+        result = run_size(4, 2, repeat=2, log=lambda msg: None)
+        self.assertEqual([(r['month'], r['rows']) for r in result['import']], [(11, 4), (12, 4)])
+        self.assertEqual(result['summary_warm']['queries'], 0)
+        self.assertEqual(result['simulate_vectorized']['n'], 2)
+        self.assertGreater(result['summary_cold']['queries'], 0)
+
+
+# =========================================================
+# 效能量測：直方圖、Prometheus 輸出、階段的查詢數歸屬與 /metrics
+# =========================================================
+class HistogramTests(SimpleTestCase):
+    def test_buckets_and_quantiles(self):
+        hist = metrics.Histogram(buckets=(0.1, 1.0), window=4)
+        for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+            hist.observe(value)
+        counts, total, n, recent = hist.snapshot()
+        self.assertEqual((counts, n), ([2, 1, 2], 5))
+        self.assertAlmostEqual(total, 5.65)
+        self.assertEqual(recent, [0.1, 0.5, 2.0, 3.0])
+        self.assertEqual(hist.quantiles((0.5, 0.99)), {0.5: 0.5, 0.99: 3.0})
+
+    def test_render(self):
+        registry = metrics.Registry()
+        registry.inc('responses', help='回應數', view='home', status='200')
+        registry.inc('responses', 2, view='home', status='200')
+        registry.histogram('stage_seconds', buckets=(0.5,), help='耗時', stage='a"b').observe(0.25)
+        text = registry.render()
+        self.assertIn('# TYPE stockapp_responses_total counter\n', text)
+        self.assertIn('stockapp_responses_total{status="200",view="home"} 3\n', text)
+        self.assertIn('stockapp_stage_seconds_bucket{stage="a\\"b",le="0.5"} 1\n', text)
+        self.assertIn('stockapp_stage_seconds_bucket{stage="a\\"b",le="+Inf"} 1\n', text)
+        self.assertIn('stockapp_stage_seconds_count{stage="a\\"b"} 1\n', text)
+        self.assertIn('stockapp_stage_seconds_recent{stage="a\\"b",quantile="0.5"} 0.25\n', text)
+
+    def test_concurrent_stages_keep_their_own_attribution(self):
+        req = metrics.RequestMetrics()
+
+        async def work(name, delay, queries):
+            with metrics.stage(name):
+                await asyncio.sleep(delay)
+                for _ in range(queries):
+                    req.add_query(0.001)
+
+        async def run():
+            token = metrics._current.set(req)
+            try:
+                with metrics.stage('outer'):
+                    # a 先進入、先結束；共用一個堆疊時 a 的查詢會算到 b，b 的查詢又算到 a
+                    await asyncio.gather(work('a', 0.01, 1), work('b', 0.05, 2))
+                    req.add_query(0.001)
+            finally:
+                metrics._current.reset(token)
+
+        async_to_sync(run)()
+        self.assertEqual({name: n for name, (_, n) in req.stages.items()}, {'outer': 1, 'a': 1, 'b': 2})
+
+    def test_scrape_summary(self):
+        metrics.record_scrape('quotes.test', 0.2, True)
+        metrics.record_scrape('quotes.test', 0.4, False)
+        summary = metrics.scrape_summary()['quotes.test']
+        self.assertEqual((summary['requests'], summary['success_rate']), (2, 0.5))
+
+
+@override_settings(METRICS_SERVER_TIMING=True)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({'2330': _record('2330')}))
+
+    def test_server_timing_attributes_queries_to_stages(self):
+        response = self.client.post('/', {'stock_id': '2330', 'year': 2026, 'month': 9})
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertTrue(timing['lookup'].endswith('desc="1 queries"'))
+        self.assertIn('summary', timing)
+        self.assertIn('render', timing)
+        self.assertIn('queries"', timing['db'])
+        self.assertIn('total', timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/stocks')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('stockapp_request_seconds_bucket{method="GET",view="stocks_api",le="+Inf"}', text)
+        self.assertIn('stockapp_responses_total{status="200",view="stocks_api"}', text)
+        self.assertIn('stockapp_request_queries_count{view="stocks_api"}', text)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics?token=wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics?token=s3cret').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer  s3cret ').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics?format=json', HTTP_AUTHORIZATION='s3cret').status_code, 200)
+
+
+# =========================================================
+# 歷史序列：float64 blob 的打包 / 還原與跨月份查詢
+# =========================================================
+class SeriesPackTests(SimpleTestCase):
+    def test_round_trip(self):
+        blob = pack(['1,234.5', '-', 3, None, '12%'])
+        np.testing.assert_array_equal(unpack(blob), [1234.5, np.nan, 3.0, np.nan, 12.0])
+        np.testing.assert_allclose(unpack(pack(['40.2%', '-5%'], is_pct=True)), [0.402, -0.05])
+        self.assertEqual(pack('not a list'), b'')
+        self.assertEqual(unpack(b'').shape, (0,))
+
+    def test_unpack_shares_the_blob(self):
+        blob = pack([1.0, 2.0])
+        arr = unpack(blob)
+        self.assertFalse(arr.flags.writeable)
+        self.assertIs(arr.base, blob)
+
+    def test_stack_pads_with_nan(self):
+        matrix = stack([pack([1, 2, 3]), None, pack([4])])
+        np.testing.assert_array_equal(matrix, [[1, 2, 3], [np.nan] * 3, [4, np.nan, np.nan]])
+        self.assertEqual(stack([]).shape, (0, 0))
+
+
+class SeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({
+            '2330': _record('2330', 2026, 8, EPS=[10.5, 9.0], Net_Vals=['40%']),
+            '2317': _record('2317', 2026, 8, EPS=['-'], Net_Vals=['5%', '6%']),
+        }))
+        import_stock_json(_upload({'2330': _record('2330', 2026, 9, EPS=[11.0, 10.5, 9.0], Net_Vals=['41%', '40%'])}))
+
+    def test_ticker_history(self):
+        hist = ticker_history('2330', ['eps', 'net_vals'])
+        self.assertEqual((hist['year'].tolist(), hist['month'].tolist()), ([2026, 2026], [8, 9]))
+        np.testing.assert_array_equal(hist['eps'], [[10.5, 9.0, np.nan], [11.0, 10.5, 9.0]])
+        np.testing.assert_allclose(hist['net_vals'], [[0.40, np.nan], [0.41, 0.40]])
+        with self.assertRaises(ValueError):
+            ticker_history('2330', ['eps', 'volume'])
+
+    def test_field_matrix(self):
+        ids, matrix = field_matrix('net_vals', 2026, 8)
+        self.assertEqual(ids.tolist(), ['2317', '2330'])
+        np.testing.assert_allclose(matrix, [[0.05, 0.06], [0.40, np.nan]])
+        ids, matrix = field_matrix('eps', 2026, 8, stock_ids=['2317'])
+        self.assertEqual((ids.tolist(), matrix.shape), (['2317'], (1, 1)))
+
+    def test_series_api(self):
+        payload = self.client.get('/api/series?stock_id=2330&fields=eps').json()
+        self.assertEqual(payload['periods'], ['2026/8', '2026/9'])
+        self.assertEqual(payload['series'], {'eps': [[10.5, 9.0, None], [11.0, 10.5, 9.0]]})
+        payload = self.client.get('/api/series?field=eps&year=2026&month=8').json()
+        self.assertEqual(payload['values'], [[None, None], [10.5, 9.0]])
+        self.assertEqual(self.client.get('/api/series?field=volume&year=2026&month=8').status_code, 400)
+        self.assertEqual(self.client.get('/api/series?field=eps').status_code, 400)
+
+
+# =========================================================
+# 預估修正：匯入時只重算受影響的快照，結果與全部重算相同
+# =========================================================
+class RevisionTests(TestCase):
+    def _import(self, month, eps):
+        import_stock_json(_upload({sid: _record(sid, 2026, month, Total_EPS_Est=v) for sid, v in eps.items()}))
+
+    def _snapshot(self):
+        return sorted(StockRevision.objects.values_list(
+            'code', 'data_year', 'data_month', 'prev_year', 'prev_month', *REVISION_FIELDS, *DELTA_FIELDS))
+
+    def test_month_inserted_between_existing_snapshots(self):
+        self._import(8, {'2330': 40.0, '2317': 10.0})
+        self._import(10, {'2330': 50.0, '2317': 9.0})
+        self.assertEqual(
+            [(r['data_month'], r['prev_month'], r['total_eps_est_delta']) for r in ticker_trend('2330')],
+            [(8, None, None), (10, 8, 10.0)])
+
+        # 補上 9 月：9 月與 8 月比較，10 月改為與 9 月比較
+        self._import(9, {'2330': 44.0})
+        trend = ticker_trend('2330')
+        self.assertEqual(
+            [(r['data_month'], r['prev_month'], r['total_eps_est_delta'], r['eps_delta_pct']) for r in trend],
+            [(8, None, None, None), (9, 8, 4.0, 0.1), (10, 9, 6.0, 0.136364)])
+        self.assertEqual([r['prev_month'] for r in ticker_trend('2317')], [None, 8])
+
+        incremental = self._snapshot()
+        rebuild_revisions(StockData.objects.all())
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_ranking(self):
+        self._import(8, {'2330': 40.0, '2317': 10.0, '2454': 0.0, '1101': 5.0})
+        self._import(9, {'2330': 44.0, '2317': 8.0, '2454': 1.0, '1101': '-'})
+        rows = revision_ranking(2026, 9, 'up')
+        self.assertEqual([(r['code'], r['total_eps_est_delta']) for r in rows], [('2330', 4.0), ('2454', 1.0), ('2317', -2.0)])
+        self.assertEqual([r['code'] for r in revision_ranking(2026, 9, 'down_pct')], ['2317', '2330'])
+        self.assertEqual(rows[0]['stock_name'], '測試2330')
+
+        payload = self.client.get('/revisions/?format=json&sort=down&limit=1').json()
+        self.assertEqual((payload['year'], payload['month'], [r['code'] for r in payload['rows']]), (2026, 9, ['2317']))
+        self.assertContains(self.client.get('/stock/2330/trend/'), '2026')
+        self.assertEqual(self.client.get('/stock/9999/trend/').status_code, 404)
+
+
+# =========================================================
+# 選股器：索引欄位篩選與逐筆掃描 raw_data 的結果相同
+# =========================================================
+def _rated(sid, ratings, average, **per):
+    record = _record(sid, **per)
+    six = {'Name': '測試', 'Average': average}
+    six.update({factor: {'Rating': rating, 'Data': []} for factor, rating in ratings.items()})
+    record['Six_Indicators'] = six
+    return record
+
+
+class ScreenerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({
+            '2330': _rated('2330', {'獲利能力': 'AA', '成長性': 'A', '安全性': 'B'}, 80.0, PE_Use_H=11.0, YoY_Use='25.00%', Total_EPS_Est=50.0),
+            '2317': _rated('2317', {'獲利能力': 'AAA', '成長性': 'C', '安全性': 'A'}, 70.0, PE_Use_H=9.0, YoY_Use='-5.00%', Total_EPS_Est=12.0),
+            '2454': _rated('2454', {'獲利能力': 'B', '成長性': 'AA', '安全性': 'AA'}, 60.0, PE_Use_H=-3.0, YoY_Use='30.00%', Total_EPS_Est=-1.0),
+            '1101': _rated('1101', {'獲利能力': 'C'}, 40.0, PE_Use_H=8.0, YoY_Use='2.00%', Total_EPS_Est=3.0),
+        }))
+
+    def _codes(self, **criteria):
+        return sorted(screen(2026, 9, **criteria).values_list('stock_id', flat=True))
+
+    def test_criteria(self):
+        self.assertEqual(self._codes(min_good=2), ['2317', '2330', '2454'])
+        self.assertEqual(self._codes(pe_max=10), ['1101', '2317'])  # 負本益比不算低本益比
+        self.assertEqual(self._codes(yoy_min=0.1), ['2330', '2454'])
+        self.assertEqual(self._codes(eps_min=10, six_min=75), ['2330'])
+        self.assertEqual(self._codes(factors=['成長性']), ['2330', '2454'])
+        self.assertEqual(self._codes(min_good=2, pe_max=12, yoy_min=0), ['2330'])
+
+    def test_matches_raw_data_scan(self):
+        good = {'AAA', 'AA', 'A'}
+        expected = sorted(
+            d.stock_id for d in StockData.objects.all()
+            if sum(1 for k, v in d.raw_data['Six_Indicators'].items() if isinstance(v, dict) and v.get('Rating') in good) >= 2
+            and d.raw_data['Six_Indicators'].get('安全性', {}).get('Rating') in good
+        )
+        self.assertEqual(self._codes(min_good=2, factors=['安全性']), expected)
+
+    def test_parse_criteria(self):
+        criteria = parse_criteria({'min_good': '3', 'yoy_min': '10', 'factors': '獲利能力, 成長性'})
+        self.assertEqual((criteria['min_good'], criteria['yoy_min'], criteria['factors']), (3, 0.1, ['獲利能力', '成長性']))
+        with self.assertRaises(ValueError):
+            parse_criteria({'pe_max': 'abc'})
+
+    def test_screener_api(self):
+        payload = self.client.get('/api/screener?min_good=2&sort=pe&order=asc&page_size=2').json()
+        self.assertEqual((payload['year'], payload['month'], payload['count'], payload['num_pages']), (2026, 9, 3, 2))
+        self.assertEqual([r['stock_id'] for r in payload['rows']], ['2454', '2317'])
+        self.assertEqual(payload['rows'][1]['yoy_use'], -5.0)
+        self.assertEqual(self.client.get('/api/screener?sort=name').status_code, 400)
+        self.assertContains(self.client.get('/screener/?factors=成長性'), '2454')
+
+
+# =========================================================
+# 串流匯出：分批結果與單檔試算一致，CSV / NDJSON 欄位完整
+# =========================================================
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({
+            '1101': _record('1101'),
+            '2317': _record('2317', Predict_Rev=4000.0, Net_Avg='5%', Capital='1386.3', Now_Price=150.0),
+            '2330': _record('2330', Predict_Rev=2300.0, Net_Avg='40%', Capital='2593.3', Now_Price=1050.0),
+        }))
+        import_stock_json(_upload({'2330': _record('2330', month=8)}))
+
+    def _rows(self, qs, sim_params=None, chunk_size=2000):
+        return [row for rows in iter_row_chunks(qs, sim_params, chunk_size=chunk_size) for row in rows]
+
+    def test_rows_match_simulate_stock(self):
+        qs = export_queryset(2026, 9)
+        rows = self._rows(qs, {'net': 0.12})
+        self.assertEqual([r['stock_id'] for r in rows], ['1101', '2317', '2330'])
+        self.assertEqual(self._rows(qs, {'net': 0.12}, chunk_size=1), rows)
+        for row in rows:
+            obj = StockData.objects.get(stock_id=row['stock_id'], data_month=9)
+            one = simulate_stock(obj.normalized, net=0.12, live_price=obj.normalized['Now_Price'], with_details=False)
+            with self.subTest(stock_id=row['stock_id']):
+                self.assertEqual(row['Net_Avg'], obj.raw_data['PER_Analysis']['Net_Avg'])
+                self.assertAlmostEqual(row['sim_eps'], one['eps'], places=4)
+                self.assertAlmostEqual(row['sim_target_h'], one['target_h'], places=4)
+                self.assertAlmostEqual(row['sim_upside'], one['upside'] * 100, places=4)
+        self.assertEqual((rows[0]['sim_target_h'], rows[0]['sim_upside']), (216.0, 116.0))
+
+    def test_csv_and_ndjson(self):
+        response = self.client.get('/api/export.csv?ids=2330')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="stocks_all_all.csv"')
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(body.startswith('\ufeff'))
+        table = list(csv.reader(io.StringIO(body.lstrip('\ufeff'))))
+        self.assertEqual(table[0], COLUMNS)
+        self.assertEqual([(r[0], r[3]) for r in table[1:]], [('2330', '8'), ('2330', '9')])
+
+        response = self.client.get('/api/export.ndjson?year=2026&month=9&yoy=10')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([r['stock_id'] for r in rows], ['1101', '2317', '2330'])
+        self.assertEqual({r['sim_yoy'] for r in rows}, {10.0})
+        self.assertEqual(self.client.get('/api/export.ndjson?year=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/export.xml').status_code, 404)
+
+    def test_criteria_default_to_latest_month(self):
+        def rows(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]
+
+        latest = rows('/api/export.csv?year=2026&month=9&min_good=0')
+        self.assertEqual(len(latest), 3)
+        self.assertEqual(rows('/api/export.csv?min_good=0'), latest)
+        self.assertEqual(len(rows('/api/export.csv')), 4)
+        self.assertEqual(self.client.get('/api/export.csv?min_good=0&year=2026').status_code, 400)
+
+
+# =========================================================
+# async 報價與單檔試算：同一事件迴圈內並行等待，快取與同步版共用
+# =========================================================
+class AsyncQuoteTests(TestCase):
+    IDS = ['2330', '2317', '2454', '2412', '1101']
+
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({'1101': _record('1101')}))
+
+    def setUp(self):
+        self.server = QuoteFixtureServer({sid: 100.0 + i for i, sid in enumerate(self.IDS)}, delay=0.3).start()
+        self.addCleanup(self.server.stop)
+        self.sync = pricing.PriceService(url_template=self.server.url_template, ttl=60, negative_ttl=0, persist=False)
+        patcher = mock.patch.object(pricing, '_service', self.sync)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_many_waits_concurrently_and_shares_the_cache(self):
+        service = pricing.get_async_price_service()
+        started = time.perf_counter()
+        prices, timed_out = async_to_sync(service.get_many)(self.IDS + ['2330'])
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual((prices, timed_out), ({sid: 100.0 + i for i, sid in enumerate(self.IDS)}, []))
+        # 同步版直接命中同一份快取
+        self.assertEqual(self.sync.get_price('2317'), 101.0)
+        self.assertEqual(self.server.hits['2330'], 1)
+        self.assertEqual(self.server.hits['2317'], 1)
+
+    def test_concurrent_calls_share_one_request(self):
+        async def run():
+            service = pricing.get_async_price_service()
+            return await asyncio.gather(*(service.get_price('2454') for _ in range(5)))
+
+        self.assertEqual(async_to_sync(run)(), [102.0] * 5)
+        self.assertEqual(self.server.hits['2454'], 1)
+
+    def test_late_results_are_written_back(self):
+        async def run():
+            quotes = await pricing.get_async_price_service().get_quotes(['2330'], timeout=0.05)
+            for _ in range(40):
+                if save.call_count > 1:
+                    break
+                await asyncio.sleep(0.05)
+            return quotes
+
+        with mock.patch.object(self.sync, 'save_quotes') as save:
+            self.assertTrue(async_to_sync(run)()['2330']['timed_out'])
+        save.assert_called_with({'2330': 100.0})
+
+    async def test_quotes_api(self):
+        payload = (await AsyncClient().get('/api/quotes?ids=2330,0000')).json()
+        self.assertEqual((payload['quotes'], payload['stale'], payload['failed'], payload['timed_out']), ({'2330': 100.0}, {}, ['0000'], []))
+
+    def test_stock_simulate_api(self):
+        payload = self.client.get('/api/simulate/1101?net=12').json()
+        self.assertEqual((payload['year'], payload['month'], payload['live_price']), (2026, 9, 104.0))
+        self.assertEqual((payload['net'], payload['target_h']), (12.0, 216.0))
+        self.assertTrue(payload['details'])
+        self.assertEqual(self.client.get('/api/simulate/9999').status_code, 404)
+        self.assertEqual(self.client.get('/api/simulate/1101?yoy=x').status_code, 400)
+
+
+# =========================================================
+# 上傳驗證：匯入時一次轉好數值，錯誤逐檔列出
+# =========================================================
+class ValidationTests(SimpleTestCase):
+    def test_normalized_values(self):
+        normalized, warnings = validate_record('2330', _record('2330', Capital='2,593.3', Profit='x'))
+        self.assertEqual(
+            (normalized['Capital'], normalized['YoY_Use'], normalized['Net_Avg'], normalized['PE_Use_H']),
+            (2593.3, 0.2, 0.1, 15.0))
+        self.assertNotIn('Profit', normalized)
+        self.assertEqual(warnings, ["Profit 無法轉為數字 ('x')，視為缺值"])
+
+    def test_structural_errors_are_listed(self):
+        record = _record('2330')
+        record['Meta']['TargetMonth'] = 13
+        record['Six_Indicators'] = []
+        with self.assertRaises(RecordInvalid) as cm:
+            validate_record('2330', record)
+        self.assertEqual(cm.exception.errors, ["TargetMonth 應為 1–12 (13)", "Six_Indicators 應為物件"])
+        with self.assertRaises(RecordInvalid):
+            validate_record('2330', {'Meta': {}})
+
+    def test_unusable_simulation_inputs_only_warn(self):
+        record = _record('2330', Capital='-')
+        del record['PER_Analysis']['PE_Use_L']
+        normalized, warnings = validate_record('2330', record)
+        self.assertNotIn('Capital', normalized)
+        self.assertEqual(warnings, [
+            "Capital 無法轉為數字 ('-')，視為缺值", "模擬試算無法使用 (缺少 Capital；缺少 PE_Use_L)"])
+        self.assertEqual(sim_problems({**normalized, 'Capital': 0.0, 'PE_Use_L': 1.0}), ["Capital 必須大於 0 (0)"])
+
+    def test_report_is_capped(self):
+        report = ValidationReport(limit=1)
+        for sid in ('1101', '1102', '1103'):
+            report.reject(RecordInvalid(sid, ["缺少 Capital"]))
+        report.warn('2330', ["Profit 無法轉為數字 ('x')，視為缺值"])
+        self.assertEqual(report.lines(), [
+            "1101：缺少 Capital", "... 另有 2 檔驗證失敗", "2330 (警告)：Profit 無法轉為數字 ('x')，視為缺值"])
+
+
+class NormalizedImportTests(TestCase):
+    def setUp(self):
+        service = pricing.PriceService(provider=pricing.FixtureProvider({}), persist=False)
+        self.addCleanup(service.provider.close)
+        patcher = mock.patch.object(pricing, '_service', service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_import_stores_normalized_values(self):
+        stats = import_stock_json(_upload({'2330': _record('2330', Capital='2,593.3'), '2317': _record('2317', PE_Use_H='-')}))
+        self.assertEqual((stats['inserted'], stats['rejected']), (2, 0))
+        obj = StockData.objects.get(stock_id='2330')
+        self.assertEqual((obj.normalized['Capital'], obj.capital), (2593.3, 2593.3))
+        self.assertEqual(obj.raw_data['PER_Analysis']['Capital'], '2,593.3')
+        self.assertIn('2317', stats['validation'].warnings)
+        self.assertNotIn('PE_Use_H', StockData.objects.get(stock_id='2317').normalized)
+
+    def test_single_stock_simulation_is_refused(self):
+        import_stock_json(_upload({'2317': _record('2317', Capital='-')}))
+        response = self.client.get('/api/simulate/2317')
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('缺少 Capital', response.json()['error'])
+        self.assertEqual(self.client.get('/api/sensitivity?stock_id=2317&year=2026&month=9').status_code, 422)
+        payload = self.client.get('/api/simulate?year=2026&month=9&explain=2317').json()
+        self.assertNotIn('details', payload)
+
+    def test_batch_outputs_are_null_for_unusable_inputs(self):
+        import_stock_json(_upload({
+            '1101': _record('1101'), '2317': _record('2317', Capital='-'), '2454': _record('2454', Capital='0'),
+        }))
+        payload = self.client.get('/api/simulate?year=2026&month=9&net=12').json()
+        rows = {r['stock_id']: r for r in payload['rows']}
+        self.assertEqual(rows['1101']['target_h'], 216.0)
+        for sid in ('2317', '2454'):
+            with self.subTest(stock_id=sid):
+                self.assertEqual((rows[sid]['sim_rev'], rows[sid]['eps'], rows[sid]['target_h'], rows[sid]['target_l']),
+                                 (None, None, None, None))
+        # 無法試算的排在最後
+        self.assertEqual(payload['rows'][0]['stock_id'], '1101')
+
+        response = self.client.get('/api/export.ndjson?year=2026&month=9&net=12')
+        exported = {r['stock_id']: r for r in map(json.loads, b''.join(response.streaming_content).decode('utf-8').splitlines())}
+        self.assertEqual(exported['1101']['sim_eps'], 14.4)
+        self.assertEqual((exported['2317']['sim_eps'], exported['2317']['sim_target_h']), (None, None))
+        self.assertIsNone(exported['2454']['sim_eps'])
+
+        wl = Watchlist.objects.create(name='缺值')
+        add_codes(wl, ['2317', '2454'])
+        precompute(wl)
+        self.assertEqual(set(WatchlistValuation.objects.filter(watchlist=wl).values_list('eps', 'target_h')), {(None, None)})
+
+
+# =========================================================
+# 自選清單：估值預先算好，匯入後只重算受影響的清單
+# =========================================================
+class WatchlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({
+            '1101': _record('1101'),
+            '2317': _record('2317', Predict_Rev=4000.0, Net_Avg='5%', Capital='1386.3', Now_Price=150.0),
+        }))
+        import_stock_json(_upload({'1101': _record('1101', month=8, Now_Price=50.0)}))
+
+    def _watchlist(self, name, codes, **params):
+        wl = Watchlist.objects.create(name=name, **params)
+        add_codes(wl, codes)
+        precompute(wl)
+        return wl
+
+    def test_parse_codes(self):
+        self.assertEqual(parse_codes('2330, 2317、2330\n00878 tsm'), ['2330', '2317', '00878', 'TSM'])
+        with self.assertRaises(ValueError):
+            parse_codes('2330 23-17')
+
+    def test_precompute_uses_latest_snapshot(self):
+        wl = self._watchlist('權值股', ['1101', '9999'], sim_net=0.12)
+        rows = {v.code: v for v in WatchlistValuation.objects.filter(watchlist=wl)}
+        self.assertEqual(set(rows), {'1101', '9999'})
+        v = rows['1101']
+        self.assertEqual((v.data_month, v.price, v.price_source), (9, 100.0, 'upload'))
+        self.assertEqual((v.eps, v.target_h, v.target_l, v.upside), (14.4, 216.0, 144.0, 1.16))
+        self.assertIsNone(rows['9999'].eps)
+
+    def test_refresh_only_touches_affected_watchlists(self):
+        a = self._watchlist('A', ['1101'])
+        b = self._watchlist('B', ['2317'])
+        before = dict(Watchlist.objects.values_list('name', 'valued_at'))
+        stats = import_stock_json(_upload({'1101': _record('1101', Now_Price=120.0)}))
+        self.assertEqual(stats['watchlists'], 1)
+        after = dict(Watchlist.objects.values_list('name', 'valued_at'))
+        self.assertGreater(after['A'], before['A'])
+        self.assertEqual(after['B'], before['B'])
+        self.assertEqual(WatchlistValuation.objects.get(watchlist=a, code='1101').price, 120.0)
+        # 以代碼索引找出受影響的清單，不把所有成員讀進來
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(refresh_for_codes(['0050']), 0)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('"code" IN', ctx.captured_queries[0]['sql'])
+        self.assertEqual(WatchlistValuation.objects.filter(watchlist=b).count(), 1)
+
+    def test_views(self):
+        response = self.client.post('/watchlists/', {'name': '觀察', 'codes': '2317 1101'})
+        wl = Watchlist.objects.get(name='觀察')
+        self.assertRedirects(response, f'/watchlists/{wl.pk}/')
+        self.client.post(f'/watchlists/{wl.pk}/', {'action': 'params', 'sim_yoy': '', 'sim_net': '12', 'sim_pe_h': '', 'sim_pe_l': ''})
+
+        payload = self.client.get(f'/watchlists/{wl.pk}/?format=json&sort=upside&order=desc').json()
+        self.assertEqual(payload['params']['sim_net'], 0.12)
+        self.assertEqual([r['code'] for r in payload['rows']], ['1101', '2317'])
+        self.assertEqual(payload['rows'][0]['eps'], 14.4)
+
+        self.client.post('/watchlists/', {'name': '觀察', 'codes': '2330'})
+        self.assertEqual(Watchlist.objects.count(), 1)
+        self.client.post(f'/watchlists/{wl.pk}/', {'action': 'delete'})
+        self.assertFalse(Watchlist.objects.exists())
+
+
+# =========================================================
+# JSON Merge Patch：RFC 7386 附錄 A 的範例
+# =========================================================
+class MergePatchTests(SimpleTestCase):
+    CASES = [
+        ({"a": "b"}, {"a": "c"}, {"a": "c"}),
+        ({"a": "b"}, {"b": "c"}, {"a": "b", "b": "c"}),
+        ({"a": "b"}, {"a": None}, {}),
+        ({"a": "b", "b": "c"}, {"a": None}, {"b": "c"}),
+        ({"a": ["b"]}, {"a": "c"}, {"a": "c"}),
+        ({"a": "c"}, {"a": ["b"]}, {"a": ["b"]}),
+        ({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}, {"a": {"b": "d"}}),
+        ({"a": [{"b": "c"}]}, {"a": [1]}, {"a": [1]}),
+        (["a", "b"], ["c", "d"], ["c", "d"]),
+        ({"a": "b"}, ["c"], ["c"]),
+        ({"a": "foo"}, None, None),
+        ({"a": "foo"}, "bar", "bar"),
+        ({"e": None}, {"a": 1}, {"e": None, "a": 1}),
+        ([1, 2], {"a": "b", "c": None}, {"a": "b"}),
+        ({}, {"a": {"bb": {"ccc": None}}}, {"a": {"bb": {}}}),
+    ]
+
+    def test_rfc7386_examples(self):
+        for base, patch, expected in self.CASES:
+            with self.subTest(base=base, patch=patch):
+                self.assertEqual(merge_patch(base, patch), expected)
+
+    def test_base_not_modified(self):
+        base = {"a": {"b": 1}, "c": 2}
+        merge_patch(base, {"a": {"b": None}, "c": None})
+        self.assertEqual(base, {"a": {"b": 1}, "c": 2})
+
+    def test_content_hash_ignores_key_order(self):
+        self.assertEqual(content_hash({"a": 1, "b": [1, 2]}), content_hash({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(content_hash({"a": 1}), content_hash({"a": 1.5}))
+
+
+# =========================================================
+# 匯入：未變更的資料列略過、差異更新
+# =========================================================
+class IncrementalImportTests(TestCase):
+    def setUp(self):
+        self.data = json.loads(make_upload(30, 2026, 9))
+        stats = import_stock_json(_upload(self.data))
+        self.assertEqual((stats['inserted'], stats['updated'], stats['rejected']), (30, 0, 0))
+
+    def test_reimport_identical_skips_every_row(self):
+        before = dict(StockData.objects.values_list('stock_id', 'update_date'))
+        stats = import_stock_json(_upload(self.data), batch_size=7)
+        self.assertEqual((stats['inserted'], stats['updated'], stats['skipped']), (0, 0, 30))
+        self.assertEqual(dict(StockData.objects.values_list('stock_id', 'update_date')), before)
+
+    def test_force_rewrites_unchanged_rows(self):
+        stats = import_stock_json(_upload(self.data), force=True)
+        self.assertEqual((stats['updated'], stats['skipped']), (30, 0))
+
+    def test_changed_row_is_updated(self):
+        self.data['1105']['PER_Analysis']['Total_EPS_Est'] = 99.5
+        stats = import_stock_json(_upload(self.data))
+        self.assertEqual((stats['inserted'], stats['updated'], stats['skipped']), (0, 1, 29))
+        obj = StockData.objects.get(stock_id='1105')
+        self.assertEqual(obj.total_eps_est, 99.5)
+        self.assertEqual(obj.content_hash, content_hash(obj.raw_data))
+
+    def test_patch_merges_into_latest_row(self):
+        patch = {'1101': {'PER_Analysis': {'Now_Price': 321.0, 'Detect_Reason': None}}}
+        stats = import_stock_json(_upload(patch), mode='patch')
+        self.assertEqual((stats['updated'], stats['rejected']), (1, 0))
+        obj = StockData.objects.get(stock_id='1101')
+        self.assertEqual(obj.raw_data['PER_Analysis']['Now_Price'], 321.0)
+        self.assertEqual(obj.normalized['Now_Price'], 321.0)
+        self.assertNotIn('Detect_Reason', obj.raw_data['PER_Analysis'])
+        # 其他欄位保留原值
+        self.assertEqual(obj.raw_data['PER_Analysis']['Capital'], self.data['1101']['PER_Analysis']['Capital'])
+
+    def test_patch_without_changes_is_skipped(self):
+        price = self.data['1102']['PER_Analysis']['Now_Price']
+        stats = import_stock_json(_upload({'1102': {'PER_Analysis': {'Now_Price': price}}}), mode='patch')
+        self.assertEqual((stats['updated'], stats['skipped']), (0, 1))
+
+    def test_patch_for_unknown_ticker_is_rejected(self):
+        stats = import_stock_json(_upload({'9999': {'PER_Analysis': {'Now_Price': 1}}}), mode='patch')
+        self.assertEqual((stats['inserted'], stats['rejected']), (0, 1))
+        self.assertIn('9999', stats['validation'].errors)
+        self.assertFalse(StockData.objects.filter(stock_id='9999').exists())
+
+
+# =========================================================
+# ASGI 下的匯出：async iterator 逐段輸出，內容與 WSGI 相同
+# =========================================================
+class AsgiExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        import_stock_json(_upload({sid: _record(sid) for sid in ('1101', '2317', '2330')}))
+
+    async def test_export_streams_asynchronously(self):
+        response = await AsyncClient().get('/api/export.ndjson?year=2026&month=9')
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.decode('utf-8').count('\n'), 3)
+
+
+# =========================================================
+# async 報價來源：ASGI 下共用 httpx client 並由 aclose 關閉；WSGI 下改走同步 Session
+# =========================================================
+class ProviderLoopTests(SimpleTestCase):
+    def _provider(self, **kwargs):
+        provider = pricing.FixtureProvider({'2330': 1050.0}, **kwargs)
+        self.addCleanup(provider.close)
+        return provider
+
+    def test_async_client_is_shared_until_aclose(self):
+        provider = self._provider(async_client=True)
+
+        async def run():
+            prices = [await provider.afetch('2330'), await provider.afetch('2330')]
+            client = (await provider._loop_state())[0]
+            self.assertEqual(len(provider._loops), 1)
+            await provider.aclose()
+            return prices, client
+
+        prices, client = asyncio.run(run())
+        self.assertEqual(prices, [1050.0, 1050.0])
+        self.assertTrue(client.is_closed)
+        self.assertEqual(len(provider._loops), 0)
+
+    def test_wsgi_uses_the_sync_session(self):
+        provider = self._provider(async_client=False)
+        with mock.patch.object(pricing.httpx, 'AsyncClient') as client_cls:
+            self.assertEqual(asyncio.run(provider.afetch('2330')), 1050.0)
+            self.assertEqual(asyncio.run(provider.afetch('2330')), 1050.0)
+        client_cls.assert_not_called()
+        self.assertEqual(len(provider._loops), 0)
@@ -0,0 +1,113 @@
+import re
+
+from .parsing import normalize_per
+
+# =========================================================
+# 上傳資料驗證：匯入時逐檔檢查 Meta / PER_Analysis 結構與數值欄位，
+# 同時產生正規化數值 (StockData.normalized)。
+#   錯誤 (errors)  ：該檔不匯入，只限結構錯誤 (非物件、缺少 PER_Analysis、年月格式錯誤)
+#   警告 (warnings)：該檔照常匯入，無法轉換的欄位視為缺值；試算欄位不完整時另外註明
+# =========================================================
+
+# 模擬試算用到的欄位 (來源資料常以 '-' 表示缺值，缺少時仍匯入，但該檔拒絕試算、結果輸出為 null)
+SIM_KEYS = ('Predict_Rev', 'YoY_Use', 'Net_Avg', 'Capital', 'PE_Use_H', 'PE_Use_L')
+
+# 匯入結果最多列出幾檔的錯誤 / 警告 (其餘只計數)
+MAX_REPORTED = 200
+
+_DATE_RE = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}')
+
+
+class RecordInvalid(ValueError):
+    def __init__(self, stock_id, errors):
+        super().__init__(f"{stock_id}：{'；'.join(errors)}")
+        self.stock_id = stock_id
+        self.errors = errors
+
+
+def _check_meta(meta, errors):
+    if meta is None:
+        return
+    if not isinstance(meta, dict):
+        errors.append("Meta 應為物件")
+        return
+    month = meta.get('TargetMonth')
+    if month is not None:
+        try:
+            ok = 1 <= int(month) <= 12
+        except (TypeError, ValueError):
+            ok = False
+        if not ok:
+            errors.append(f"TargetMonth 應為 1–12 ({month!r})")
+    query_date = meta.get('QueryDate')
+    if query_date is not None and not _DATE_RE.match(str(query_date)):
+        errors.append(f"QueryDate 應為 YYYY-MM-DD ({query_date!r})")
+
+
+def sim_problems(normalized):
+    """模擬試算欄位的問題 (缺值、股本 <= 0)；空 list 表示可以正常試算。"""
+    problems = [f"缺少 {key}" for key in SIM_KEYS if key not in normalized]
+    if normalized.get('Capital') is not None and normalized['Capital'] <= 0:
+        problems.append(f"Capital 必須大於 0 ({normalized['Capital']:g})")
+    return problems
+
+
+def validate_record(stock_id, content):
+    """
+    回傳 (normalized, warnings)；有無法匯入的錯誤時拋出 RecordInvalid (一次列出該檔全部錯誤)。
+    """
+    if not isinstance(content, dict):
+        raise RecordInvalid(stock_id, ["資料格式錯誤 (應為物件)"])
+
+    errors = []
+    _check_meta(content.get('Meta'), errors)
+    six = content.get('Six_Indicators')
+    if six is not None and not isinstance(six, dict):
+        errors.append("Six_Indicators 應為物件")
+
+    per = content.get('PER_Analysis')
+    if not isinstance(per, dict):
+        errors.append("缺少 PER_Analysis" if per is None else "PER_Analysis 應為物件")
+    if errors:
+        raise RecordInvalid(stock_id, errors)
+
+    normalized, bad_keys = normalize_per(per)
+    warnings = [f"{key} 無法轉為數字 ({per.get(key)!r})，視為缺值" for key in bad_keys]
+    problems = sim_problems(normalized)
+    if problems:
+        warnings.append(f"模擬試算無法使用 ({'；'.join(problems)})")
+    return normalized, warnings
+
+
+class ValidationReport:
+    """彙整整份檔案的驗證結果，匯入完成後一次回報。"""
+
+    def __init__(self, limit=MAX_REPORTED):
+        self.limit = limit
+        self.rejected = 0
+        self.warned = 0
+        self.errors = {}      # stock_id -> [訊息]
+        self.warnings = {}
+
+    def reject(self, exc):
+        self.rejected += 1
+        if len(self.errors) < self.limit:
+            self.errors[exc.stock_id] = exc.errors
+
+    def warn(self, stock_id, warnings):
+        if not warnings:
+            return
+        self.warned += 1
+        if len(self.warnings) < self.limit:
+            self.warnings[stock_id] = warnings
+
+    def lines(self):
+        """ImportJob.errors 用的文字清單。"""
+        out = [f"{sid}：{'；'.join(msgs)}" for sid, msgs in self.errors.items()]
+        if self.rejected > len(self.errors):
+            out.append(f"... 另有 {self.rejected - len(self.errors)} 檔驗證失敗")
+        out += [f"{sid} (警告)：{'；'.join(msgs)}" for sid, msgs in self.warnings.items()]
+        if self.warned > len(self.warnings):
+            out.append(f"... 另有 {self.warned - len(self.warnings)} 檔有警告")
+        return out
+
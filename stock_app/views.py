@@ -1,124 +1,302 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
-from .models import StockData
-import json
+from django.core.handlers.asgi import ASGIRequest
+from . import metrics
+from .models import ImportJob, Stock, StockData, StockRevision, Watchlist
+from .jobs import submit_import, job_progress
+from .pricing import fetch_live_price, get_price_service, get_async_price_service
+from .catalog import get_catalogue, search_stocks
+from .sections import (
+    LAZY_SECTIONS, find_row, get_summary, get_section,
+    build_hist_rows, build_rev_rows, build_net_rows, build_q4_rows,
+)
+from .series import ticker_history, field_matrix
+from .revisions import RANKING_SORTS, ticker_trend, revision_ranking
+from .screener import SCREEN_SORTS, PAGE_SIZE, parse_criteria, screen, screen_page, rating_factors
+from .validation import sim_problems
+from .watchlists import SIM_PARAMS, VALUATION_SORTS, add_codes, parse_codes, precompute, stored_valuations
+from .export import FORMATS, STREAMERS, aiter_stream, export_queryset, iter_row_chunks, parquet_available
+from .engine import simulate_stock, load_universe, simulate, parse_range, sensitivity_grid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from asgiref.sync import sync_to_async
+import asyncio
 import datetime
-import requests
-from bs4 import BeautifulSoup
-import random
+import time
+import numpy as np
 
 # =========================================================
-# 輔助函式：解析百分比字串
+# 輔助函式：資料打包
+# =========================================================
+def get_dashboard_data(db_obj):
+    # 完整打包 (一次產生所有區塊)；首頁改走 sections 的投影讀取與延遲載入
+    raw = db_obj.raw_data
+    per = raw.get('PER_Analysis', {})
+    rev_rows, yoy_rows = build_rev_rows(per)
+    return {
+        'result': raw,
+        'hist_rows': build_hist_rows(per),
+        'rev_rows': rev_rows,
+        'yoy_rows': yoy_rows,
+        'net_rows': build_net_rows(per),
+        'q4_rows': build_q4_rows(per)
+    }
+
 # =========================================================
-def parse_pct(val):
+# 區塊片段 (分頁切換時才載入)：/stock/2330/2026/9/rev/
+# =========================================================
+def section_fragment(request, stock_id, year, month, section):
+    if section not in LAZY_SECTIONS:
+        raise Http404("未知的區塊")
+    row = find_row(StockData.objects.filter(stock_id=stock_id, data_year=year, data_month=month))
+    if row is None:
+        raise Http404("找不到資料")
+    data = get_section(row, section)
+    return render(request, f'sections/{section}.html', data)
+
+# =========================================================
+# 匯入進度 (前端輪詢)
+# =========================================================
+def import_progress(request, job_id):
+    job = get_object_or_404(ImportJob, pk=job_id)
+    return JsonResponse(job_progress(job))
+
+# =========================================================
+# 批次即時報價 API (async)：/api/quotes?ids=2330,2317
+# =========================================================
+async def quotes_api(request):
+    ids = [s for s in request.GET.get('ids', '').replace(' ', '').split(',') if s]
+    if not ids:
+        return JsonResponse({'error': '請提供 ids 參數，例如 ?ids=2330,2317'}, status=400)
+    if len(ids) > settings.PRICE_BATCH_MAX_IDS:
+        return JsonResponse({'error': f'一次最多查詢 {settings.PRICE_BATCH_MAX_IDS} 檔'}, status=400)
     try:
-        return float(str(val).replace('%', '').replace(',', '').strip()) / 100
-    except:
-        return 0.0
+        timeout = float(request.GET['timeout']) if 'timeout' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'timeout 格式錯誤'}, status=400)
+
+    started = time.perf_counter()
+    with metrics.stage('scrape'):
+        quotes = await get_async_price_service().get_quotes(ids, timeout=timeout)
+    # 即時來源失敗或逾時的代碼以最後收盤價代替，列在 stale (附日期與來源)
+    return JsonResponse({
+        'quotes': {sid: q['price'] for sid, q in quotes.items() if q['price'] is not None},
+        'stale': {sid: {'as_of': q['as_of'], 'source': q['source']} for sid, q in quotes.items() if q['stale']},
+        'failed': [sid for sid, q in quotes.items() if q['price'] is None],
+        'timed_out': [sid for sid, q in quotes.items() if q['timed_out']],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
 
 # =========================================================
-# 輔助函式：即時爬蟲
+# 單檔模擬試算 API (async)：/api/simulate/2330?year=2026&month=9&yoy=-5&net=12
+# 讀資料與抓即時價同時進行；等待報價時不佔用 worker
 # =========================================================
-def fetch_live_price(stock_id):
+def _find_stock_row(stock_id, year=None, month=None):
+    """指定年月查無資料時，退回該檔最新一筆。"""
+    qs = StockData.objects.filter(stock_id=stock_id)
+    row = None
+    if year is not None and month is not None:
+        row = find_row(qs.filter(data_year=year, data_month=month))
+    return row or find_row(qs.order_by('-data_year', '-data_month'))
+
+
+async def stock_simulate_api(request, stock_id):
+    params = request.GET
     try:
-        agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
-        ]
-        headers = {'User-Agent': random.choice(agents)}
-        url = f'https://stock.wearn.com/a{stock_id}.html'
-        
-        r = requests.get(url, headers=headers, timeout=5)
-        if r.status_code != 200: return None
-        
-        soup = BeautifulSoup(r.content, 'html.parser')
-        price = 0.0
-        uls = soup.find_all('ul')
-        for ul in uls:
-            if "成交價" in str(ul):
-                li = ul.find_all('li')[0]
-                txt = li.text.replace(',', '').strip()
-                try: price = float(txt)
-                except: pass
-                break
-        
-        if price == 0 and len(uls) > 6:
-            try:
-                txt = uls[4].find_all('li')[0].text.replace(',', '').strip()
-                price = float(txt)
-            except: pass
-            
-        return price if price > 0 else None
-    except:
-        return None
+        year = int(params['year']) if params.get('year') else None
+        month = int(params['month']) if params.get('month') else None
+        sim_params = {
+            'yoy': _optional_float(params, 'yoy', 100), 'net': _optional_float(params, 'net', 100),
+            'pe_h': _optional_float(params, 'pe_h'), 'pe_l': _optional_float(params, 'pe_l'),
+        }
+    except ValueError:
+        return JsonResponse({'error': '參數錯誤：year、month 須為整數，其餘參數須為數字'}, status=400)
+
+    async def load_summary():
+        with metrics.stage('summary'):
+            row = await sync_to_async(_find_stock_row)(stock_id, year, month)
+            return row, (await sync_to_async(get_summary)(row) if row else None)
+
+    async def load_quote():
+        with metrics.stage('scrape'):
+            return await get_async_price_service().get_quote(stock_id)
+
+    (row, summary), quote = await asyncio.gather(load_summary(), load_quote())
+    live_price = quote['price']
+    if row is None:
+        return JsonResponse({'error': f'找不到代號 {stock_id} 的資料'}, status=404)
+    problems = sim_problems(summary['num'])
+    if problems:
+        return JsonResponse({'error': f"模擬試算無法使用：{'；'.join(problems)}"}, status=422)
+
+    try:
+        sim = simulate_stock(summary['num'], live_price=live_price, **sim_params)
+    except ValueError:
+        return JsonResponse({'error': '資料欄位格式錯誤，無法試算'}, status=422)
+    return JsonResponse({
+        'stock_id': stock_id, 'year': row['data_year'], 'month': row['data_month'],
+        'live_price': live_price,
+        'price_source': quote['source'], 'price_as_of': quote['as_of'], 'price_stale': quote['stale'],
+        'yoy': round(sim['sim_yoy'] * 100, 2), 'net': round(sim['sim_net'] * 100, 2),
+        'pe_h': sim['pe_h'], 'pe_l': sim['pe_l'],
+        'rev': round(sim['sim_rev'], 2), 'eps': sim['eps'],
+        'target_h': sim['target_h'], 'target_l': sim['target_l'],
+        'upside': round(sim['upside'], 4) if live_price else None,
+        'downside': round(sim['downside'], 4) if live_price else None,
+        'rr': round(sim['rr'], 2) if live_price else None,
+        'details': sim['details'],
+    })
 
 # =========================================================
-# 輔助函式：資料打包
+# 全市場模擬 API：/api/simulate?year=2026&month=9&yoy=-5
 # =========================================================
-def get_dashboard_data(db_obj):
-    raw = db_obj.raw_data
-    per = raw.get('PER_Analysis', {})
-    
-    # 歷史股價
-    hist_rows = []
-    H = per.get('H', []); L = per.get('L', []); EPS = per.get('EPS', [])
-    PE_H = per.get('PE_H', []); PE_L = per.get('PE_L', [])
-    loop_len = min(len(H), len(L), len(EPS))
-    
-    current_year = per.get('Current_Year', datetime.datetime.now().year)
-    current_year_roc = per.get('Current_Year_ROC', current_year - 1911)
-
-    for i in range(loop_len):
-        y_ad = current_year - 1 - i
-        y_roc = current_year_roc - 1 - i
-        hist_rows.append({
-            'year_str': f"{y_ad}/{y_roc}",
-            'h': H[i], 'l': L[i], 'eps': EPS[i],
-            'pe_h': PE_H[i] if i < len(PE_H) else '-', 
-            'pe_l': PE_L[i] if i < len(PE_L) else '-'
-        })
-    
-    # 營收
-    rev_rows = []
-    rev_names = per.get('Rev_Names', []); rev_vals = per.get('Rev_Vals', [])
-    yoy_names = per.get('YoY_Names', []); yoy_vals = per.get('YoY_Vals', [])
-    for i in range(len(rev_names)):
-        rev_rows.append({'name': rev_names[i], 'val': rev_vals[i]})
-    yoy_rows_list = []
-    for i in range(len(yoy_names)):
-        yoy_rows_list.append({'name': yoy_names[i], 'yoy': yoy_vals[i]})
-
-    # 淨利
-    net_rows = []
-    net_names = per.get('Net_Names', []); net_vals = per.get('Net_Vals', [])
-    for i in range(len(net_names)):
-        net_rows.append({'name': net_names[i], 'val': net_vals[i]})
-
-    # Q4
-    q4_data = [
-        ("狀態", per.get('Detect_Reason','-')),
-        ("網頁最新季別", per.get('Latest_Quarter_Str','-')),
-        ("Q1 EPS (實際)", per.get('EPS_Q1',0)),
-        ("Q2 EPS (實際)", per.get('EPS_Q2',0)),
-        ("Q3 EPS (實際)", per.get('EPS_Q3',0)),
-        ("Q1-Q3 總和", round(per.get('EPS_Q1',0)+per.get('EPS_Q2',0)+per.get('EPS_Q3',0), 2)),
-        ("---", "---"),
-        ("去年 Q4 營收", per.get('Q4_Rev_Actual',0)),
-        ("平均淨利率", per.get('Net_Avg','0%')),
-        ("股本(億)", per.get('Capital',0)),
-        ("Q4 EPS (估算)", per.get('Q4_EPS_Est',0)),
-        ("---", "---"),
-        ("全年 EPS (估/實)", per.get('Total_EPS_Est',0)),
-    ]
+SIM_SORT_FIELDS = ('eps', 'target_h', 'target_l', 'sim_rev', 'upside', 'downside', 'rr')
+
 
+def _json_num(val, ndigits=4):
+    val = float(val)
+    return round(val, ndigits) if np.isfinite(val) else None
+
+
+def _optional_float(params, key, scale=1.0):
+    val = params.get(key, '').strip()
+    return float(val) / scale if val else None
+
+
+def simulate_api(request):
+    params = request.GET
+    try:
+        year = int(params['year']); month = int(params['month'])
+        yoy = _optional_float(params, 'yoy', 100)
+        net = _optional_float(params, 'net', 100)
+        pe_h = _optional_float(params, 'pe_h')
+        pe_l = _optional_float(params, 'pe_l')
+        limit = min(int(params.get('limit', 100)), 5000)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': '參數錯誤：需提供 year、month，其餘參數須為數字'}, status=400)
+
+    sort = params.get('sort', 'eps')
+    if sort not in SIM_SORT_FIELDS:
+        return JsonResponse({'error': f'sort 只接受 {", ".join(SIM_SORT_FIELDS)}'}, status=400)
+
+    started = time.perf_counter()
+    universe = load_universe(year, month)
+    prices = None
+    if params.get('live') == '1' and len(universe['stock_id']):
+        quotes = get_price_service().get_quotes(universe['stock_id'][:settings.PRICE_BATCH_MAX_IDS])
+        prices = np.array([(quotes.get(sid) or {}).get('price') or np.nan for sid in universe['stock_id']], dtype=float)
+    res = simulate(universe, yoy=yoy, net=net, pe_h=pe_h, pe_l=pe_l, prices=prices)
+
+    # 沒有即時價時無法依報酬率排序，改用 EPS
+    vals = res[sort] if sort in res else res['eps']
+    if params.get('order') == 'asc':
+        order = np.argsort(np.where(np.isnan(vals), np.inf, vals), kind='stable')
+    else:
+        order = np.argsort(-np.where(np.isnan(vals), -np.inf, vals), kind='stable')
+
+    fields = [f for f in ('eps', 'target_h', 'target_l', 'sim_rev', 'price', 'upside', 'downside', 'rr') if f in res]
+    rows = []
+    for i in order[:limit]:
+        row = {'stock_id': universe['stock_id'][i], 'stock_name': universe['stock_name'][i]}
+        row.update({f: _json_num(res[f][i]) for f in fields})
+        rows.append(row)
+
+    payload = {
+        'year': year, 'month': month, 'count': len(universe['stock_id']),
+        'rows': rows,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+    # 指定 explain=<代碼> 時附上該檔的逐步算式
+    explain_id = params.get('explain', '').strip()
+    if explain_id:
+        num = StockData.objects.filter(
+            stock_id=explain_id, data_year=year, data_month=month).values_list('normalized', flat=True).first()
+        if num is not None and not sim_problems(num):
+            try:
+                sim = simulate_stock(num, yoy=yoy, net=net, pe_h=pe_h, pe_l=pe_l)
+                payload['details'] = sim['details']
+            except ValueError:
+                payload['details'] = []
+    return JsonResponse(payload)
+
+# =========================================================
+# 敏感度矩陣：/api/sensitivity?stock_id=2330&year=2026&month=9&yoy=-10:10:1&net=5:25:1&pe=8:16:2
+# =========================================================
+def default_sensitivity_ranges(num):
+    # 預設以原始 YoY / 淨利率為中心，本益比取 PE_Use_L 與 PE_Use_H (num 為 StockData.normalized)
+    yoy = round(num.get('YoY_Use', 0.0) * 100)
+    net = round(num.get('Net_Avg', 0.0) * 100)
     return {
-        'result': raw,
-        'hist_rows': hist_rows,
-        'rev_rows': rev_rows,
-        'yoy_rows': yoy_rows_list,
-        'net_rows': net_rows,
-        'q4_rows': q4_data
+        'yoy': f"{yoy - 10}:{yoy + 10}:2",
+        'net': f"{max(net - 5, 0)}:{net + 5}:1",
+        'pe': f"{num.get('PE_Use_L', 0):g},{num.get('PE_Use_H', 0):g}",
+    }
+
+
+def build_sensitivity(num, params, live_price=None):
+    ranges = default_sensitivity_ranges(num)
+    ranges.update({k: params[k] for k in ('yoy', 'net', 'pe') if params.get(k, '').strip()})
+    grid = sensitivity_grid(
+        num,
+        parse_range(ranges['yoy'], scale=100),
+        parse_range(ranges['net'], scale=100),
+        parse_range(ranges['pe']),
+        live_price=live_price,
+    )
+    grid['ranges'] = ranges
+    return grid
+
+
+def sensitivity_api(request):
+    params = request.GET
+    try:
+        year = int(params['year']); month = int(params['month'])
+        sid = params['stock_id'].strip()
+    except (KeyError, ValueError):
+        return JsonResponse({'error': '參數錯誤：需提供 stock_id、year、month'}, status=400)
+
+    num = StockData.objects.filter(
+        stock_id=sid, data_year=year, data_month=month).values_list('normalized', flat=True).first()
+    if num is None:
+        return JsonResponse({'error': f'找不到 {sid} ({year}/{month}) 的資料'}, status=404)
+    problems = sim_problems(num)
+    if problems:
+        return JsonResponse({'error': f"模擬試算無法使用：{'；'.join(problems)}"}, status=422)
+
+    # 即時價每個格點只抓一次
+    live_price = fetch_live_price(sid) if params.get('live') == '1' else None
+    try:
+        grid = build_sensitivity(num, params, live_price)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    payload = {
+        'stock_id': sid, 'year': year, 'month': month,
+        'ranges': grid['ranges'],
+        'base_rev': round(grid['base_rev'], 4),
+        'yoy': (grid['yoy'] * 100).round(4).tolist(),
+        'net': (grid['net'] * 100).round(4).tolist(),
+        'pe': grid['pe'].tolist(),
+        'eps': grid['eps'].tolist(),
+        'target': grid['target'].tolist(),
+        'live_price': live_price,
     }
+    if 'upside' in grid:
+        payload['upside'] = grid['upside'].round(4).tolist()
+    return JsonResponse(payload)
+
+# =========================================================
+# 股票目錄搜尋 (選股清單用)：/api/stocks?q=23
+# =========================================================
+def stocks_api(request):
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 200)
+    except ValueError:
+        limit = 20
+    return JsonResponse({'stocks': search_stocks(request.GET.get('q', ''), limit)})
 
 # =========================================================
 # 主視圖
@@ -155,184 +333,414 @@ def home(request):
         # --- [功能 A] 上傳 JSON ---
         if 'upload_json' in request.FILES:
             try:
-                f = request.FILES['upload_json']
-                data = json.load(f)
-                count = 0
-                debug_info = []
-                
-                upload_year = context['selected_year']
-                upload_month = context['selected_month']
-
-                for sid, content in data.items():
-                    meta = content.get('Meta', {})
-                    try: t_month = int(meta.get('TargetMonth', now.month))
-                    except: t_month = now.month
-                    q_date_str = meta.get('QueryDate', now.strftime('%Y-%m-%d'))
-                    try: t_year = int(q_date_str.split('-')[0])
-                    except: t_year = now.year
-                    
-                    upload_year = t_year
-                    upload_month = t_month
-
-                    StockData.objects.update_or_create(
-                        stock_id=sid, data_year=t_year, data_month=t_month,
-                        defaults={'stock_name': meta.get('StockName', str(sid)), 'raw_data': content}
-                    )
-                    count += 1
-                    debug_info.append(f"{sid}({t_year}/{t_month})")
-                
-                messages.success(request, f"成功匯入 {count} 筆資料！<br><small>{', '.join(debug_info[:2])}...</small>")
-                context['selected_year'] = upload_year
-                context['selected_month'] = upload_month
-                
+                with metrics.stage('upload'):
+                    mode = ImportJob.MODE_PATCH if request.POST.get('import_mode') == 'patch' else ImportJob.MODE_FULL
+                    job = submit_import(request.FILES['upload_json'], mode)
+                context['import_job'] = job_progress(job)
+                messages.info(request, f"已收到檔案，匯入工作 #{job.pk} 於背景處理中。")
             except Exception as e:
                 messages.error(request, f"上傳失敗：{e}")
 
         # --- [功能 B] 查詢與模擬 ---
         target_sid = request.POST.get('stock_id', '').strip()
-        if not target_sid and 'upload_json' in request.FILES:
-             try: target_sid = list(data.keys())[0]
-             except: pass
 
         if target_sid:
             context['selected_id'] = target_sid
             q_year = context['selected_year']
             q_month = context['selected_month']
             
-            db_obj = None
-            try:
-                db_obj = StockData.objects.get(stock_id=target_sid, data_year=q_year, data_month=q_month)
-            except StockData.DoesNotExist:
-                fallback_obj = StockData.objects.filter(stock_id=target_sid).order_by('-data_year', '-data_month').first()
-                if fallback_obj:
-                    db_obj = fallback_obj
-                    context['selected_year'] = db_obj.data_year
-                    context['selected_month'] = db_obj.data_month
-                    messages.warning(request, f"找不到 {q_year}/{q_month}，已自動顯示 ({db_obj.data_year}/{db_obj.data_month}) 資料。")
+            # 先只查索引欄位決定資料列；首屏資料走快取，其餘分頁由 section_fragment 延遲載入
+            with metrics.stage('lookup'):
+                db_row = find_row(StockData.objects.filter(stock_id=target_sid, data_year=q_year, data_month=q_month))
+            if db_row is None:
+                with metrics.stage('fallback'):
+                    db_row = find_row(StockData.objects.filter(stock_id=target_sid).order_by('-data_year', '-data_month'))
+                if db_row:
+                    context['selected_year'] = db_row['data_year']
+                    context['selected_month'] = db_row['data_month']
+                    messages.warning(request, f"找不到 {q_year}/{q_month}，已自動顯示 ({db_row['data_year']}/{db_row['data_month']}) 資料。")
                 else:
                     messages.error(request, f"找不到代號 {target_sid} 的資料。")
 
-            if db_obj:
-                base_data = get_dashboard_data(db_obj)
+            if db_row:
+                with metrics.stage('summary'):
+                    base_data = get_summary(db_row)
                 context.update(base_data)
-                per_data = db_obj.raw_data.get('PER_Analysis', {})
+                num = base_data['num']
+                # 試算欄位缺值 (來源常以 '-' 表示) 的股票照常顯示，只是不能試算
+                sim_blocked = sim_problems(num)
+                if sim_blocked and ('calc_simulation' in request.POST or 'calc_sensitivity' in request.POST):
+                    messages.error(request, f"此檔模擬試算無法使用：{'；'.join(sim_blocked)}")
                 
                 # --- [功能 C] 模擬試算邏輯 (含算式紀錄) ---
-                if 'calc_simulation' in request.POST:
-                    live_price = fetch_live_price(target_sid)
+                if 'calc_simulation' in request.POST and not sim_blocked:
+                    with metrics.stage('scrape'):
+                        quote = get_price_service().get_quote(target_sid)
+                    live_price = quote['price']
                     
                     try:
-                        # 1. 取得原始參數
-                        orig_yoy = parse_pct(per_data.get('YoY_Use', '0%'))
-                        orig_net = parse_pct(per_data.get('Net_Avg', '0%'))
-                        capital = float(per_data.get('Capital', 1))
-                        orig_rev_predict = float(per_data.get('Predict_Rev', 0))
-                        
-                        calc_details = [] # 算式紀錄清單
-
-                        # 2. 反推基期營收
-                        if (1 + orig_yoy) != 0:
-                            base_rev = orig_rev_predict / (1 + orig_yoy)
-                        else:
-                            base_rev = orig_rev_predict
-                        
-                        calc_details.append({
-                            "step": "1. 反推基期營收",
-                            "formula": f"原始預估營收 {orig_rev_predict} ÷ (1 + 原始YoY {orig_yoy:.2%})",
-                            "result": f"{base_rev:.2f} 億"
-                        })
-
-                        # 3. 接收使用者輸入
+                        # 接收使用者輸入 (空白則沿用原始值)
                         user_yoy_val = request.POST.get('sim_yoy', '').strip()
                         user_net_val = request.POST.get('sim_net', '').strip()
-                        
-                        if user_yoy_val: sim_yoy = float(user_yoy_val) / 100
-                        else: sim_yoy = orig_yoy
-                            
-                        if user_net_val: sim_net = float(user_net_val) / 100
-                        else: sim_net = orig_net
-
-                        sim_pe_h = float(request.POST.get('sim_pe_h', per_data.get('PE_Use_H', 0)))
-                        sim_pe_l = float(request.POST.get('sim_pe_l', per_data.get('PE_Use_L', 0)))
-                        
-                        # 4. 連動計算
-                        # A. 新營收
-                        sim_rev = base_rev * (1 + sim_yoy)
-                        calc_details.append({
-                            "step": "2. 計算模擬營收",
-                            "formula": f"基期營收 {base_rev:.2f} × (1 + 設定YoY {sim_yoy:.2%})",
-                            "result": f"{sim_rev:.2f} 億"
-                        })
-
-                        # B. 新淨利
-                        sim_net_income = sim_rev * sim_net
-                        calc_details.append({
-                            "step": "3. 計算模擬淨利",
-                            "formula": f"模擬營收 {sim_rev:.2f} × 設定淨利率 {sim_net:.2%}",
-                            "result": f"{sim_net_income:.2f} 億"
-                        })
-
-                        # C. 新EPS
-                        sim_eps = round(sim_net_income / capital * 10, 2)
-                        calc_details.append({
-                            "step": "4. 計算模擬 EPS",
-                            "formula": f"(模擬淨利 {sim_net_income:.2f} ÷ 股本 {capital}) × 10",
-                            "result": f"{sim_eps} 元"
-                        })
-                        
-                        # D. 目標價
-                        target_h = round(sim_eps * sim_pe_h, 2)
-                        target_l = round(sim_eps * sim_pe_l, 2)
-                        calc_details.append({
-                            "step": "5. 計算目標價",
-                            "formula": f"高: EPS {sim_eps} × PE {sim_pe_h} | 低: EPS {sim_eps} × PE {sim_pe_l}",
-                            "result": f"高 {target_h} / 低 {target_l}"
-                        })
-                        
-                        # E. 報酬率
-                        upside = 0; downside = 0; rr = 0
-                        if live_price:
-                            upside = (target_h - live_price) / live_price
-                            downside = (target_l - live_price) / live_price
-                            rr = abs(upside / downside) if downside != 0 else 0
-                            
-                            calc_details.append({
-                                "step": "6. 報酬與風險",
-                                "formula": f"即時價 {live_price} vs 目標價 {target_h} / {target_l}",
-                                "result": f"上 {upside*100:.2f}% / 下 {downside*100:.2f}%"
-                            })
-                        
+                        with metrics.stage('simulate'):
+                            sim = simulate_stock(
+                                num,
+                                yoy=float(user_yoy_val) / 100 if user_yoy_val else None,
+                                net=float(user_net_val) / 100 if user_net_val else None,
+                                pe_h=request.POST.get('sim_pe_h'),
+                                pe_l=request.POST.get('sim_pe_l'),
+                                live_price=live_price,
+                            )
                         context['sim_res'] = {
                             'live_price': live_price if live_price else "抓取失敗",
-                            'display_yoy': round(sim_yoy * 100, 2),
-                            'display_net': round(sim_net * 100, 2),
-                            'pe_h': sim_pe_h, 'pe_l': sim_pe_l,
-                            'calc_eps': sim_eps, 'calc_rev': round(sim_rev, 2),
-                            'target_h': target_h, 'target_l': target_l,
-                            'upside': f"{upside*100:.2f}%" if live_price else "-",
-                            'downside': f"{downside*100:.2f}%" if live_price else "-",
-                            'rr': round(rr, 2) if live_price else "-",
-                            'details': calc_details # 傳遞詳細算式
+                            'display_yoy': round(sim['sim_yoy'] * 100, 2),
+                            'display_net': round(sim['sim_net'] * 100, 2),
+                            'pe_h': sim['pe_h'], 'pe_l': sim['pe_l'],
+                            'calc_eps': sim['eps'], 'calc_rev': round(sim['sim_rev'], 2),
+                            'target_h': sim['target_h'], 'target_l': sim['target_l'],
+                            'upside': f"{sim['upside']*100:.2f}%" if live_price else "-",
+                            'downside': f"{sim['downside']*100:.2f}%" if live_price else "-",
+                            'rr': round(sim['rr'], 2) if live_price else "-",
+                            'details': sim['details'] # 傳遞詳細算式
                         }
                         
-                        if live_price: messages.success(request, f"試算成功！EPS 已更新。")
+                        if quote['stale']: messages.warning(request, f"即時股價抓取失敗，改用 {quote['as_of']} 收盤價試算。")
+                        elif live_price: messages.success(request, "試算成功！EPS 已更新。")
                         else: messages.warning(request, "試算完成，但無法抓取即時股價。")
                         
                     except ValueError:
                         messages.error(request, "輸入格式錯誤。")
 
-# ... (前面的程式碼保持不變) ...
+                # --- [功能 C-2] 敏感度矩陣 (即時價只抓一次) ---
+                context['sens_ranges'] = default_sensitivity_ranges(num)
+                if 'calc_sensitivity' in request.POST and not sim_blocked:
+                    with metrics.stage('scrape'):
+                        live_price = fetch_live_price(target_sid)
+                    params = {k: request.POST.get(f'sens_{k}', '') for k in ('yoy', 'net', 'pe')}
+                    try:
+                        with metrics.stage('sensitivity'):
+                            grid = build_sensitivity(num, params, live_price)
+                        context['sens_ranges'] = grid['ranges']
+                        context['sens'] = {
+                            'live_price': live_price if live_price else "抓取失敗",
+                            'net_labels': [round(v * 100, 2) for v in grid['net'].tolist()],
+                            'eps_rows': [
+                                {'yoy': round(y * 100, 2), 'cells': list(row)}
+                                for y, row in zip(grid['yoy'].tolist(), grid['eps'].tolist())
+                            ],
+                            'pe_tables': [
+                                {'pe': pe, 'rows': [
+                                    {'yoy': round(y * 100, 2), 'cells': [
+                                        {'target': t, 'upside': f"{u*100:.1f}%" if live_price else ''}
+                                        for t, u in zip(trow, urow)
+                                    ]}
+                                    for y, trow, urow in zip(
+                                        grid['yoy'].tolist(),
+                                        grid['target'][:, :, k].tolist(),
+                                        (grid['upside'][:, :, k] if live_price else grid['target'][:, :, k]).tolist(),
+                                    )
+                                ]}
+                                for k, pe in enumerate(grid['pe'].tolist())
+                            ],
+                        }
+                    except ValueError as e:
+                        messages.error(request, f"敏感度分析參數錯誤：{e}")
 
         # =========================================================
-        # 功能 D: 取得已匯入的股票清單供前端顯示
+        # 功能 D: 取得已匯入的股票清單供前端顯示 (股票目錄 + 行程內快取)
         # =========================================================
-        # 抓取所有資料的代號與名稱，並利用字典去除重複項
-        stocks_qs = StockData.objects.values('stock_id', 'stock_name').order_by('stock_id')
-        unique_stocks = {}
-        for s in stocks_qs:
-            unique_stocks[s['stock_id']] = s['stock_name']
-            
-        # 將字典轉換為列表傳給前端
-        context['available_stocks'] = [{'id': sid, 'name': sname} for sid, sname in unique_stocks.items()]
+        with metrics.stage('catalogue'):
+            context['available_stocks'] = get_catalogue()
+
+    with metrics.stage('render'):
+        return render(request, 'home.html', context)
+
+# =========================================================
+# 歷史序列 API
+#   單檔歷史：/api/series?stock_id=2330&fields=eps,h
+#   全市場單一欄位：/api/series?field=rev_vals&year=2026&month=9
+# =========================================================
+def _json_matrix(matrix):
+    return [[_json_num(v) for v in row] for row in matrix.tolist()]
+
+
+def series_api(request):
+    params = request.GET
+    stock_id = params.get('stock_id', '').strip()
+    try:
+        if stock_id:
+            fields = [f for f in params.get('fields', '').replace(' ', '').split(',') if f] or None
+            hist = ticker_history(stock_id, fields)
+            return JsonResponse({
+                'stock_id': stock_id,
+                'periods': [f"{y}/{m}" for y, m in zip(hist['year'].tolist(), hist['month'].tolist())],
+                'series': {k: _json_matrix(v) for k, v in hist.items() if k not in ('year', 'month')},
+            })
+        year = int(params['year']); month = int(params['month'])
+        ids, matrix = field_matrix(params['field'], year, month)
+    except (KeyError, ValueError) as e:
+        msg = str(e) if isinstance(e, ValueError) and '序列' in str(e) else '參數錯誤：需提供 stock_id，或 field、year、month'
+        return JsonResponse({'error': msg}, status=400)
+    return JsonResponse({
+        'field': params['field'], 'year': year, 'month': month,
+        'stock_ids': ids.tolist(), 'values': _json_matrix(matrix),
+    })
+
+# =========================================================
+# 預估修正：單檔趨勢 /stock/2330/trend/ 與全市場排行 /revisions/?year=2026&month=9&sort=up
+# =========================================================
+def stock_trend(request, stock_id):
+    rows = ticker_trend(stock_id)
+    if not rows:
+        raise Http404("找不到資料")
+    return render(request, 'trend.html', {
+        'stock_id': stock_id,
+        'stock_name': Stock.objects.filter(stock_id=stock_id).values_list('stock_name', flat=True).first() or '',
+        'rows': list(reversed(rows)),
+    })
+
+
+def revisions_ranking(request):
+    params = request.GET
+    sort = params.get('sort', 'up')
+    if sort not in RANKING_SORTS:
+        sort = 'up'
+    try:
+        year = int(params['year']); month = int(params['month'])
+    except (KeyError, ValueError):
+        latest = StockRevision.objects.order_by('-data_year', '-data_month').values('data_year', 'data_month').first()
+        year, month = (latest['data_year'], latest['data_month']) if latest else (None, None)
+    try:
+        limit = min(int(params.get('limit', 50)), 500)
+    except ValueError:
+        limit = 50
+
+    rows = revision_ranking(year, month, sort, limit) if year else []
+    if params.get('format') == 'json':
+        return JsonResponse({'year': year, 'month': month, 'sort': sort, 'rows': rows})
+    return render(request, 'revisions.html', {
+        'rows': rows, 'year': year, 'month': month, 'sort': sort, 'limit': limit,
+        'sorts': [('up', 'EPS 上修'), ('down', 'EPS 下修'), ('up_pct', '上修幅度 %'), ('down_pct', '下修幅度 %')],
+    })
+
+# =========================================================
+# 選股器：/screener/?year=2026&month=9&min_good=4&pe_max=12&yoy_min=0
+#         /api/screener 參數相同，回傳 JSON
+# =========================================================
+def _latest_period():
+    latest = StockData.objects.order_by('-data_year', '-data_month').values('data_year', 'data_month').first()
+    return (latest['data_year'], latest['data_month']) if latest else (None, None)
+
+
+def _screen_request(params):
+    """回傳 (year, month, criteria, page)；參數錯誤時拋出 ValueError。"""
+    try:
+        year = int(params['year']); month = int(params['month'])
+    except (KeyError, ValueError):
+        year, month = _latest_period()
+    criteria = parse_criteria(params)
+    try:
+        page_num = int(params.get('page', 1)); page_size = int(params.get('page_size', PAGE_SIZE))
+    except ValueError:
+        raise ValueError("page / page_size 須為整數")
+    sort = params.get('sort', 'good')
+    if sort not in SCREEN_SORTS:
+        raise ValueError(f"sort 只接受 {', '.join(SCREEN_SORTS)}")
+    order = 'asc' if params.get('order') == 'asc' else 'desc'
+    page = screen_page(year, month, criteria, sort, order, page_num, page_size) if year else None
+    return year, month, criteria, page
+
+
+def _screen_row(row):
+    row = dict(row)
+    for key in ('yoy_use', 'net_avg'):
+        row[key] = round(row[key] * 100, 2) if row[key] is not None else None
+    return row
+
 
-    return render(request, 'home.html', context)
\ No newline at end of file
+def screener_api(request):
+    started = time.perf_counter()
+    try:
+        year, month, criteria, page = _screen_request(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if page is None:
+        return JsonResponse({'error': '尚未匯入任何資料'}, status=404)
+    return JsonResponse({
+        'year': year, 'month': month, 'criteria': criteria,
+        'count': page.paginator.count, 'page': page.number, 'num_pages': page.paginator.num_pages,
+        'rows': [_screen_row(r) for r in page.object_list],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def screener(request):
+    context = {'sorts': [('good', 'A 級指標數'), ('eps', '全年 EPS'), ('pe', '本益比'), ('yoy', 'YoY'), ('six', '六大指標總分'), ('code', '代碼')]}
+    params = request.GET.copy()
+    context['params'] = params
+    context['factors'] = rating_factors()
+    try:
+        year, month, criteria, page = _screen_request(params)
+        context.update({'year': year, 'month': month, 'criteria': criteria, 'page': page})
+        if page is not None:
+            context['rows'] = [_screen_row(r) for r in page.object_list]
+    except ValueError as e:
+        messages.error(request, f"篩選條件錯誤：{e}")
+    # 分頁連結保留其他條件
+    params.pop('page', None)
+    context['query'] = params.urlencode()
+    return render(request, 'screener.html', context)
+
+# =========================================================
+# 串流匯出：/api/export.csv?year=2026&month=9&yoy=-5
+#   格式 csv / ndjson / parquet；可加 ids=2330,2317 或選股器條件
+#   (有選股器條件而未指定年月時，與選股器相同取最新一個月)
+# =========================================================
+def export_view(request, fmt):
+    if fmt not in FORMATS:
+        raise Http404("不支援的格式")
+    if fmt == 'parquet' and not parquet_available():
+        return JsonResponse({'error': 'Parquet 匯出需要安裝 pyarrow'}, status=400)
+    params = request.GET
+    try:
+        year = int(params['year']) if params.get('year') else None
+        month = int(params['month']) if params.get('month') else None
+        sim_params = {
+            'yoy': _optional_float(params, 'yoy', 100), 'net': _optional_float(params, 'net', 100),
+            'pe_h': _optional_float(params, 'pe_h'), 'pe_l': _optional_float(params, 'pe_l'),
+        }
+        criteria = parse_criteria(params)
+    except ValueError:
+        return JsonResponse({'error': '參數錯誤：year、month 須為整數，其餘參數須為數字'}, status=400)
+
+    screening = any(v is not None and v != [] for v in criteria.values())
+    if screening and (year is None) != (month is None):
+        return JsonResponse({'error': '使用選股器條件時 year、month 需同時指定 (或都不指定以使用最新月份)'}, status=400)
+    if screening and year is None:
+        year, month = _latest_period()
+        if year is None:
+            return JsonResponse({'error': '資料庫尚無任何資料'}, status=404)
+
+    if year is not None and month is not None:
+        qs = screen(year, month, **criteria)
+    else:
+        qs = export_queryset(year, month)
+    ids = [s for s in params.get('ids', '').replace(' ', '').split(',') if s]
+    if ids:
+        qs = qs.filter(stock_id__in=ids)
+
+    streamer, content_type = STREAMERS[fmt]
+    stream = streamer(iter_row_chunks(qs, sim_params))
+    if isinstance(request, ASGIRequest):
+        stream = aiter_stream(stream)
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    filename = f"stocks_{year or 'all'}_{month or 'all'}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# =========================================================
+# 自選清單：/watchlists/ 列表與新增；/watchlists/<id>/ 批次估值 (?format=json)
+# 估值由 stock_app.watchlists 預先計算，開啟清單只讀 WatchlistValuation
+# =========================================================
+def watchlists(request):
+    if request.method == 'POST':
+        name = request.POST.get('name', '').strip()[:50]
+        try:
+            if not name:
+                raise ValueError("請輸入清單名稱")
+            if Watchlist.objects.filter(name=name).exists():
+                raise ValueError(f"清單「{name}」已存在")
+            codes = parse_codes(request.POST.get('codes', ''))
+            with transaction.atomic():
+                wl = Watchlist.objects.create(name=name)
+                add_codes(wl, codes)
+        except ValueError as e:
+            messages.error(request, str(e))
+        else:
+            precompute(wl)
+            return redirect('watchlist_detail', wl.pk)
+    lists = Watchlist.objects.annotate(n_items=Count('items')).order_by('name')
+    return render(request, 'watchlists.html', {'watchlists': lists})
+
+
+def _watchlist_params(post):
+    """試算參數：yoy / net 以百分比輸入，空白表示沿用原始值。"""
+    params = {}
+    for name in SIM_PARAMS:
+        val = post.get(name, '').strip()
+        try:
+            num = float(val) if val else None
+        except ValueError:
+            raise ValueError("試算參數須為數字")
+        params[name] = num / 100 if num is not None and name in ('sim_yoy', 'sim_net') else num
+    return params
+
+
+def watchlist_detail(request, watchlist_id):
+    wl = get_object_or_404(Watchlist, pk=watchlist_id)
+    if request.method == 'POST':
+        action = request.POST.get('action', '')
+        try:
+            if action == 'add':
+                n = add_codes(wl, parse_codes(request.POST.get('codes', '')))
+                messages.success(request, f"已加入 {n} 檔。")
+            elif action == 'remove':
+                wl.items.filter(code=request.POST.get('code', '')).delete()
+            elif action == 'params':
+                for name, val in _watchlist_params(request.POST).items():
+                    setattr(wl, name, val)
+                wl.save(update_fields=list(SIM_PARAMS))
+            elif action == 'delete':
+                wl.delete()
+                messages.success(request, f"已刪除清單「{wl.name}」。")
+                return redirect('watchlists')
+            elif action != 'recompute':
+                raise ValueError("未知的操作")
+        except ValueError as e:
+            messages.error(request, str(e))
+        else:
+            # 只有手動重算時才即時抓價，其餘沿用已儲存的收盤價
+            live = action == 'recompute' and request.POST.get('live') == '1'
+            with metrics.stage('watchlist_value'):
+                n = precompute(wl, live=live)
+            if action == 'recompute':
+                messages.success(request, f"已重新估值 {n} 檔。")
+        return redirect('watchlist_detail', wl.pk)
+
+    sort = request.GET.get('sort', 'code')
+    if sort not in VALUATION_SORTS:
+        sort = 'code'
+    desc = request.GET.get('order') == 'desc'
+    with metrics.stage('watchlist_read'):
+        rows = stored_valuations(wl, sort, desc)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': wl.pk, 'name': wl.name, 'valued_at': wl.valued_at,
+            'params': {name: getattr(wl, name) for name in SIM_PARAMS},
+            'rows': rows,
+        })
+    return render(request, 'watchlist.html', {
+        'watchlist': wl, 'rows': rows, 'sort': sort, 'desc': desc,
+        'params': {
+            'sim_yoy': '' if wl.sim_yoy is None else round(wl.sim_yoy * 100, 4),
+            'sim_net': '' if wl.sim_net is None else round(wl.sim_net * 100, 4),
+            'sim_pe_h': '' if wl.sim_pe_h is None else wl.sim_pe_h,
+            'sim_pe_l': '' if wl.sim_pe_l is None else wl.sim_pe_l,
+        },
+        'sorts': [('code', '代碼'), ('upside', '上檔空間'), ('downside', '下檔空間'), ('rr', '風險報酬比'), ('eps', '模擬 EPS')],
+    })
+
+# =========================================================
+# 效能指標 (Prometheus 文字格式)：/metrics
+# 設定 METRICS_TOKEN 時需帶 ?token= 或 Authorization: Bearer <token>
+# =========================================================
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        given = request.GET.get('token') or (auth[len('Bearer '):] if auth.startswith('Bearer ') else auth).strip()
+        if given != token:
+            return HttpResponse("未授權", status=403, content_type='text/plain; charset=utf-8')
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'scrape': metrics.scrape_summary()})
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,171 @@
+import re
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.db.models.fields.json import KeyTransform
+from django.utils import timezone
+
+from .engine import COLUMN_FIELDS, build_universe, simulate
+from .models import StockData, Watchlist, WatchlistItem, WatchlistValuation
+from .pricing import get_price_service
+
+# =========================================================
+# 自選清單批次估值
+#   每檔取最新一份快照，以清單的試算參數一次向量化算出 EPS / 目標價 / 上下檔空間 / 風險報酬比，
+#   結果寫入 WatchlistValuation；開啟清單只讀這張表，不重新試算也不即時抓價。
+# 重算時機：匯入後 (只重算含有本批股票的清單)、清單內容變更後，或 precompute_watchlists 排程
+# =========================================================
+MAX_ITEMS = 200
+
+# 清單頁可用的排序 (None 排最後)
+VALUATION_SORTS = {
+    'code': 'code', 'upside': 'upside', 'rr': 'rr', 'eps': 'eps', 'downside': 'downside',
+}
+SIM_PARAMS = ('sim_yoy', 'sim_net', 'sim_pe_h', 'sim_pe_l')
+
+_SPLIT_RE = re.compile(r'[\s,，、;；]+')
+_CODE_RE = re.compile(r'^[0-9A-Za-z]{1,10}$')
+
+
+def parse_codes(text):
+    """'2330, 2317 2454' -> ['2330', '2317', '2454']；格式不符的代碼拋出 ValueError。"""
+    codes = [c for c in _SPLIT_RE.split(text or '') if c]
+    bad = [c for c in codes if not _CODE_RE.match(c)]
+    if bad:
+        raise ValueError(f"股票代碼格式錯誤：{', '.join(bad[:5])}")
+    return list(dict.fromkeys(c.upper() for c in codes))
+
+
+def add_codes(watchlist, codes):
+    """加入成員 (已存在的略過)，回傳新增檔數；超過 MAX_ITEMS 時拋出 ValueError。"""
+    existing = set(watchlist.items.values_list('code', flat=True))
+    new = [c for c in codes if c not in existing]
+    if len(existing) + len(new) > MAX_ITEMS:
+        raise ValueError(f"每個清單最多 {MAX_ITEMS} 檔")
+    WatchlistItem.objects.bulk_create(
+        [WatchlistItem(watchlist=watchlist, code=c) for c in new], ignore_conflicts=True)
+    return len(new)
+
+
+# ---------------------------------------------------------
+# 計算
+# ---------------------------------------------------------
+def latest_rows(codes):
+    """
+    每檔最新一份快照的 {代碼: (stock_name, 年, 月, *COLUMN_FIELDS 欄位, Now_Price)}。
+    只讀反正規化欄位與 normalized 的股價，不載入 raw_data。
+    """
+    qs = (
+        StockData.objects.filter(stock_id__in=codes)
+        .order_by('stock_id', '-data_year', '-data_month')
+        .annotate(num_price=KeyTransform('Now_Price', 'normalized'))
+        .values_list('stock_id', 'stock_name', 'data_year', 'data_month', *COLUMN_FIELDS.values(), 'num_price')
+    )
+    rows = {}
+    for row in qs:
+        rows.setdefault(row[0], row[1:])
+    return rows
+
+
+def _prices(codes, rows, live):
+    """
+    回傳 {代碼: (價格, 來源, 日期)}。
+    live=True 時即時抓價 (失敗時 PriceService 自動改用最後收盤價)；
+    否則只用已儲存的收盤價。兩者皆無時退回上傳檔內的 Now_Price。
+    """
+    service = get_price_service()
+    out = {}
+    if live:
+        for code, q in service.get_quotes(codes).items():
+            if q['price'] is not None:
+                out[code] = (q['price'], q['source'], q['as_of'])
+    else:
+        for code, (price, as_of, source) in service.last_closes(codes).items():
+            out[code] = (price, source, as_of)
+    for code in codes:
+        if code not in out and code in rows and rows[code][-1] is not None:
+            out[code] = (rows[code][-1], 'upload', None)
+    return out
+
+
+def _num(val, ndigits=4):
+    val = float(val)
+    return round(val, ndigits) if np.isfinite(val) else None
+
+
+def value_watchlist(watchlist, live=False, now=None):
+    """回傳未儲存的 [WatchlistValuation, ...]；查無資料的代碼只帶代碼 (其餘欄位為空)。"""
+    now = now or timezone.now()
+    codes = list(watchlist.items.values_list('code', flat=True))
+    rows = latest_rows(codes)
+    found = [c for c in codes if c in rows]
+    prices = _prices(found, rows, live) if found else {}
+
+    valuations = [
+        WatchlistValuation(watchlist=watchlist, code=c, computed_at=now) for c in codes if c not in rows
+    ]
+    if not found:
+        return valuations
+
+    n_cols = len(COLUMN_FIELDS)
+    universe = build_universe([(c, rows[c][0], *rows[c][3:3 + n_cols]) for c in found])
+    price_arr = np.array([prices[c][0] if c in prices else np.nan for c in found], dtype=float)
+    res = simulate(
+        universe, yoy=watchlist.sim_yoy, net=watchlist.sim_net,
+        pe_h=watchlist.sim_pe_h, pe_l=watchlist.sim_pe_l, prices=price_arr,
+    )
+    for i, code in enumerate(found):
+        name, year, month = rows[code][:3]
+        price, source, as_of = prices.get(code, (None, '', None))
+        valuations.append(WatchlistValuation(
+            watchlist=watchlist, code=code, stock_name=name, data_year=year, data_month=month,
+            price=price, price_source=source or '', price_as_of=as_of,
+            eps=_num(res['eps'][i], 2), target_h=_num(res['target_h'][i], 2), target_l=_num(res['target_l'][i], 2),
+            upside=_num(res['upside'][i]), downside=_num(res['downside'][i]), rr=_num(res['rr'][i], 2),
+            computed_at=now,
+        ))
+    return valuations
+
+
+def precompute(watchlist, live=False):
+    """重算並取代這個清單的估值，回傳檔數。"""
+    now = timezone.now()
+    valuations = value_watchlist(watchlist, live, now)
+    with transaction.atomic():
+        WatchlistValuation.objects.filter(watchlist=watchlist).delete()
+        WatchlistValuation.objects.bulk_create(valuations)
+        Watchlist.objects.filter(pk=watchlist.pk).update(valued_at=now)
+    watchlist.valued_at = now
+    return len(valuations)
+
+
+def precompute_watchlists(watchlists=None, live=False, on_each=None):
+    """watchlists 為 None 時重算全部；回傳 {清單名稱: 檔數}。on_each() 在每個清單算完後呼叫。"""
+    if watchlists is None:
+        watchlists = Watchlist.objects.all()
+    results = {}
+    for wl in watchlists:
+        results[wl.name] = precompute(wl, live)
+        if on_each:
+            on_each()
+    return results
+
+
+def refresh_for_codes(codes, on_each=None):
+    """匯入後呼叫：只重算含有這些股票的清單 (不即時抓價)，回傳重算的清單數。"""
+    ids = WatchlistItem.objects.filter(code__in=set(codes)).order_by().values_list('watchlist_id', flat=True).distinct()
+    watchlists = list(Watchlist.objects.filter(pk__in=ids))
+    if not watchlists:
+        return 0
+    return len(precompute_watchlists(watchlists, on_each=on_each))
+
+
+def stored_valuations(watchlist, sort='code', desc=False):
+    """開啟清單時的唯一查詢：依 watchlist 外鍵索引讀出預先算好的估值。"""
+    field = VALUATION_SORTS.get(sort, 'code')
+    order = F(field).desc(nulls_last=True) if desc else F(field).asc(nulls_last=True)
+    return list(WatchlistValuation.objects.filter(watchlist=watchlist).order_by(order, 'code').values(
+        'code', 'stock_name', 'data_year', 'data_month', 'price', 'price_source', 'price_as_of',
+        'eps', 'target_h', 'target_l', 'upside', 'downside', 'rr', 'computed_at',
+    ))